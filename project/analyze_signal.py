@@ -1,61 +1,220 @@
+import os
+import argparse
+from functools import lru_cache
+from concurrent.futures import ProcessPoolExecutor
 import cv2
+import h5py
 import numpy as np
-import os
+from scipy import fft as sp_fft
 
-def get_signal_stats(img_path):
-    img = cv2.imread(img_path)
+# Longest side of the gray image the spectrum is computed on
+FFT_MAX_SIDE = 256
+# Normalized radius (1.0 = Nyquist) above which spectral power counts as high-frequency
+HF_RADIUS = 0.5
+# Laplacian-variance cutoffs of the service's hybrid rule (apply_hybrid_logic)
+LAPLACIAN_CUTOFFS = [100, 350]
+PERCENTILES = [1, 5, 10, 25, 50, 75, 90, 95, 99]
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png")
+# Per-file columns written to the output file, in order
+COLUMNS = [("lap_var", np.float64), ("fft_mean_power", np.float32), ("hf_ratio", np.float32),
+           ("width", np.int32), ("height", np.int32)]
+# Rows buffered before they are appended to the output file
+WRITE_CHUNK = 4096
+
+@lru_cache(maxsize=16)
+def _spectrum_layout(h, w):
+    """
+    Column weights that turn rfft2 sums into full-spectrum sums (the omitted
+    half is the mirror image), and the high-frequency mask, for an h x w image.
+    """
+    weights = np.full(w // 2 + 1, 2.0, dtype=np.float32)
+    weights[0] = 1.0
+    if w % 2 == 0:
+        weights[-1] = 1.0
+    fy = np.fft.fftfreq(h)[:, None] / 0.5
+    fx = np.fft.rfftfreq(w)[None, :] / 0.5
+    high = np.sqrt(fy ** 2 + fx ** 2) > HF_RADIUS
+    return weights, high
+
+def spectrum_stats(gray):
+    """
+    (mean log-magnitude, high-frequency power ratio) of a gray image, from a
+    float32 real-input FFT (scipy.fft, as in the feature path; np.fft computes
+    in float64). The mean equals the mean of the full fft2 magnitude spectrum
+    (20 * log), which fftshift does not change.
+    """
+    h, w = gray.shape
+    spectrum = sp_fft.rfft2(gray.astype(np.float32), overwrite_x=True)
+    magnitude = np.abs(spectrum)
+    weights, high = _spectrum_layout(h, w)
+
+    mean_power = float((20 * np.log(magnitude + 1e-7)).sum(axis=0) @ weights / (h * w))
+    power = magnitude * magnitude
+    power[0, 0] = 0.0  # DC is brightness, not texture
+    total = float(power.sum(axis=0) @ weights)
+    hf = float(np.where(high, power, 0.0).sum(axis=0) @ weights)
+    return mean_power, hf / total if total > 0 else 0.0
+
+def signal_stats(img_path, fft_max_side=FFT_MAX_SIDE):
+    """
+    (lap_var, fft_mean_power, hf_ratio, width, height) of an image file, or
+    None if it cannot be read. The Laplacian variance is computed on the
+    full-resolution gray image exactly like the service (colour decode, then
+    BGR -> RGB -> gray); the spectrum on a copy area-downscaled to at most
+    fft_max_side.
+    """
+    img = cv2.imread(img_path, cv2.IMREAD_COLOR)
     if img is None:
         return None
-    
+    img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+    gray = cv2.cvtColor(img, cv2.COLOR_RGB2GRAY)
+
     # 1. Laplacian Variance (Sharpness/Noise)
-    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
     lap_var = cv2.Laplacian(gray, cv2.CV_64F).var()
-    
+
     # 2. FFT Power (High Frequency Content)
-    f = np.fft.fft2(gray)
-    fshift = np.fft.fftshift(f)
-    magnitude_spectrum = 20 * np.log(np.abs(fshift) + 1e-7)
-    mean_spectrum = np.mean(magnitude_spectrum)
-    
+    h, w = gray.shape
+    scale = fft_max_side / max(h, w)
+    small = gray
+    if scale < 1.0:
+        small = cv2.resize(gray, (max(1, round(w * scale)), max(1, round(h * scale))), interpolation=cv2.INTER_AREA)
+    mean_power, hf_ratio = spectrum_stats(small)
+    return lap_var, mean_power, hf_ratio, w, h
+
+def get_signal_stats(img_path):
+    stats = signal_stats(img_path)
+    if stats is None:
+        return None
     return {
-        "Laplacian Var": lap_var,
-        "Mean FFT Power": mean_spectrum
+        "Laplacian Var": stats[0],
+        "Mean FFT Power": stats[1]
     }
 
-def analyze():
-    base_path = os.getcwd()
-    
-    # User's Failed AI Image
-    fake_img = "debug_image.jpg"
-    
-    # Known Real Image
-    real_img = r"c:\Users\punam\Downloads\archive (5)\real_vs_fake\real-vs-fake\test\real\00001.jpg"
-    
-    print(f"--- ANALYZING SIGNAL STATS ---")
-    
-    real_dir = r"c:\Users\punam\Downloads\archive (5)\real_vs_fake\real-vs-fake\test\real"
-    print(f"\n--- SCANNING REAL IMAGES for LOW VARIANCE ---")
-    
-    low_var_count = 0
-    total = 0
-    min_var = 10000
-    
-    import glob
-    files = glob.glob(os.path.join(real_dir, "*.jpg"))[:2000] # Check first 2000
-    
-    for f in files:
-        stats = get_signal_stats(f)
-        if stats:
-            v = stats['Laplacian Var']
-            min_var = min(min_var, v)
-            if v < 100:
-                print(f"[WARNING] Low Var Real: {v:.2f} - {os.path.basename(f)}")
-                low_var_count += 1
-            total += 1
-            
-    print(f"Scanned {total} Real images.")
-    print(f"Min Variance Found: {min_var:.2f}")
-    print(f"Images below 100: {low_var_count}")
+def _init_worker():
+    # One OpenCV thread per process; the pool provides the parallelism
+    cv2.setNumThreads(1)
+
+def _scan_file(path):
+    return path, signal_stats(path)
+
+def list_images(directory, limit=None):
+    """
+    (path, class) for every image under directory. The class is the name of
+    the top-level subdirectory (e.g. real/fake), or "" for files at the root.
+    """
+    files = []
+    for root, dirs, names in os.walk(directory):
+        dirs.sort()
+        rel = os.path.relpath(root, directory)
+        label = "" if rel == "." else rel.split(os.sep)[0]
+        for name in sorted(names):
+            if name.lower().endswith(IMAGE_EXTENSIONS):
+                files.append((os.path.join(root, name), label))
+                if limit and len(files) >= limit:
+                    return files
+    return files
+
+class ColumnWriter:
+    """
+    Appends rows to one resizable HDF5 dataset per column, WRITE_CHUNK rows at a time.
+    """
+    def __init__(self, f):
+        self.f = f
+        self.rows = 0
+        self.buffer = []
+        string = h5py.string_dtype()
+        for name, dtype in [("path", string), ("label", string)] + COLUMNS:
+            f.create_dataset(name, shape=(0,), maxshape=(None,), dtype=dtype, chunks=(WRITE_CHUNK,))
+
+    def append(self, row):
+        self.buffer.append(row)
+        if len(self.buffer) >= WRITE_CHUNK:
+            self.flush()
+
+    def flush(self):
+        if not self.buffer:
+            return
+        n = len(self.buffer)
+        columns = list(zip(*self.buffer))
+        for (name, _), values in zip([("path", None), ("label", None)] + COLUMNS, columns):
+            dataset = self.f[name]
+            dataset.resize((self.rows + n,))
+            dataset[self.rows:] = values
+        self.rows += n
+        self.buffer = []
+
+def percentile_tables(f, columns=("lap_var", "fft_mean_power", "hf_ratio"), percentiles=PERCENTILES,
+                      cutoffs=LAPLACIAN_CUTOFFS):
+    """
+    Per-class percentiles of each column, plus the share of images below each
+    Laplacian cutoff. Each column is read once; classes are split with one sort.
+    """
+    labels = f["label"].asstr()[()]
+    order = np.argsort(labels, kind="stable")
+    classes, starts = np.unique(labels[order], return_index=True)
+    bounds = list(starts) + [len(labels)]
+
+    tables = {}
+    for name in columns:
+        values = f[name][()][order]
+        for i, label in enumerate(classes):
+            tables.setdefault(label, {"count": int(bounds[i + 1] - bounds[i])})
+            group = values[bounds[i]:bounds[i + 1]]
+            tables[label][name] = dict(zip(percentiles, np.percentile(group, percentiles).tolist()))
+            if name == "lap_var":
+                tables[label]["below"] = {c: float(np.mean(group < c)) for c in cutoffs}
+    return tables
+
+def scan(directory, output, workers=None, limit=None, chunksize=64):
+    """
+    Signal stats of every image under directory, computed on a process pool
+    and streamed to an HDF5 file with one dataset per column. Unreadable files
+    are skipped. Returns the per-class percentile tables (also stored in the file).
+    """
+    files = list_images(directory, limit)
+    labels = dict(files)
+    print(f"Scanning {len(files)} images under {directory} with {workers or os.cpu_count()} workers...")
+
+    skipped = 0
+    with h5py.File(output, "w") as f, \
+         ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as executor:
+        f.attrs["directory"] = os.path.abspath(directory)
+        f.attrs["fft_max_side"] = FFT_MAX_SIDE
+        writer = ColumnWriter(f)
+        for done, (path, stats) in enumerate(executor.map(_scan_file, [p for p, _ in files], chunksize=chunksize), 1):
+            if stats is None:
+                skipped += 1
+            else:
+                writer.append((path, labels[path]) + stats)
+            if done % 10000 == 0:
+                print(f"  {done}/{len(files)}")
+        writer.flush()
+
+        tables = percentile_tables(f)
+        group = f.create_group("percentiles")
+        group.attrs["percentiles"] = PERCENTILES
+        for label, table in tables.items():
+            for name in ("lap_var", "fft_mean_power", "hf_ratio"):
+                group.create_dataset(f"{label or 'root'}/{name}", data=[table[name][p] for p in PERCENTILES])
+
+    print(f"Wrote {writer.rows} rows to {output} ({skipped} unreadable files skipped)")
+    return tables
 
 if __name__ == "__main__":
-    analyze()
+    from data_loader import TEST_DIR
+
+    parser = argparse.ArgumentParser(description="Laplacian / spectrum statistics over an image corpus")
+    parser.add_argument("--dir", type=str, default=TEST_DIR, help="Corpus root; top-level subdirectories are the classes")
+    parser.add_argument("--output", type=str, default="signal_stats.h5")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: all cores)")
+    parser.add_argument("--limit", type=int, default=None, help="Scan at most this many files")
+    args = parser.parse_args()
+
+    tables = scan(args.dir, args.output, args.workers, args.limit)
+    for label, table in tables.items():
+        print(f"\n--- {label or '(root)'}: {table['count']} images ---")
+        print(f"{'percentile':>14} " + " ".join(f"{p:>9}" for p in PERCENTILES))
+        for name in ("lap_var", "fft_mean_power", "hf_ratio"):
+            print(f"{name:>14} " + " ".join(f"{table[name][p]:>9.3g}" for p in PERCENTILES))
+        print("  " + ", ".join(f"Var < {c}: {share:.2%}" for c, share in table["below"].items()))
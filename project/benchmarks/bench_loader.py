@@ -0,0 +1,72 @@
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from data_loader import load_dataset
+from packed_dataset import pack_split
+from synthetic import make_synthetic_corpus
+
+def bench_loader(root, worker_counts, use_face_detection=False, repeats=1, packed_dir=None):
+    """
+    Images/sec of load_dataset (feature and face-detection caches disabled, so
+    every repeat does the full work) for each worker count, reading the image
+    folders under root, or the shards under packed_dir.
+    """
+    results = []
+    for workers in worker_counts:
+        best = None
+        for _ in range(repeats):
+            start = time.perf_counter()
+            X, y = load_dataset("train", cache_dir=None, base_dir=root, workers=workers,
+                                use_face_detection=use_face_detection, detection_cache_dir=None,
+                                packed_dir=packed_dir)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        results.append({"workers": workers, "images": int(len(y)), "seconds": best,
+                        "images_per_sec": len(y) / best})
+    
+    base = results[0]["images_per_sec"]
+    for r in results:
+        r["speedup"] = r["images_per_sec"] / base
+    return results
+
+def default_worker_counts(max_workers):
+    counts = [1]
+    while counts[-1] * 2 <= max_workers:
+        counts.append(counts[-1] * 2)
+    if counts[-1] != max_workers:
+        counts.append(max_workers)
+    return counts
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark load_dataset scaling from 1 to N worker processes")
+    parser.add_argument("--images", type=int, default=1000, help="Synthetic images per class")
+    parser.add_argument("--max-workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--face-detection", action="store_true")
+    parser.add_argument("--corpus", type=str, default=None, help="Reuse/create the corpus here instead of a temp dir")
+    parser.add_argument("--packed", action="store_true", help="Pack the corpus first and read the shards")
+    parser.add_argument("--output", type=str, default=None, help="Write results as JSON")
+    args = parser.parse_args()
+    
+    root = args.corpus or os.path.join(tempfile.gettempdir(), "defake_bench_corpus")
+    make_synthetic_corpus(root, n_per_class=args.images)
+    packed_dir = None
+    if args.packed:
+        packed_dir = root + "_packed"
+        pack_split("train", packed_dir, use_face_detection=args.face_detection, base_dir=root)
+    
+    results = bench_loader(root, default_worker_counts(args.max_workers), args.face_detection,
+                           packed_dir=packed_dir)
+    
+    print(f"\n{'workers':>8} {'images/s':>10} {'speedup':>8}")
+    for r in results:
+        print(f"{r['workers']:>8} {r['images_per_sec']:>10.1f} {r['speedup']:>7.2f}x")
+    
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
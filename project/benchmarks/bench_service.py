@@ -0,0 +1,66 @@
+import os
+import sys
+import json
+import time
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'web-app', 'ml_service')))
+
+from synthetic import encode_jpeg
+from bench_stages import latency_stats
+
+def bench_service(concurrency_levels=(1, 4, 16), n_requests=200, upload_size=(512, 512), cache=False):
+    """
+    Requests/sec and latency percentiles of POST /predict for each concurrency
+    level, driven through an in-process TestClient (no network, real app:
+    startup event, executor, micro-batcher). Every request uploads a distinct
+    image so the prediction cache is not measured unless cache=True.
+    """
+    if not cache:
+        os.environ["ML_CACHE_SIZE"] = "0"
+    from fastapi.testclient import TestClient
+    import main
+
+    uploads = [encode_jpeg(upload_size, smooth=i % 2 == 1, seed=i) for i in range(n_requests)]
+
+    results = []
+    with TestClient(main.app) as client:
+        def post(contents):
+            start = time.perf_counter()
+            response = client.post("/predict", files={"file": ("upload.jpg", contents, "image/jpeg")})
+            elapsed = (time.perf_counter() - start) * 1000.0
+            return elapsed, response.status_code
+
+        # Warm up the executor, model and batcher
+        for contents in uploads[:4]:
+            post(contents)
+
+        for concurrency in concurrency_levels:
+            with ThreadPoolExecutor(max_workers=concurrency) as pool:
+                start = time.perf_counter()
+                calls = list(pool.map(post, uploads))
+                wall = time.perf_counter() - start
+            samples = [ms for ms, status in calls if status == 200]
+            results.append({"concurrency": concurrency, "requests": len(calls),
+                            "errors": sum(status != 200 for _, status in calls),
+                            "requests_per_sec": len(calls) / wall, **latency_stats(samples)})
+    return results
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load-test the ML service in process")
+    parser.add_argument("--requests", type=int, default=200, help="Requests per concurrency level")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--cache", action="store_true", help="Keep the prediction cache enabled")
+    parser.add_argument("--output", type=str, default=None, help="Write results as JSON")
+    args = parser.parse_args()
+
+    results = bench_service(args.concurrency, args.requests, cache=args.cache)
+    print(f"\n{'clients':>8} {'req/s':>8} {'p50 ms':>9} {'p99 ms':>9} {'errors':>7}")
+    for r in results:
+        p50, p99 = (f"{r[k]:>9.2f}" if r[k] is not None else f"{'-':>9}" for k in ("p50_ms", "p99_ms"))
+        print(f"{r['concurrency']:>8} {r['requests_per_sec']:>8.1f} {p50} {p99} {r['errors']:>7}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
@@ -0,0 +1,92 @@
+import os
+import sys
+import json
+import time
+import argparse
+import cv2
+import numpy as np
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import feature_extraction
+from feature_extraction import (FEATURE_BACKENDS, extract_hog_features, extract_lbp_features,
+                                extract_color_histogram, extract_texture_stats, extract_features)
+from model_registry import ModelRegistry
+from synthetic import encode_jpeg
+
+def latency_stats(samples_ms):
+    """
+    Summary of a list of per-call latencies in milliseconds. With no samples
+    (e.g. every request failed) the latencies are None.
+    """
+    samples = np.asarray(samples_ms, dtype=np.float64)
+    if samples.size == 0:
+        return {"calls": 0, "mean_ms": None, "p50_ms": None, "p99_ms": None}
+    return {"calls": int(samples.size), "mean_ms": float(samples.mean()),
+            "p50_ms": float(np.percentile(samples, 50)), "p99_ms": float(np.percentile(samples, 99))}
+
+def time_calls(fn, inputs, warmup=2):
+    """
+    Per-call latency (ms) of fn over each input in turn.
+    """
+    for x in inputs[:warmup]:
+        fn(x)
+    samples = []
+    for x in inputs:
+        start = time.perf_counter()
+        fn(x)
+        samples.append((time.perf_counter() - start) * 1000.0)
+    return samples
+
+def bench_stages(n_images=50, upload_size=(1024, 768), image_size=(128, 128), backends=FEATURE_BACKENDS):
+    """
+    Latency of each stage of the service pipeline on synthetic uploads:
+    decode, Laplacian, resize, every extract_* function (per backend), the
+    scaler and the booster (XGBoost and compiled predictor, batch 1 and 32).
+    """
+    uploads = [encode_jpeg(upload_size, smooth=i % 2 == 1, seed=i) for i in range(n_images)]
+    results = {}
+
+    decoded = [cv2.imdecode(np.frombuffer(b, np.uint8), cv2.IMREAD_COLOR) for b in uploads]
+    results["decode"] = time_calls(lambda b: cv2.imdecode(np.frombuffer(b, np.uint8), cv2.IMREAD_COLOR), uploads)
+    results["laplacian"] = time_calls(
+        lambda img: cv2.Laplacian(cv2.cvtColor(img, cv2.COLOR_BGR2GRAY), cv2.CV_64F).var(), decoded)
+    results["resize"] = time_calls(lambda img: cv2.resize(cv2.cvtColor(img, cv2.COLOR_BGR2RGB), image_size), decoded)
+    resized = [cv2.resize(cv2.cvtColor(img, cv2.COLOR_BGR2RGB), image_size) for img in decoded]
+
+    previous = feature_extraction.FEATURE_BACKEND
+    try:
+        for backend in backends:
+            feature_extraction.set_feature_backend(backend)
+            for fn in (extract_hog_features, extract_lbp_features, extract_color_histogram,
+                       extract_texture_stats, extract_features):
+                results[f"{fn.__name__}[{backend}]"] = time_calls(fn, resized)
+    finally:
+        feature_extraction.set_feature_backend(previous)
+
+    features = np.vstack([extract_features(img) for img in resized]).astype(np.float32)
+    for predictor in ("xgboost", "compiled"):
+        artifacts = ModelRegistry(predictor=predictor).get()
+        if predictor == "xgboost":
+            results["scaler[batch1]"] = time_calls(artifacts.scale, [features[i:i + 1] for i in range(len(features))])
+        for batch in (1, 32):
+            # Cycle through the images so any --images count fills a batch
+            rows = [features[np.arange(i, i + batch) % len(features)] for i in range(len(features))]
+            results[f"predict[{predictor},batch{batch}]"] = time_calls(artifacts.predict, rows)
+
+    return {stage: latency_stats(samples) for stage, samples in results.items()}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Per-stage latency of the inference pipeline")
+    parser.add_argument("--images", type=int, default=50, help="Synthetic uploads to time each stage on")
+    parser.add_argument("--output", type=str, default=None, help="Write results as JSON")
+    args = parser.parse_args()
+
+    stages = bench_stages(args.images)
+    print(f"{'stage':<44} {'mean ms':>9} {'p50 ms':>9} {'p99 ms':>9}")
+    for stage, s in stages.items():
+        print(f"{stage:<44} {s['mean_ms']:>9.3f} {s['p50_ms']:>9.3f} {s['p99_ms']:>9.3f}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(stages, f, indent=2)
@@ -0,0 +1,170 @@
+import os
+import sys
+import json
+import time
+import argparse
+import cv2
+import numpy as np
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'web-app', 'ml_service')))
+
+from decoding import decode_image, scaled_laplacian_threshold, FAST_DECODE_MAX_SIDE, LAPLACIAN_SCALE_EXPONENT
+
+# Hybrid-logic Laplacian thresholds in ml_service/main.py (apply_hybrid_logic)
+LAPLACIAN_THRESHOLDS = [100, 350]
+# Sizes of the synthetic set: 12, 6 and 3 MP, i.e. fast-decode factors 3.9, 2.9 and 2
+SYNTHETIC_SIZES = [(4032, 3024), (3000, 2000), (2048, 1536)]
+# Minimum share of images that must take the same Laplacian branch on both decodes
+MIN_AGREEMENT = 0.9
+
+def laplacian_variance(img):
+    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    return cv2.Laplacian(gray, cv2.CV_64F).var()
+
+def synthetic_photos(n=12, image_size=(4032, 3024), seed=0):
+    """
+    Large JPEGs (12 MP by default) ranging from sharp to very smooth. Texture is
+    drawn at a coarse scale and upsampled, so it behaves more like photo detail
+    than pixel noise does.
+    """
+    rng = np.random.default_rng(seed)
+    w, h = image_size
+    for i in range(n):
+        coarse = rng.integers(0, 256, (h // 4, w // 4, 3), dtype=np.uint8)
+        img = cv2.resize(coarse, (w, h), interpolation=cv2.INTER_CUBIC)
+        sigma = 0.3 + 6.0 * i / max(1, n - 1)
+        img = cv2.GaussianBlur(img, (0, 0), sigma)
+        grain = rng.normal(0, 2.0, img.shape)
+        img = np.clip(img + grain, 0, 255).astype(np.uint8)
+        yield f"synthetic_{i:02d}_sigma{sigma:.1f}.jpg", cv2.imencode(".jpg", img, [cv2.IMWRITE_JPEG_QUALITY, 92])[1].tobytes()
+
+def synthetic_set(n=12, sizes=SYNTHETIC_SIZES):
+    for image_size in sizes:
+        for name, contents in synthetic_photos(n, image_size):
+            yield f"{image_size[0]}x{image_size[1]}_{name}", contents
+
+def image_files(directory):
+    for name in sorted(os.listdir(directory)):
+        if name.lower().endswith((".jpg", ".jpeg", ".png")):
+            with open(os.path.join(directory, name), "rb") as f:
+                yield name, f.read()
+
+def calibrate(images, max_side=FAST_DECODE_MAX_SIDE):
+    """
+    Laplacian variance of each image on the full-resolution decode and on the
+    fast (reduced, bounded) decode, with decode+Laplacian timings for both.
+    """
+    rows = []
+    for name, contents in images:
+        start = time.perf_counter()
+        full, _ = decode_image(contents, fast=False)
+        full_var = laplacian_variance(full)
+        full_ms = (time.perf_counter() - start) * 1000.0
+
+        start = time.perf_counter()
+        fast, factor = decode_image(contents, fast=True, max_side=max_side)
+        fast_var = laplacian_variance(fast)
+        fast_ms = (time.perf_counter() - start) * 1000.0
+
+        rows.append({
+            "image": name,
+            "full_size": list(full.shape[1::-1]),
+            "fast_size": list(fast.shape[1::-1]),
+            "factor": factor,
+            "full_var": full_var,
+            "fast_var": fast_var,
+            "ratio": fast_var / full_var if full_var > 0 else float("nan"),
+            "full_ms": full_ms,
+            "fast_ms": fast_ms
+        })
+    return rows
+
+def shifted_thresholds(rows, thresholds=LAPLACIAN_THRESHOLDS):
+    """
+    Fast-decode equivalents of the full-resolution thresholds: each threshold
+    mapped through the median fast/full variance ratio of the nearby images,
+    plus how often the two decodes fall on the same side of it.
+    """
+    full = np.array([r["full_var"] for r in rows])
+    fast = np.array([r["fast_var"] for r in rows])
+    ratios = fast / np.maximum(full, 1e-12)
+
+    result = []
+    for t in thresholds:
+        # Ratio depends on image content, so use images around the threshold
+        near = np.argsort(np.abs(np.log(np.maximum(full, 1e-12) / t)))[:max(3, len(rows) // 3)]
+        ratio = float(np.median(ratios[near]))
+        agree = float(np.mean((full < t) == (fast < t)))
+        agree_shifted = float(np.mean((full < t) == (fast < t * ratio)))
+        result.append({"threshold": t, "median_ratio": ratio, "shifted_threshold": t * ratio,
+                       "agreement_unchanged": agree, "agreement_shifted": agree_shifted})
+    return result
+
+def fit_exponent(rows, thresholds=LAPLACIAN_THRESHOLDS):
+    """
+    Exponent k of the fast/full variance ratio ~ factor**k, as the median over
+    the reduced images whose full-resolution variance is within 4x of a threshold.
+    """
+    ks = [np.log(r["ratio"]) / np.log(r["factor"]) for r in rows
+          if r["factor"] > 1.0 and r["full_var"] > 0 and
+          min(abs(np.log(r["full_var"] / t)) for t in thresholds) < np.log(4)]
+    return float(np.median(ks)) if ks else float("nan")
+
+def laplacian_branch(var, thresholds):
+    # 0 = absolute fake, 1 = smooth (suspicious if the model agrees), 2 = model decides
+    return int(np.searchsorted(thresholds, var, side="right"))
+
+def branch_agreement(rows, exponent=LAPLACIAN_SCALE_EXPONENT, thresholds=LAPLACIAN_THRESHOLDS):
+    """
+    Share of images whose fast-decode variance, compared with the thresholds
+    scaled by factor**exponent (as the service does), lands in the same
+    Laplacian branch as the full-resolution variance with the fixed thresholds.
+    """
+    same = []
+    for r in rows:
+        scaled = [scaled_laplacian_threshold(t, r["factor"], exponent) for t in thresholds]
+        same.append(laplacian_branch(r["full_var"], thresholds) == laplacian_branch(r["fast_var"], scaled))
+    return float(np.mean(same))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure how fast decode shifts the Laplacian-variance thresholds")
+    parser.add_argument("--dir", type=str, default=None, help="Directory of sample images (default: synthetic 12 MP JPEGs)")
+    parser.add_argument("--max-side", type=int, default=FAST_DECODE_MAX_SIDE)
+    parser.add_argument("--exponent", type=float, default=LAPLACIAN_SCALE_EXPONENT,
+                        help="Threshold scaling exponent to check (default: decoding.LAPLACIAN_SCALE_EXPONENT)")
+    parser.add_argument("--min-agreement", type=float, default=MIN_AGREEMENT,
+                        help="Fail unless at least this share of images takes the same branch on both decodes")
+    parser.add_argument("--output", type=str, default=None, help="Write results as JSON")
+    args = parser.parse_args()
+
+    images = image_files(args.dir) if args.dir else synthetic_set()
+    rows = calibrate(images, args.max_side)
+
+    print(f"{'image':<28} {'factor':>6} {'full var':>10} {'fast var':>10} {'ratio':>6} {'full ms':>8} {'fast ms':>8}")
+    for r in rows:
+        print(f"{r['image'][:28]:<28} {r['factor']:>6.2f} {r['full_var']:>10.1f} {r['fast_var']:>10.1f} "
+              f"{r['ratio']:>6.2f} {r['full_ms']:>8.1f} {r['fast_ms']:>8.1f}")
+
+    shifts = shifted_thresholds(rows)
+    print("\nThreshold shift under fast decode:")
+    for s in shifts:
+        print(f"  Var < {s['threshold']}: median ratio {s['median_ratio']:.2f} -> use {s['shifted_threshold']:.1f} "
+              f"(same branch {s['agreement_unchanged']:.0%} unchanged, {s['agreement_shifted']:.0%} shifted)")
+
+    exponent = fit_exponent(rows)
+    unscaled = branch_agreement(rows, exponent=0.0)
+    agreement = branch_agreement(rows, args.exponent)
+    print(f"\nFitted exponent: ratio ~ factor**{exponent:.2f}")
+    print(f"Same Laplacian branch on both decodes: {unscaled:.0%} with fixed thresholds, "
+          f"{agreement:.0%} with thresholds scaled by factor**{args.exponent:.2f}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"images": rows, "thresholds": shifts, "fitted_exponent": exponent,
+                       "branch_agreement": agreement, "branch_agreement_unscaled": unscaled}, f, indent=2)
+
+    if not agreement >= args.min_agreement:
+        print(f"FAIL: branch agreement {agreement:.0%} is below {args.min_agreement:.0%}; "
+              f"set decoding.LAPLACIAN_SCALE_EXPONENT (or ML_LAPLACIAN_EXPONENT) to the fitted exponent "
+              f"or keep ML_FAST_DECODE off")
+        sys.exit(1)
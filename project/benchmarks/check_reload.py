@@ -0,0 +1,83 @@
+import os
+import sys
+import shutil
+import argparse
+import tempfile
+import h5py
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'web-app', 'ml_service')))
+
+from synthetic import encode_jpeg
+
+def swap_model(model_path, threshold):
+    """
+    Rewrite the model file in place with a different decision threshold, so
+    the registry sees a new version whose verdicts are distinguishable.
+    """
+    with h5py.File(model_path, 'a') as f:
+        f.attrs['best_threshold'] = threshold
+    st = os.stat(model_path)
+    os.utime(model_path, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000))
+
+def check_reload(model_dir, n_images=6):
+    """
+    Swap the model between preprocess_image and score_prepared and check that
+    every image is still scored by the artifacts its features came from:
+    a batch prepared on version 1 scores exactly like an undisturbed version 1
+    run, a batch mixing versions scores each image with its own set, and once
+    a set is no longer retained its images fail with StaleVersionError.
+    """
+    os.environ["ML_MODEL_PATH"] = os.path.join(model_dir, "face_real_vs_ai_model.h5")
+    os.environ["ML_SCALER_PATH"] = os.path.join(model_dir, "scaler.pkl")
+    import main
+    from model_registry import StaleVersionError
+
+    registry = main.registry
+    registry.reload()
+    v1 = registry.current.version
+    uploads = [encode_jpeg((256, 256), smooth=i % 2 == 1, seed=i) for i in range(n_images)]
+    reference_v1, _ = main.score_prepared([main.preprocess_image(c) for c in uploads])
+
+    # 1. Features extracted on v1, reload, then scored
+    prepared_v1 = [main.preprocess_image(c, v1) for c in uploads]
+    swap_model(os.environ["ML_MODEL_PATH"], 0.01)
+    assert registry.reload(), "the swapped model was not picked up"
+    v2 = registry.current.version
+    assert v2 != v1
+    scored, _ = main.score_prepared(prepared_v1)
+    assert scored == reference_v1, "a reload between preprocess and score changed v1 results"
+    print(f"v1 {v1} -> v2 {v2}: {len(scored)} images prepared on v1 scored on v1")
+
+    # 2. A batch mixing both versions (e.g. a micro-batch straddling the reload)
+    reference_v2, _ = main.score_prepared([main.preprocess_image(c) for c in uploads])
+    assert reference_v2 != reference_v1, "the swap should change the verdicts"
+    half = n_images // 2
+    mixed = prepared_v1[:half] + [main.preprocess_image(c, v2) for c in uploads[half:]]
+    scored, _ = main.score_prepared(mixed)
+    assert scored == reference_v1[:half] + reference_v2[half:], "a mixed batch was scored with one set"
+    print(f"mixed batch: {half} images on v1, {n_images - half} on v2")
+
+    # 3. Two reloads later v1 is gone: its images must fail, not fall back to v3
+    swap_model(os.environ["ML_MODEL_PATH"], 0.99)
+    registry.reload()
+    scored, _ = main.score_prepared(prepared_v1)
+    assert all(isinstance(r, StaleVersionError) for r in scored), scored
+    try:
+        main.preprocess_image(uploads[0], v1)
+        raise AssertionError("preprocess_image accepted a version that is no longer loaded")
+    except StaleVersionError:
+        pass
+    print("after a second reload v1 is rejected with StaleVersionError")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check that /reload never mixes artifacts within a request")
+    parser.add_argument("--model-dir", type=str, default=os.path.join(os.path.dirname(__file__), '..', 'models'),
+                        help="Directory with face_real_vs_ai_model.h5 and scaler.pkl (copied, never modified)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for name in os.listdir(args.model_dir):
+            if name.startswith("face_real_vs_ai_model") or name == "scaler.pkl":
+                shutil.copy2(os.path.join(args.model_dir, name), tmp)
+        check_reload(tmp)
+    print("OK")
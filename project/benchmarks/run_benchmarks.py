@@ -0,0 +1,120 @@
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import subprocess
+import tempfile
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from synthetic import make_synthetic_corpus
+from bench_stages import bench_stages
+from bench_loader import bench_loader, default_worker_counts
+from bench_service import bench_service
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+
+# Metrics compared against a baseline, and whether higher is better
+TRACKED_METRICS = {"mean_ms": False, "p50_ms": False, "p99_ms": False,
+                   "images_per_sec": True, "requests_per_sec": True}
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True,
+                                       cwd=os.path.dirname(os.path.abspath(__file__)),
+                                       stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def environment():
+    import cv2
+    import numpy as np
+    import xgboost as xgb
+    import feature_extraction
+    return {"commit": git_commit(), "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(), "platform": platform.platform(),
+            "cpu_count": os.cpu_count(), "numpy": np.__version__, "opencv": cv2.__version__,
+            "xgboost": xgb.__version__, "feature_backend": feature_extraction.FEATURE_BACKEND}
+
+def flatten(results):
+    """
+    {"stages/decode/p50_ms": 4.9, "loader/workers=2/images_per_sec": 310.0, ...}
+    for the tracked metrics of a results document. Metrics without a value
+    (None, e.g. latencies of a level where every request failed) are left out.
+    """
+    flat = {}
+    for stage, stats in results.get("stages", {}).items():
+        for key, value in stats.items():
+            flat[f"stages/{stage}/{key}"] = value
+    for row in results.get("loader", []):
+        flat[f"loader/workers={row['workers']}/images_per_sec"] = row["images_per_sec"]
+    for row in results.get("service", []):
+        for key in ("requests_per_sec", "p50_ms", "p99_ms"):
+            flat[f"service/concurrency={row['concurrency']}/{key}"] = row[key]
+    return {k: v for k, v in flat.items() if k.rsplit("/", 1)[-1] in TRACKED_METRICS and v is not None}
+
+def compare(results, baseline, tolerance=0.10):
+    """
+    Relative change of every tracked metric present in both documents, and the
+    ones that got worse by more than `tolerance`.
+    """
+    current, previous = flatten(results), flatten(baseline)
+    changes, regressions = [], []
+    for key in sorted(current.keys() & previous.keys()):
+        if previous[key] == 0:
+            continue
+        change = current[key] / previous[key] - 1.0
+        worse = -change if TRACKED_METRICS[key.rsplit("/", 1)[-1]] else change
+        changes.append((key, previous[key], current[key], change))
+        if worse > tolerance:
+            regressions.append(key)
+    return changes, regressions
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the stage, loader and service benchmarks and save them as JSON")
+    parser.add_argument("--images", type=int, default=50, help="Synthetic uploads for the stage benchmark")
+    parser.add_argument("--loader-images", type=int, default=250, help="Synthetic images per class for the loader benchmark")
+    parser.add_argument("--max-workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--requests", type=int, default=200, help="Requests per concurrency level")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--skip", choices=["stages", "loader", "service"], nargs="*", default=[])
+    parser.add_argument("--output", type=str, default=None, help="Default: benchmarks/results/<commit>.json")
+    parser.add_argument("--baseline", type=str, default=None, help="Earlier results file to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="Relative slowdown reported as a regression")
+    args = parser.parse_args()
+
+    results = {"environment": environment()}
+
+    if "stages" not in args.skip:
+        print("Benchmarking pipeline stages...")
+        results["stages"] = bench_stages(args.images)
+
+    if "loader" not in args.skip:
+        print("Benchmarking load_dataset...")
+        root = os.path.join(tempfile.gettempdir(), "defake_bench_corpus")
+        make_synthetic_corpus(root, n_per_class=args.loader_images)
+        results["loader"] = bench_loader(root, default_worker_counts(args.max_workers))
+
+    if "service" not in args.skip:
+        print("Benchmarking the ML service...")
+        results["service"] = bench_service(args.concurrency, args.requests)
+
+    output = args.output or os.path.join(RESULTS_DIR, f"{results['environment']['commit'] or 'local'}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"\nResults written to {output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        changes, regressions = compare(results, baseline, args.tolerance)
+        print(f"\nAgainst {args.baseline} (commit {baseline.get('environment', {}).get('commit')}):")
+        for key, old, new, change in changes:
+            flag = "  <-- regression" if key in regressions else ""
+            print(f"  {key:<60} {old:>10.3f} -> {new:>10.3f} ({change:+.1%}){flag}")
+        if regressions:
+            print(f"{len(regressions)} metric(s) regressed by more than {args.tolerance:.0%}")
+            sys.exit(1)
@@ -0,0 +1,35 @@
+import os
+import cv2
+import numpy as np
+
+def make_synthetic_corpus(root, n_per_class=200, image_size=(256, 256), splits=("train",), seed=0):
+    """
+    Write a small real/fake JPEG corpus in the data_loader layout
+    (<root>/<split>/{real,fake}/*.jpg). "Real" images are sharp textured noise,
+    "fake" ones are blurred so they are smooth like many generated faces.
+    """
+    rng = np.random.default_rng(seed)
+    w, h = image_size
+    for split in splits:
+        for label, category in enumerate(["real", "fake"]):
+            out_dir = os.path.join(root, split, category)
+            os.makedirs(out_dir, exist_ok=True)
+            for i in range(n_per_class):
+                path = os.path.join(out_dir, f"{i:06d}.jpg")
+                if os.path.exists(path):
+                    continue
+                img = rng.integers(0, 256, (h, w, 3), dtype=np.uint8)
+                sigma = 0.5 + rng.random() + (3.0 if label else 0.0)
+                img = cv2.GaussianBlur(img, (0, 0), sigma)
+                cv2.imwrite(path, img)
+    return root
+
+def encode_jpeg(image_size=(256, 256), smooth=False, seed=0):
+    """
+    One synthetic JPEG as bytes (as an upload would arrive at the ML service).
+    """
+    rng = np.random.default_rng(seed)
+    w, h = image_size
+    img = rng.integers(0, 256, (h, w, 3), dtype=np.uint8)
+    img = cv2.GaussianBlur(img, (0, 0), 4.0 if smooth else 0.8)
+    return cv2.imencode(".jpg", img)[1].tobytes()
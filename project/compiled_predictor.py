@@ -0,0 +1,203 @@
+import os
+import json
+import hashlib
+import argparse
+import numpy as np
+
+# Objectives the flattened evaluator can reproduce: name -> margin transform
+OBJECTIVES = {
+    'binary:logistic': lambda margin: 1.0 / (1.0 + np.exp(-margin)),
+    'reg:squarederror': lambda margin: margin,
+    'binary:logitraw': lambda margin: margin
+}
+
+def compiled_path(model_path):
+    """
+    Where the exported predictor of a model file lives (next to it).
+    """
+    return os.path.splitext(model_path)[0] + ".trees.npz"
+
+def model_digest(model_bytes):
+    """
+    Identifies the booster an exported predictor was compiled from.
+    """
+    return hashlib.sha1(bytes(model_bytes)).hexdigest()
+
+class CompiledPredictor:
+    """
+    A gbtree booster flattened into NumPy arrays and evaluated for all rows and
+    all trees at once, one tree level per step.
+
+    Every node of every tree sits in one array; leaves point to themselves, so
+    after max_depth steps each (row, tree) cursor rests on its leaf and the
+    margin is a sum of leaf values. There is no DMatrix, no C++ call and no
+    per-call setup, which is what dominates Booster.predict on small batches.
+    Needs only NumPy to load and run.
+    """
+    def __init__(self, roots, left, right, feature, threshold, default_left, value,
+                 max_depth, base_margin, objective, num_feature, source=""):
+        self.roots = np.asarray(roots, dtype=np.int32)
+        self.left = np.asarray(left, dtype=np.int32)
+        self.right = np.asarray(right, dtype=np.int32)
+        self.feature = np.asarray(feature, dtype=np.int32)
+        self.threshold = np.asarray(threshold, dtype=np.float32)
+        self.default_left = np.asarray(default_left, dtype=bool)
+        self.value = np.asarray(value, dtype=np.float32)
+        self.max_depth = int(max_depth)
+        self.base_margin = float(base_margin)
+        self.objective = str(objective)
+        self.num_feature = int(num_feature)
+        self.source = str(source)
+        if self.objective not in OBJECTIVES:
+            raise ValueError(f"Unsupported objective for compiled prediction: {self.objective}")
+
+    @classmethod
+    def from_booster(cls, model):
+        """
+        Flatten an xgb.Booster (gbtree, one output, numerical splits).
+        """
+        model_bytes = model.save_raw()
+        learner = json.loads(model.save_raw("json"))["learner"]
+        booster = learner["gradient_booster"]
+        if booster["name"] != "gbtree":
+            raise ValueError(f"Only gbtree boosters can be compiled, got {booster['name']}")
+        params = learner["learner_model_param"]
+        if int(params.get("num_class", 0)) > 1 or int(params.get("num_target", 1)) > 1:
+            raise ValueError("Multi-output boosters are not supported")
+
+        roots, left, right, feature, threshold, default_left, value = [], [], [], [], [], [], []
+        max_depth, offset = 0, 0
+        for tree in booster["model"]["trees"]:
+            if any(tree["split_type"]):
+                raise ValueError("Categorical splits are not supported")
+            children_l = np.asarray(tree["left_children"], dtype=np.int64)
+            children_r = np.asarray(tree["right_children"], dtype=np.int64)
+            conditions = np.asarray(tree["split_conditions"], dtype=np.float32)
+            n = len(children_l)
+            is_leaf = children_l == -1
+            nodes = np.arange(n)
+
+            roots.append(offset)
+            # Leaves loop back to themselves; their split condition is the leaf value
+            left.append(np.where(is_leaf, nodes, children_l) + offset)
+            right.append(np.where(is_leaf, nodes, children_r) + offset)
+            feature.append(np.where(is_leaf, 0, tree["split_indices"]))
+            threshold.append(np.where(is_leaf, np.inf, conditions))
+            default_left.append(np.asarray(tree["default_left"], dtype=bool))
+            value.append(np.where(is_leaf, conditions, 0.0))
+
+            # Nodes are numbered parent-before-child, so one pass gives depths
+            depth = np.zeros(n, dtype=np.int64)
+            for i in range(n):
+                if not is_leaf[i]:
+                    depth[children_l[i]] = depth[children_r[i]] = depth[i] + 1
+            max_depth = max(max_depth, int(depth.max()))
+            offset += n
+
+        # base_score is stored as e.g. "[5E-1]" and in probability space for logistic
+        base_score = float(str(params["base_score"]).strip("[]"))
+        objective = learner["objective"]["name"]
+        base_margin = np.log(base_score / (1.0 - base_score)) if objective == "binary:logistic" else base_score
+
+        return cls(roots, np.concatenate(left), np.concatenate(right), np.concatenate(feature),
+                   np.concatenate(threshold), np.concatenate(default_left), np.concatenate(value),
+                   max_depth, base_margin, objective, int(params["num_feature"]),
+                   source=model_digest(model_bytes))
+
+    @property
+    def num_trees(self):
+        return len(self.roots)
+
+    def save(self, path):
+        np.savez(path, roots=self.roots, left=self.left, right=self.right, feature=self.feature,
+                 threshold=self.threshold, default_left=self.default_left, value=self.value,
+                 max_depth=self.max_depth, base_margin=self.base_margin, objective=self.objective,
+                 num_feature=self.num_feature, source=self.source)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls(data["roots"], data["left"], data["right"], data["feature"], data["threshold"],
+                       data["default_left"], data["value"], data["max_depth"], data["base_margin"],
+                       data["objective"][()], data["num_feature"], data["source"][()])
+
+    def predict_margin(self, X):
+        """
+        Raw margin for each row of an (N, num_feature) matrix. NaN means missing.
+        """
+        X = np.ascontiguousarray(X, dtype=np.float32)
+        if X.ndim != 2 or X.shape[1] != self.num_feature:
+            raise ValueError(f"Feature dimension mismatch: Expected {self.num_feature}, got {X.shape[-1]}")
+
+        flat = X.ravel()
+        # Flat offset of each row, broadcast against the (N, T) node cursors
+        row_offset = (np.arange(X.shape[0], dtype=np.int64) * self.num_feature)[:, None]
+        has_missing = np.isnan(flat).any()
+
+        nodes = np.broadcast_to(self.roots, (X.shape[0], self.num_trees))
+        for _ in range(self.max_depth):
+            x = flat[row_offset + self.feature[nodes]]
+            go_left = x < self.threshold[nodes]
+            if has_missing:
+                go_left |= np.isnan(x) & self.default_left[nodes]
+            nodes = np.where(go_left, self.left[nodes], self.right[nodes])
+
+        return self.value[nodes].sum(axis=1, dtype=np.float64) + self.base_margin
+
+    def predict(self, X):
+        """
+        Same output as Booster.predict / inplace_predict, as float32.
+        """
+        return OBJECTIVES[self.objective](self.predict_margin(X)).astype(np.float32)
+
+def export_model(model_path, output=None):
+    """
+    Compile the booster stored in a .h5 model file and save it next to it.
+    """
+    from model_registry import load_model_from_h5
+
+    model, _ = load_model_from_h5(model_path)
+    predictor = CompiledPredictor.from_booster(model)
+    output = output or compiled_path(model_path)
+    predictor.save(output)
+    print(f"Compiled predictor saved to {output} ({predictor.num_trees} trees, depth {predictor.max_depth})")
+    return predictor
+
+if __name__ == "__main__":
+    # Export, then parity and latency against the XGBoost predict paths
+    import time
+    import xgboost as xgb
+    from model_registry import DEFAULT_MODEL_PATH, load_model_from_h5
+
+    parser = argparse.ArgumentParser(description="Export a trained booster to a NumPy flattened-tree predictor")
+    parser.add_argument("--model", type=str, default=DEFAULT_MODEL_PATH)
+    parser.add_argument("--output", type=str, default=None, help="Default: <model>.trees.npz")
+    parser.add_argument("--repeats", type=int, default=50)
+    args = parser.parse_args()
+
+    export_model(args.model, args.output)
+    predictor = CompiledPredictor.load(args.output or compiled_path(args.model))
+    model, _ = load_model_from_h5(args.model)
+
+    rng = np.random.default_rng(0)
+    for n in (1, 32, 1024):
+        # Standardized features; some rows get missing values to exercise default_left
+        X = rng.standard_normal((n, predictor.num_feature)).astype(np.float32)
+        X[rng.random(X.shape) < 0.01] = np.nan
+
+        timings = {}
+        for name, fn in (("predict(DMatrix)", lambda: model.predict(xgb.DMatrix(X))),
+                         ("inplace_predict", lambda: model.inplace_predict(X)),
+                         ("compiled", lambda: predictor.predict(X))):
+            fn()
+            start = time.perf_counter()
+            for _ in range(args.repeats):
+                out = fn()
+            timings[name] = ((time.perf_counter() - start) / args.repeats * 1000, out)
+
+        ref = timings["predict(DMatrix)"][1]
+        diff = np.abs(timings["compiled"][1] - ref).max()
+        print(f"batch {n:>5}: max |diff| {diff:.2e} | " +
+              " | ".join(f"{name} {ms:.3f} ms" for name, (ms, _) in timings.items()))
+        if diff > 1e-5:
+            raise SystemExit(f"Parity check failed at batch {n}: max |diff| {diff:.2e}")
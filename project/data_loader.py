@@ -14,7 +14,13 @@ from concurrent.futures import ProcessPoolExecutor, as_completed
 import os
 import cv2
 import numpy as np
-from feature_extraction import extract_features
+import tempfile
+import time
+import feature_extraction
+from feature_extraction import extract_features, feature_dimension, set_feature_version
+from feature_cache import FeatureCache, DetectionCache, StaleEntriesError
+from feature_spec import FeatureSpec
+from packed_dataset import PackedDataset, packed_split_dir, parse_key, PACKED_SEP
 import random
 
 # Dataset paths
@@ -23,56 +29,279 @@ TRAIN_DIR = os.path.join(BASE_DIR, "train")
 VALID_DIR = os.path.join(BASE_DIR, "valid")
 TEST_DIR = os.path.join(BASE_DIR, "test")
 
+# Packed (sharded) copy of the dataset written by packed_dataset.py; when a split
+# has been packed there, load_dataset reads the shards instead of the image folders
+PACKED_DIR = os.environ.get("DEFAKE_PACKED_DIR")
+
+# Persistent feature cache (set cache_dir=None in load_dataset to disable)
+FEATURE_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache", "features")
+# Per-file face boxes (set detection_cache_dir=None in load_dataset to disable)
+DETECTION_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache", "detections")
+
+# Parallel loader tuning: OpenCV threads per worker process (the pool already
+# uses every core) and the largest number of images sent to a worker at once
+WORKER_CV2_THREADS = 1
+MAX_TASK_CHUNK = 256
+
+# Face detection runs on a copy whose longest side is at most this many pixels
+DETECT_MAX_SIDE = 640
+DETECT_SCALE_FACTOR = 1.1
+DETECT_MIN_NEIGHBORS = 4
+
+# Decoded full-resolution images held per face-detection batch in a worker
+DETECT_BATCH = 16
+
+# Cached "no face found" result (a known box is a 4-tuple; None means not yet detected)
+NO_FACE = ()
+
+# Per-process state set up once by the pool initializer
+_face_detector = None
+_output_path = None
+_output = None
+_packed_shards = {}
+
+class FaceDetector:
+    """
+    Haar-cascade face detector, meant to be created once per process.
+    Detection runs on a downscaled grayscale copy (longest side <= max_side) and
+    the boxes are mapped back to full-resolution coordinates.
+    """
+    def __init__(self, max_side=DETECT_MAX_SIDE, scale_factor=DETECT_SCALE_FACTOR,
+                 min_neighbors=DETECT_MIN_NEIGHBORS):
+        cascade_path = cv2.data.haarcascades + 'haarcascade_frontalface_default.xml'
+        self.cascade = cv2.CascadeClassifier(cascade_path)
+        self.max_side = max_side
+        self.scale_factor = scale_factor
+        self.min_neighbors = min_neighbors
+
+    def _small_gray(self, image):
+        # Grayscale copy bounded to max_side, and the factor it was scaled by
+        gray = cv2.cvtColor(image, cv2.COLOR_RGB2GRAY)
+        h, w = gray.shape
+        scale = min(1.0, self.max_side / max(h, w))
+        if scale < 1.0:
+            gray = cv2.resize(gray, (max(1, round(w * scale)), max(1, round(h * scale))),
+                              interpolation=cv2.INTER_AREA)
+        return gray, scale
+
+    def detect(self, image):
+        """
+        Largest face in an RGB image as (x, y, w, h) at full resolution, or None.
+        """
+        return self.detect_batch([image])[0]
+
+    def detect_batch(self, images):
+        """
+        detect() for a list of RGB images in one call: each is reduced to its
+        downscaled gray copy, then the cascade runs over the copies while the
+        full-resolution pixels are no longer touched.
+        """
+        boxes = []
+        for gray, scale in [self._small_gray(image) for image in images]:
+            faces = self.cascade.detectMultiScale(gray, self.scale_factor, self.min_neighbors)
+            if len(faces) == 0:
+                boxes.append(None)
+                continue
+            # Get the largest face
+            x, y, bw, bh = max(faces, key=lambda b: b[2] * b[3])
+            boxes.append(tuple(int(round(v / scale)) for v in (x, y, bw, bh)))
+        return boxes
+
+def crop_face(image, box):
+    """
+    Crop a (x, y, w, h) box with a 10% margin; returns the image unchanged for None.
+    """
+    if box is None:
+        return image
+    x, y, w, h = box
+    # Add a small margin
+    margin = int(0.1 * h)
+    y1 = max(0, y - margin)
+    y2 = min(image.shape[0], y + h + margin)
+    x1 = max(0, x - margin)
+    x2 = min(image.shape[1], x + w + margin)
+    return image[y1:y2, x1:x2]
+
+def get_face_detector():
+    """
+    The process-wide FaceDetector, loaded on first use.
+    """
+    global _face_detector
+    if _face_detector is None:
+        _face_detector = FaceDetector()
+    return _face_detector
+
+def detector_config():
+    """
+    Detector settings; its hash names the detection cache directory.
+    """
+    return {
+        "cascade": "haarcascade_frontalface_default.xml",
+        "max_side": DETECT_MAX_SIDE,
+        "scale_factor": DETECT_SCALE_FACTOR,
+        "min_neighbors": DETECT_MIN_NEIGHBORS
+    }
+
+def feature_config(image_size, use_face_detection):
+    """
+    Everything that determines the feature vector of an image file: the
+    FeatureSpec of this process plus the detector settings when cropping.
+    Its hash names the feature cache directory.
+    """
+    config = FeatureSpec.current(image_size, use_face_detection).to_dict()
+    if use_face_detection:
+        config["face_detector"] = detector_config()
+    return config
+
+def _init_worker(cv2_threads, use_face_detection, feature_version):
+    """
+    ProcessPoolExecutor initializer: configure OpenCV threading, use the
+    parent's feature layout and load the Haar cascade once per worker instead
+    of once per image.
+    """
+    cv2.setNumThreads(cv2_threads)
+    set_feature_version(feature_version)
+    if use_face_detection:
+        get_face_detector()
+
+def _attach_output(path):
+    """
+    Worker-side writable view of the shared output matrix (a memory-mapped .npy).
+    """
+    global _output_path, _output
+    if _output_path != path:
+        _output = np.load(path, mmap_mode="r+")
+        _output_path = path
+    return _output
+
+def make_executor(workers=None, use_face_detection=False):
+    """
+    Process pool for feature extraction, with the per-worker initializer.
+    """
+    return ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                               initargs=(WORKER_CV2_THREADS, use_face_detection, feature_extraction.FEATURE_VERSION))
+
 def detect_and_crop_face(image):
     """
     Detects face and crops it. Returns resized face or original if no face found.
     """
-    # Load Haar Cascade
-    cascade_path = cv2.data.haarcascades + 'haarcascade_frontalface_default.xml'
-    face_cascade = cv2.CascadeClassifier(cascade_path)
-    
-    gray = cv2.cvtColor(image, cv2.COLOR_RGB2GRAY)
-    faces = face_cascade.detectMultiScale(gray, 1.1, 4)
-    
-    if len(faces) > 0:
-        # Get the largest face
-        x, y, w, h = max(faces, key=lambda b: b[2] * b[3])
-        # Add a small margin
-        margin = int(0.1 * h)
-        y1 = max(0, y - margin)
-        y2 = min(image.shape[0], y + h + margin)
-        x1 = max(0, x - margin)
-        x2 = min(image.shape[1], x + w + margin)
-        return image[y1:y2, x1:x2]
-    return image
+    return crop_face(image, get_face_detector().detect(image))
 
-def process_single_image(args):
+def _load_preprocessed(args):
     """
-    Helper function for parallel processing.
+    Load, optionally face-crop and resize one image file.
+    args: (img_path, label, image_size, use_face_detection[, box]) where box is a
+    known face box, NO_FACE, or None to run the detector.
+    Returns (RGB image, box) or None on failure.
     """
-    img_path, label, image_size, use_face_detection = args
-    try:
-        img = cv2.imread(img_path)
-        if img is None:
-            return None
-        img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+    return _load_preprocessed_chunk([args])[0]
+
+def _load_preprocessed_chunk(tasks):
+    """
+    _load_preprocessed for a run of tasks. Images are decoded first and the
+    ones without a known box go through one FaceDetector.detect_batch call per
+    DETECT_BATCH images before they are cropped and resized.
+    Returns one (RGB image, box) or None per task. Packed row keys are read as
+    stored (already cropped and resized), with box None.
+    """
+    results = [None] * len(tasks)
+    for start in range(0, len(tasks), DETECT_BATCH):
+        decoded = {}
+        for i in range(start, min(start + DETECT_BATCH, len(tasks))):
+            img_path = tasks[i][0]
+            try:
+                if PACKED_SEP in img_path:
+                    results[i] = _packed_image(img_path), None
+                    continue
+                img = cv2.imread(img_path)
+                if img is not None:
+                    decoded[i] = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+            except Exception as e:
+                # print(f"Error processing {img_path}: {e}")
+                pass
         
-        # Face Detection & Cropping (Optional)
-        if use_face_detection:
-            img = detect_and_crop_face(img)
+        # Face Detection (Optional), batched over the images without a cached box
+        boxes = {i: tasks[i][4] if len(tasks[i]) > 4 else None for i in decoded}
+        detect = [i for i in decoded if tasks[i][3] and boxes[i] is None]
+        if detect:
+            try:
+                found = get_face_detector().detect_batch([decoded[i] for i in detect])
+            except Exception:
+                # Fall back to one image at a time so one bad image fails alone
+                found = []
+                for i in detect:
+                    try:
+                        found.append(get_face_detector().detect(decoded[i]))
+                    except Exception:
+                        found.append(None)
+                        del decoded[i]
+            for i, box in zip(detect, found):
+                boxes[i] = box or NO_FACE
         
-        img = cv2.resize(img, image_size)
+        for i, img in decoded.items():
+            image_size, use_face_detection = tasks[i][2:4]
+            try:
+                if use_face_detection:
+                    img = crop_face(img, boxes[i] or None)
+                results[i] = cv2.resize(img, image_size), boxes[i]
+            except Exception as e:
+                # print(f"Error processing {tasks[i][0]}: {e}")
+                pass
+    return results
+
+def _packed_image(key):
+    """
+    Worker-side read of one row of a packed shard (already cropped and resized).
+    Shards stay memory-mapped for the life of the worker.
+    """
+    path, row = parse_key(key)
+    if path not in _packed_shards:
+        _packed_shards[path] = np.load(path, mmap_mode="r")
+    return _packed_shards[path][row]
+
+def _process_image(args):
+    """
+    Load, optionally face-crop, resize and featurize one image.
+    args: (img_path, label, image_size, use_face_detection[, box]) where box is a
+    known face box, NO_FACE, or None to run the detector. img_path may also be
+    a packed row key ("<shard>::<row>"), whose image is used as stored.
+    Returns (features, label, box) or None on failure.
+    """
+    img_path, label = args[:2]
+    try:
+        if PACKED_SEP in img_path:
+            img, box = _packed_image(img_path), None
+        else:
+            loaded = _load_preprocessed(args)
+            if loaded is None:
+                return None
+            img, box = loaded
         features = extract_features(img)
-        return features, label
+        return features, label, box
     except Exception as e:
         # print(f"Error processing {img_path}: {e}")
         return None
 
-def load_dataset(split="train", image_size=(128, 128), max_samples=None, use_face_detection=True):
+def process_single_image(args):
+    """
+    Helper function for parallel processing.
+    """
+    result = _process_image(args)
+    if result is None:
+        return None
+    features, label, _ = result
+    return features, label
+
+def _split_tasks(split, image_size, max_samples, use_face_detection, base_dir=None):
     """
-    Load dataset using parallel processing.
+    Shuffled (path, label, image_size, use_face_detection) tasks for a split.
+    base_dir overrides the dataset root (BASE_DIR) for this call.
     """
-    if split == "train":
+    if base_dir is not None:
+        if split not in ("train", "valid", "test"):
+            raise ValueError("Invalid split")
+        data_dir = os.path.join(base_dir, split)
+    elif split == "train":
         data_dir = TRAIN_DIR
     elif split == "valid":
         data_dir = VALID_DIR
@@ -106,36 +335,296 @@ def load_dataset(split="train", image_size=(128, 128), max_samples=None, use_fac
         tasks = tasks[:max_samples]
         print(f"Limited to {max_samples} samples.")
     
-    print(f"Starting parallel feature extraction for {len(tasks)} images...")
+    return tasks
+
+def _packed_tasks(packed, image_size, max_samples):
+    """
+    (row key, label, image_size, False) tasks for a packed split, whole shards
+    in random order (rows within a shard are already shuffled). Consecutive
+    tasks are consecutive rows of a shard, so workers read shards sequentially.
+    """
+    tasks = []
+    for i in packed.shard_order():
+        labels = packed.labels(i)
+        tasks.extend((key, int(label), image_size, False) for key, label in zip(packed.keys(i), labels))
+        if max_samples and len(tasks) >= max_samples:
+            break
+    
+    if max_samples:
+        tasks = tasks[:max_samples]
+        print(f"Limited to {max_samples} samples.")
+    
+    return tasks
+
+def _dataset_tasks(split, image_size, max_samples, use_face_detection, base_dir=None, packed_dir=None):
+    """
+    Tasks for a split and the PackedDataset they come from (None for image folders).
+    """
+    split_dir = packed_split_dir(packed_dir or PACKED_DIR, split)
+    if split_dir is None:
+        return _split_tasks(split, image_size, max_samples, use_face_detection, base_dir), None
+    
+    packed = PackedDataset(split_dir)
+    packed.check(image_size, use_face_detection)
+    print(f"Reading packed {split} split from {split_dir} ({len(packed)} images, {len(packed.shards)} shards)...")
+    return _packed_tasks(packed, image_size, max_samples), packed
+
+def _process_chunk(out_path, start, tasks):
+    """
+    Worker side of the chunked loader: extract a run of tasks and write each
+    feature vector into row start + i of the shared output matrix. Only
+    (label, face box) pairs travel back over IPC; label is None for failures.
+    """
+    out = _attach_output(out_path)
+    results = []
+    for i, (task, loaded) in enumerate(zip(tasks, _load_preprocessed_chunk(tasks))):
+        try:
+            if loaded is None:
+                raise ValueError(f"Could not load {task[0]}")
+            img, box = loaded
+            out[start + i] = extract_features(img)
+        except Exception as e:
+            # print(f"Error processing {task[0]}: {e}")
+            results.append((None, None))
+            continue
+        results.append((task[1], box))
+    out.flush()
+    return results
+
+def _chunk_size(n_tasks, n_workers):
+    # About 8 chunks per worker keeps the pool balanced; capped to bound latency per chunk
+    return max(1, min(MAX_TASK_CHUNK, n_tasks // (n_workers * 8)))
+
+def _extract_into(executor, pending, out_path):
+    """
+    Run the pending tasks on the pool in chunks. Workers write features straight
+    into the memory-mapped .npy at out_path, row i for task i.
+    Returns per-task (label, face box); label is None where the image could not be processed.
+    """
+    n_workers = getattr(executor, "_max_workers", os.cpu_count() or 1)
+    chunk = _chunk_size(len(pending), n_workers)
+    futures = {
+        executor.submit(_process_chunk, out_path, start, pending[start:start + chunk]): start
+        for start in range(0, len(pending), chunk)
+    }
+    
+    results = [(None, None)] * len(pending)
+    count = 0
+    for future in as_completed(futures):
+        start = futures[future]
+        chunk_results = future.result()
+        results[start:start + len(chunk_results)] = chunk_results
+        count += len(chunk_results)
+        print(f"Processed {count}/{len(pending)} images...", end='\r')
+    
+    return results
+
+def _compact_rows(out, ok_rows):
+    """
+    Move the rows listed in ok_rows (ascending) to the front of out, in place.
+    """
+    for dst, src in enumerate(ok_rows):
+        if dst != src:
+            out[dst] = out[src]
+    return out[:len(ok_rows)]
+
+def _load_tasks(executor, tasks, image_size, cache, mmap_path=None, compact=False, detections=None,
+                return_paths=False):
+    """
+    Feature matrix and labels for `tasks`, extracting only what the cache is missing.
+    Known face boxes from `detections` are handed to the workers and new ones stored back.
+    With return_paths the image path of every row is returned as a third value.
+    """
+    dim = feature_dimension(image_size)
+    cached = []
+    pending = tasks
+    if cache is not None:
+        hits = cache.lookup([t[0] for t in tasks])
+        # Entries with segment -1 are files that failed before; skip them
+        cached = [h for h in hits if h is not None and h[2] >= 0]
+        pending = [t for t, h in zip(tasks, hits) if h is None]
+        print(f"Feature cache {cache.config_hash}: {len(tasks) - len(pending)} hits, {len(pending)} to extract.")
+    
+    if detections is not None and pending:
+        boxes = detections.lookup([t[0] for t in pending])
+        pending = [t[:4] + (box,) for t, box in zip(pending, boxes)]
+        print(f"Face detection cache: {sum(b is not None for b in boxes)}/{len(pending)} known.")
+    
+    print(f"Starting parallel feature extraction for {len(pending)} images...")
     
-    X_list = []
-    y_list = []
+    # Rows are written by the workers straight into a memory-mapped .npy: a new
+    # cache segment, the caller's mmap_path, or a scratch file copied to RAM at the end
+    scratch_path = None
+    if cache is not None:
+        out = cache.allocate(len(pending), dim)
+        out_path = out.filename
+    else:
+        out_path = mmap_path
+        if not out_path:
+            fd, scratch_path = tempfile.mkstemp(suffix=".npy", dir="/dev/shm" if os.path.isdir("/dev/shm") else None)
+            os.close(fd)
+            out_path = scratch_path
+        out = np.lib.format.open_memmap(out_path, mode="w+", dtype=np.float32, shape=(len(pending), dim))
     
-    # Use max workers
-    with ProcessPoolExecutor() as executor:
-        # Submit all tasks
-        # We perform chunked mapping for better performance/progress tracking
-        # But map implies order validation which we don't strictly need, but zip is easy.
+    try:
+        results = _extract_into(executor, pending, out_path) if pending else []
+        labels = [lab for lab, _ in results]
+        ok_rows = [i for i, lab in enumerate(labels) if lab is not None]
         
-        # Using map
-        results = executor.map(process_single_image, tasks)
+        if detections is not None:
+            new_boxes = [(t[0], box) for t, (lab, box) in zip(pending, results)
+                         if lab is not None and t[4] is None]
+            if new_boxes:
+                detections.update(new_boxes)
         
-        count = 0
-        for result in results:
-            if result is not None:
-                feat, lab = result
-                X_list.append(feat)
-                y_list.append(lab)
-                count += 1
-                if count % 1000 == 0:
-                    print(f"Processed {count}/{len(tasks)} images...", end='\r')
-
-    print(f"\nCompleted loading {len(X_list)} samples for {split}.")
-    
-    X = np.array(X_list)
-    y = np.array(y_list)
+        ok_labels = [labels[i] for i in ok_rows]
+        
+        if cache is None:
+            X = _compact_rows(out, ok_rows)
+            if scratch_path:
+                X = np.array(X)
+            y = np.array(ok_labels, dtype=np.int64)
+            if return_paths:
+                return X, y, [pending[i][0] for i in ok_rows]
+            return X, y
+    except BaseException:
+        # Worker crash or interrupt: don't leave the half-written segment in the store
+        if cache is not None:
+            cache.release()
+        raise
+    finally:
+        if scratch_path:
+            del out
+            os.remove(scratch_path)
+    
+    # Register the new rows, then read everything back through the memory-mapped store
+    new_entries = cache.add([pending[i][0] for i in ok_rows], ok_labels, out, rows=ok_rows,
+                            failed=[pending[i][0] for i, lab in enumerate(labels) if lab is None])
+    entries = cached + new_entries
+    if compact and len(cache.index["segments"]) > 1 and len(entries) == len(cache.valid_entries()):
+        # The whole store was requested: merge segments so the next run maps it zero-copy
+        cache.compact()
+    
+    X, y, paths = _read_cached(cache, [t[0] for t in tasks], mmap_path, dim)
+    if return_paths:
+        return X, y, paths
     return X, y
 
+def _read_cached(cache, paths, mmap_path=None, dim=None):
+    """
+    Rows, labels and paths of the cached entries of `paths`, in storage order.
+    Unless the rows are a zero-copy slice of one segment, they are copied into
+    an on-disk memmap at mmap_path (if given) segment by segment, without
+    building the matrix in RAM first.
+    If another process compacts the store in between, the paths are looked up
+    again in its new index.
+    """
+    while True:
+        hits = cache.lookup(paths)
+        stored = sorted(((h, p) for p, h in zip(paths, hits) if h is not None and h[2] >= 0),
+                        key=lambda s: (s[0][2], s[0][3]))
+        entries = [h for h, _ in stored]
+        out = None
+        if mmap_path and not cache.is_contiguous(entries):
+            out = np.lib.format.open_memmap(mmap_path, mode="w+", dtype=np.float32, shape=(len(entries), dim))
+        try:
+            X, y = cache.read(entries, out=out)
+        except StaleEntriesError:
+            cache.refresh()
+            continue
+        return X, y, [p for _, p in stored]
+
+def _detection_cache(detection_cache_dir, use_face_detection):
+    if not (detection_cache_dir and use_face_detection):
+        return None
+    return DetectionCache(detection_cache_dir, detector_config())
+
+def load_dataset(split="train", image_size=(128, 128), max_samples=None, use_face_detection=True,
+                 cache_dir=FEATURE_CACHE_DIR, mmap_path=None, workers=None, base_dir=None,
+                 detection_cache_dir=DETECTION_CACHE_DIR, return_paths=False, packed_dir=None):
+    """
+    Load dataset using parallel processing.
+    Returns a float32 (N, D) matrix and int labels. Features are written straight
+    into a preallocated matrix (never a list of per-image arrays).
+    Feature vectors are reused from the on-disk cache in cache_dir and only new or
+    changed images are extracted; cached matrices are, when possible, zero-copy
+    memmaps. Pass cache_dir=None to always re-extract, and mmap_path to keep the
+    result in an on-disk .npy memmap instead of RAM.
+    Face boxes are cached per file in detection_cache_dir, so changing image_size
+    or the feature code does not rerun the detector.
+    workers sets the process count (default: all cores).
+    return_paths=True also returns the image path of every row.
+    If the split has been packed under packed_dir (default: PACKED_DIR) by
+    packed_dataset.py, images are read from its shards instead of the folders;
+    return_paths then gives the source files recorded when packing.
+    """
+    tasks, packed = _dataset_tasks(split, image_size, max_samples, use_face_detection, base_dir, packed_dir)
+    cache = FeatureCache(cache_dir, feature_config(image_size, use_face_detection)) if cache_dir else None
+    # Packed images are already cropped
+    detections = _detection_cache(detection_cache_dir, use_face_detection) if packed is None else None
+    
+    with make_executor(workers, use_face_detection and packed is None) as executor:
+        result = _load_tasks(executor, tasks, image_size, cache, mmap_path=mmap_path, compact=True,
+                             detections=detections, return_paths=return_paths)
+    if return_paths and packed is not None:
+        result = result[:2] + ([packed.source_path(key) for key in result[2]],)
+    
+    print(f"\nCompleted loading {len(result[1])} samples for {split}.")
+    return result
+
+def split_manifest(split, base_dir=None, packed_dir=None):
+    """
+    Sorted absolute paths of every image in a split right now (for a packed
+    split, the source files recorded when packing). train.py stores it with a
+    model as the set of images that existed when the model was trained.
+    """
+    split_dir = packed_split_dir(packed_dir or PACKED_DIR, split)
+    if split_dir is not None:
+        return sorted(p for shard in PackedDataset(split_dir).shards for p in shard["paths"])
+    tasks = _split_tasks(split, None, None, False, base_dir)
+    return sorted(os.path.abspath(t[0]) for t in tasks)
+
+def load_new_images(split, known=None, since=None, image_size=(128, 128), use_face_detection=True,
+                    cache_dir=FEATURE_CACHE_DIR, workers=None, base_dir=None,
+                    detection_cache_dir=DETECTION_CACHE_DIR, packed_dir=None):
+    """
+    Features of the images of a split that are new to a model: those missing
+    from `known`, the split_manifest recorded when it was trained. For models
+    without a manifest, images whose file was modified after `since` (a
+    time.time() value) count as new instead. Older images are neither read nor
+    extracted, so the cost grows with the new data only (plus one stat per file
+    without a manifest). New images are extracted through the feature cache.
+    Returns (X, y, paths) with the source path of every row.
+    """
+    if known is None and since is None:
+        raise ValueError("Either a training manifest (known) or a cutoff time (since) is needed")
+    tasks, packed = _dataset_tasks(split, image_size, None, use_face_detection, base_dir, packed_dir)
+    sources = [packed.source_path(t[0]) if packed is not None else os.path.abspath(t[0]) for t in tasks]
+    if known is not None:
+        new_tasks = [t for t, src in zip(tasks, sources) if src not in known]
+        print(f"{len(new_tasks)}/{len(tasks)} {split} images are not in the training manifest.")
+    else:
+        new_tasks = []
+        for t, src in zip(tasks, sources):
+            try:
+                if os.stat(src).st_mtime > since:
+                    new_tasks.append(t)
+            except OSError:
+                continue
+        print(f"{len(new_tasks)}/{len(tasks)} {split} images changed since "
+              f"{time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(since))}.")
+    cache = FeatureCache(cache_dir, feature_config(image_size, use_face_detection)) if cache_dir else None
+    detections = _detection_cache(detection_cache_dir, use_face_detection) if packed is None else None
+    
+    with make_executor(workers, use_face_detection and packed is None) as executor:
+        X, y, paths = _load_tasks(executor, new_tasks, image_size, cache, detections=detections,
+                                  return_paths=True)
+    if packed is not None:
+        paths = [packed.source_path(key) for key in paths]
+    else:
+        paths = [os.path.abspath(p) for p in paths]
+    return X, y, paths
+
 if __name__ == "__main__":
     # Test
     import time
@@ -1,10 +1,7 @@
 import os
 import cv2
-import pickle
 import numpy as np
-import xgboost as xgb
-import h5py
-from feature_extraction import extract_features
+from model_registry import get_registry
 
 def debug():
     # Paths
@@ -16,13 +13,12 @@ def debug():
     
     print(f"--- DEBUGGING {img_path} ---")
     
-    # 1. Load Scaler
-    with open(scaler_path, "rb") as f:
-        scaler = pickle.load(f)
+    # 1. Load Scaler (and model)
+    artifacts = get_registry(model_path, scaler_path).get()
     
     print("\n[Scaler Stats]")
-    print(f"Mean (first 10): {scaler.mean_[:10]}")
-    print(f"Scale (first 10): {scaler.scale_[:10]}")
+    print(f"Mean (first 10): {artifacts.mean[:10]}")
+    print(f"Scale (first 10): {1.0 / artifacts.inv_scale[:10]}")
     
     # 2. Extract Features
     image = cv2.imread(img_path)
@@ -31,10 +27,11 @@ def debug():
         return
 
     print("\n[Feature Extraction]")
-    # CRITICAL FIX: Resize to 128x128 to match training data
+    # Crop/resize exactly like training, as recorded in the model's feature spec
     image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
-    image = cv2.resize(image, (128, 128))
-    features = extract_features(image)
+    print(f"Feature spec: {artifacts.spec}")
+    image = artifacts.preprocess(image)
+    features = artifacts.extract_features(image)
     features_arr = np.array(features).reshape(1, -1)
     
     print(f"Raw Features Shape: {features_arr.shape}")
@@ -42,23 +39,16 @@ def debug():
     print(f"Raw Sample (first 10): {features_arr[0][:10]}")
     
     # 3. Transform
-    features_scaled = scaler.transform(features_arr)
+    features_scaled = artifacts.scale(features_arr)
     print("\n[Scaled Features]")
     print(f"Scaled Min: {features_scaled.min():.4f}, Max: {features_scaled.max():.4f}, Mean: {features_scaled.mean():.4f}")
     print(f"Scaled Sample (first 10): {features_scaled[0][:10]}")
     
-    # 4. Load Model
+    # 4. Predict
     print("\n[Model Prediction]")
-    with h5py.File(model_path, 'r') as f:
-        model_bytes = f['model_bytes'][()].tobytes()
-        if 'best_threshold' in f.attrs:
-            print(f"Model Threshold: {f.attrs['best_threshold']}")
+    print(f"Model Threshold: {artifacts.threshold}")
     
-    xgb_model = xgb.Booster()
-    xgb_model.load_model(bytearray(model_bytes))
-    
-    dtest = xgb.DMatrix(features_scaled)
-    prob = xgb_model.predict(dtest)[0]
+    prob = artifacts.model.inplace_predict(features_scaled)[0]
     print(f"Inference Probability (Fakeness): {prob:.6f}")
 
 if __name__ == "__main__":
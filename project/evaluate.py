@@ -1,20 +1,11 @@
-import xgboost as xgb
 import numpy as np
-import h5py
 import pickle
 import matplotlib.pyplot as plt
 from sklearn.metrics import accuracy_score, precision_score, recall_score, f1_score, confusion_matrix, roc_curve, auc, precision_recall_curve, ConfusionMatrixDisplay
 import os
 from data_loader import load_dataset
-
-def load_model_from_h5(path):
-    print(f"Loading model from {path}...")
-    with h5py.File(path, 'r') as f:
-        model_bytes = f['model_bytes'][()].tobytes()
-    
-    model = xgb.Booster()
-    model.load_model(bytearray(model_bytes))
-    return model
+from feature_extraction import set_feature_version
+from model_registry import get_registry, load_scaler_stats
 
 def plot_metrics(history_path):
     if not os.path.exists(history_path):
@@ -69,30 +60,26 @@ def evaluate():
         print("Model not found. Run train.py first.")
         return
 
-    model = load_model_from_h5(model_path)
-    
     # Load Scaler
-    if not os.path.exists(scaler_path):
+    if not os.path.exists(scaler_path) and load_scaler_stats(model_path) is None:
         print("Scaler not found. Run train.py first.")
         return
         
-    with open(scaler_path, "rb") as f:
-        scaler = pickle.load(f)
+    artifacts = get_registry(model_path, scaler_path).get()
     
-    # Load Test Data
+    # Load Test Data in the feature layout the model was trained on
+    set_feature_version(artifacts.feature_version)
     # Using 2000 for quick eval
     print("Loading test data (limit=2000)...")
-    X_test, y_test = load_dataset("test", max_samples=2000, use_face_detection=False)
-    
-    # Normalize features
-    print("Normalizing test features...")
-    X_test = scaler.transform(X_test)
-    
-    dtest = xgb.DMatrix(X_test)
+    X_test, y_test = load_dataset("test", image_size=artifacts.spec.image_size, max_samples=2000,
+                                  use_face_detection=artifacts.spec.use_face_detection)
+    # Compact models take only the columns in their feature mask
+    if artifacts.feature_mask is not None:
+        X_test = X_test[:, artifacts.feature_mask.indices]
     
-    # Predict
+    # Normalize features and predict (fused float32 path)
     print("Predicting...")
-    y_probs = model.predict(dtest)
+    y_probs = artifacts.predict(X_test)
     y_pred = (y_probs > 0.5).astype(int)
     
     # Metrics
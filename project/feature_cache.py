@@ -0,0 +1,389 @@
+import os
+import json
+import time
+import uuid
+import pickle
+import hashlib
+from contextlib import contextmanager
+import numpy as np
+from packed_dataset import PACKED_SEP
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+INDEX_FILE = "index.pkl"
+LOCK_FILE = "index.lock"
+# Rows gathered per copy when reading scattered rows (64 MB at D=2048)
+READ_CHUNK_ROWS = 8192
+
+def config_hash(config):
+    """
+    Stable short hash of a feature configuration dict.
+    """
+    payload = json.dumps(config, sort_keys=True, default=str).encode("utf-8")
+    return hashlib.sha1(payload).hexdigest()[:16]
+
+@contextmanager
+def locked(directory):
+    """
+    Exclusive lock on a cache directory, shared by every process using it.
+    Blocks until the lock is free.
+    """
+    with open(os.path.join(directory, LOCK_FILE), "a+") as f:
+        if fcntl is not None:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        else:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+class StaleEntriesError(KeyError):
+    """
+    Cache entries refer to segments another process has since compacted away;
+    look the paths up again after FeatureCache.refresh().
+    """
+
+def _load_index(directory, default):
+    index_path = os.path.join(directory, INDEX_FILE)
+    if not os.path.exists(index_path):
+        return default
+    with open(index_path, "rb") as f:
+        return pickle.load(f)
+
+class FeatureCache:
+    """
+    Persistent on-disk store of extracted feature vectors.
+
+    Entries are keyed by absolute file path and validated against the file's
+    mtime and size; the whole store lives in a directory named after the hash
+    of the feature configuration, so a change in preprocessing never reuses
+    stale vectors. Rows are written in append-only float32 .npy segments and
+    read back through memory maps.
+
+    Several processes may share a store (e.g. training and evaluation):
+    segment files get unique names, and every index update re-reads the index
+    under an exclusive lock and merges into it. Segment ids are never reused,
+    so an entry read before another process compacted the store cannot
+    silently point at the wrong rows (read() raises StaleEntriesError).
+
+    Layout:
+        <root>/<config_hash>/index.pkl                path -> (mtime_ns, size, segment, row, label, added_at)
+        <root>/<config_hash>/index.lock               inter-process lock for index updates
+        <root>/<config_hash>/seg_<pid>_<uuid>.npy     (n, D) float32 feature rows
+    """
+    def __init__(self, root, config):
+        self.config = config
+        self.config_hash = config_hash(config)
+        self.dir = os.path.join(root, self.config_hash)
+        os.makedirs(self.dir, exist_ok=True)
+        self._segments = {}
+        self._allocated = None
+        self.index = self._read_index()
+
+    def _read_index(self):
+        index = _load_index(self.dir, {"config": self.config, "entries": {}, "segments": {}, "next_segment": 0})
+        if isinstance(index["segments"], list):
+            # Stores written before segment ids were stable
+            index["segments"] = dict(enumerate(index["segments"]))
+            index["next_segment"] = len(index["segments"])
+        return index
+
+    def refresh(self):
+        """
+        Pick up index changes made by other processes.
+        """
+        self.index = self._read_index()
+        for seg_id in list(self._segments):
+            if seg_id not in self.index["segments"]:
+                del self._segments[seg_id]
+
+    def __len__(self):
+        return len(self.index["entries"])
+
+    def _key(self, path):
+        path = os.path.abspath(path)
+        try:
+            # A packed row ("<shard>::<row>") is validated by its shard file
+            st = os.stat(path.split(PACKED_SEP)[0])
+        except OSError:
+            return path, None
+        return path, (st.st_mtime_ns, st.st_size)
+
+    def lookup(self, paths):
+        """
+        For each path return its cache entry, or None if it is missing or the file changed.
+        Entries with segment -1 record files that previously failed to load.
+        """
+        found = []
+        entries = self.index["entries"]
+        for p in paths:
+            path, stamp = self._key(p)
+            entry = entries.get(path)
+            if entry is None or stamp is None or entry[:2] != stamp:
+                found.append(None)
+            else:
+                found.append(entry)
+        return found
+
+    def segment(self, seg_id):
+        """
+        Memory-mapped (read-only) view of one segment.
+        """
+        if seg_id not in self._segments:
+            info = self.index["segments"].get(seg_id)
+            try:
+                if info is None:
+                    raise FileNotFoundError(seg_id)
+                self._segments[seg_id] = np.load(os.path.join(self.dir, info["file"]), mmap_mode="r")
+            except FileNotFoundError:
+                raise StaleEntriesError(f"Segment {seg_id} of {self.dir} no longer exists") from None
+        return self._segments[seg_id]
+
+    @staticmethod
+    def _new_segment_file():
+        # Unique across processes sharing the store
+        return f"seg_{os.getpid()}_{uuid.uuid4().hex[:12]}.npy"
+
+    def allocate(self, n_rows, dim):
+        """
+        Create a new segment file as a writable float32 memmap so rows can be
+        written in place; pass (a leading slice of) it to add() to register the rows.
+        The file name is unique, so this needs no lock.
+        """
+        seg_file = self._new_segment_file()
+        out = np.lib.format.open_memmap(os.path.join(self.dir, seg_file), mode="w+",
+                                        dtype=np.float32, shape=(n_rows, dim))
+        self._allocated = seg_file
+        return out
+
+    def release(self):
+        """
+        Remove the segment reserved by allocate() if add() has not taken it,
+        e.g. when extraction into it was interrupted.
+        """
+        if self._allocated is None:
+            return
+        seg_file, self._allocated = self._allocated, None
+        try:
+            os.remove(os.path.join(self.dir, seg_file))
+        except FileNotFoundError:
+            pass
+
+    def add(self, paths, labels, features, failed=(), rows=None):
+        """
+        Append a new segment with the given rows and record them in the index.
+        `features` is either an array to save or rows already written into the
+        segment returned by allocate(); `rows` gives the segment row of each path
+        (default: 0..n-1).
+        `failed` lists paths that could not be processed so they are skipped next time.
+        Returns the new entries for the stored rows.
+        """
+        filename = getattr(features, "filename", None)
+        preallocated = self._allocated is not None and filename is not None and \
+            os.path.basename(filename) == self._allocated
+        seg_file = self._allocated if preallocated else self._new_segment_file()
+        if self._allocated is not None and not preallocated:
+            os.remove(os.path.join(self.dir, self._allocated))
+        self._allocated = None
+
+        if len(paths) > 0:
+            if preallocated:
+                features.flush()
+            else:
+                np.save(os.path.join(self.dir, seg_file), np.asarray(features, dtype=np.float32))
+        elif preallocated:
+            os.remove(os.path.join(self.dir, seg_file))
+
+        # Stat outside the lock; the index is re-read and merged under it
+        now = time.time()
+        keyed = [(row, self._key(p), label) for row, p, label in
+                 zip(range(len(paths)) if rows is None else rows, paths, labels)]
+        failed_keys = [self._key(p) for p in failed]
+
+        added = []
+        with locked(self.dir):
+            self.refresh()
+            entries = self.index["entries"]
+            if len(paths) > 0:
+                seg_id = self.index["next_segment"]
+                self.index["next_segment"] += 1
+                self.index["segments"][seg_id] = {"file": seg_file, "rows": len(paths), "created": now}
+                for row, (path, stamp), label in keyed:
+                    if stamp is not None:
+                        entries[path] = (stamp[0], stamp[1], seg_id, int(row), int(label), now)
+                        added.append(entries[path])
+
+            for path, stamp in failed_keys:
+                if stamp is not None:
+                    entries[path] = (stamp[0], stamp[1], -1, -1, -1, now)
+
+            self._save_index()
+        return added
+
+    def valid_entries(self):
+        """
+        All entries that hold a feature row, in storage order.
+        """
+        entries = [e for e in self.index["entries"].values() if e[2] >= 0]
+        return sorted(entries, key=lambda e: (e[2], e[3]))
+
+    def compact(self):
+        """
+        Rewrite all rows into a single segment (in storage order) so that reading
+        the whole store is a zero-copy memmap slice again. Runs under the lock
+        on the latest index.
+        """
+        with locked(self.dir):
+            self.refresh()
+            if len(self.index["segments"]) <= 1:
+                return
+            valid = self.valid_entries()
+            old_files = [info["file"] for info in self.index["segments"].values()]
+
+            # Stream the rows segment by segment into the new file; entries are
+            # renumbered in the same order read() writes the rows
+            seg_file = self._new_segment_file()
+            dim = self.segment(valid[0][2]).shape[1] if valid else 0
+            X = np.lib.format.open_memmap(os.path.join(self.dir, seg_file), mode="w+",
+                                          dtype=np.float32, shape=(len(valid), dim))
+            self.read(valid, out=X)
+            X.flush()
+            del X
+            seg_id = self.index["next_segment"]
+            order = {(e[2], e[3]): row for row, e in enumerate(valid)}
+            entries = self.index["entries"]
+            for path, e in entries.items():
+                if e[2] >= 0:
+                    entries[path] = (e[0], e[1], seg_id, order[(e[2], e[3])], e[4], e[5])
+            self.index["segments"] = {seg_id: {"file": seg_file, "rows": len(valid), "created": time.time()}}
+            self.index["next_segment"] = seg_id + 1
+            self._save_index()
+
+            self._segments = {}
+            for f in old_files:
+                os.remove(os.path.join(self.dir, f))
+
+    def _save_index(self):
+        # Write-then-rename so an interrupted run never leaves a truncated index
+        # (callers hold the directory lock)
+        index_path = os.path.join(self.dir, INDEX_FILE)
+        tmp_path = f"{index_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            pickle.dump(self.index, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, index_path)
+
+    @staticmethod
+    def is_contiguous(entries):
+        """
+        True if the entries are one contiguous run of a single segment, i.e.
+        read() can return them as a zero-copy memmap slice.
+        """
+        if not entries:
+            return False
+        keys = sorted((e[2], e[3]) for e in entries)
+        return keys[0][0] == keys[-1][0] and keys[-1][1] - keys[0][1] + 1 == len(keys)
+
+    def read(self, entries, out=None):
+        """
+        Materialize rows for cache entries (as returned by lookup, failures excluded).
+        Rows come back in storage order together with their labels. When they form
+        one contiguous run of a single segment (and no `out` is given) the matrix is
+        a zero-copy memmap slice.
+        `out` is an (n, D) float32 array, typically an on-disk memmap, to copy the
+        rows into; rows are copied one segment (or READ_CHUNK_ROWS scattered rows)
+        at a time, so the full matrix is never held in RAM.
+        Raises StaleEntriesError if another process compacted the store since
+        the entries were looked up.
+        """
+        entries = sorted(entries, key=lambda e: (e[2], e[3]))
+        y = np.array([e[4] for e in entries], dtype=np.int64)
+        if not entries:
+            return (np.empty((0, 0), dtype=np.float32) if out is None else out), y
+
+        seg_ids = np.array([e[2] for e in entries])
+        rows = np.array([e[3] for e in entries])
+
+        if out is None and self.is_contiguous(entries):
+            return self.segment(seg_ids[0])[rows[0]:rows[-1] + 1], y
+
+        dim = self.segment(seg_ids[0]).shape[1]
+        if out is None:
+            out = np.empty((len(entries), dim), dtype=np.float32)
+        elif out.shape != (len(entries), dim):
+            raise ValueError(f"out has shape {out.shape}, expected {(len(entries), dim)}")
+
+        # Entries are sorted, so each segment's rows are one block of the output
+        bounds = np.flatnonzero(np.diff(seg_ids)) + 1
+        for start, stop in zip(np.r_[0, bounds], np.r_[bounds, len(entries)]):
+            seg = self.segment(seg_ids[start])
+            seg_rows = rows[start:stop]
+            if seg_rows[-1] - seg_rows[0] + 1 == len(seg_rows):
+                out[start:stop] = seg[seg_rows[0]:seg_rows[-1] + 1]
+            else:
+                for i in range(start, stop, READ_CHUNK_ROWS):
+                    j = min(i + READ_CHUNK_ROWS, stop)
+                    out[i:j] = seg[rows[i:j]]
+        return out, y
+
+class DetectionCache:
+    """
+    Persistent per-file face boxes, so the detector runs once per image.
+
+    Same keying as FeatureCache (absolute path validated by mtime and size) in a
+    directory named after the hash of the detector settings. A box is an
+    (x, y, w, h) tuple in full-resolution pixels, or () when no face was found.
+
+    Layout:
+        <root>/<config_hash>/index.pkl       path -> (mtime_ns, size, box)
+        <root>/<config_hash>/index.lock      inter-process lock for index updates
+    """
+    def __init__(self, root, config):
+        self.config = config
+        self.config_hash = config_hash(config)
+        self.dir = os.path.join(root, self.config_hash)
+        os.makedirs(self.dir, exist_ok=True)
+        self.index = _load_index(self.dir, {"config": config, "entries": {}})
+
+    def __len__(self):
+        return len(self.index["entries"])
+
+    _key = FeatureCache._key
+    _save_index = FeatureCache._save_index
+
+    def lookup(self, paths):
+        """
+        For each path return its cached box, or None if it is missing or the file changed.
+        """
+        found = []
+        entries = self.index["entries"]
+        for p in paths:
+            path, stamp = self._key(p)
+            entry = entries.get(path)
+            if entry is None or stamp is None or entry[:2] != stamp:
+                found.append(None)
+            else:
+                found.append(entry[2])
+        return found
+
+    def update(self, items):
+        """
+        Record (path, box) pairs and persist the index, merged under the
+        directory lock with boxes other processes stored meanwhile.
+        """
+        keyed = [(self._key(p), box) for p, box in items]
+        with locked(self.dir):
+            self.index = _load_index(self.dir, self.index)
+            entries = self.index["entries"]
+            for (path, stamp), box in keyed:
+                if stamp is not None:
+                    entries[path] = (stamp[0], stamp[1], tuple(int(v) for v in box))
+            self._save_index()
@@ -1,28 +1,85 @@
+import os
+from contextlib import nullcontext
+from functools import lru_cache
 import cv2
 import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
 from skimage.feature import local_binary_pattern, hog
+from scipy import fft as sp_fft
 from scipy.stats import entropy
 
-def extract_hog_features(image):
+# Layout version of the extract_features vector; bump whenever its contents change.
+# 1: HOG, LBP, colour histogram, texture stats
+# 2: version 1 followed by the radial power spectrum
+# Each model records the version it was trained with (.h5 attr 'feature_version',
+# absent = 1); DEFAKE_FEATURE_VERSION selects the layout for training and caching.
+FEATURE_VERSIONS = (1, 2)
+FEATURE_VERSION = int(os.environ.get("DEFAKE_FEATURE_VERSION", 1))
+
+# Descriptor geometry shared by the per-image and batch extractors
+HOG_ORIENTATIONS = 9
+HOG_PIXELS_PER_CELL = (8, 8)
+HOG_CELLS_PER_BLOCK = (2, 2)
+LBP_RADIUS = 1
+HIST_BINS = 32
+# Radial bins of the power spectrum, up to the Nyquist frequency (version 2)
+SPECTRUM_BINS = 32
+
+LBP_DIM = 8 * LBP_RADIUS + 2
+
+# Descriptor backend for HOG and LBP:
+# "skimage" - reference implementation the shipped model was trained with
+# "fast"    - NumPy port of the same algorithms (see check_fast_backend for parity)
+FEATURE_BACKENDS = ("skimage", "fast")
+FEATURE_BACKEND = os.environ.get("DEFAKE_FEATURE_BACKEND", "skimage")
+
+def set_feature_backend(name):
     """
-    Extract Histogram of Oriented Gradients (HOG) features.
+    Select the HOG/LBP implementation used by every extractor in this process.
     """
-    # Convert to grayscale for HOG
-    gray = cv2.cvtColor(image, cv2.COLOR_RGB2GRAY)
-    fd = hog(gray, orientations=9, pixels_per_cell=(8, 8),
-             cells_per_block=(2, 2), block_norm='L2-Hys', 
-             transform_sqrt=True, visualize=False, channel_axis=None)
-    return fd
+    global FEATURE_BACKEND
+    if name not in FEATURE_BACKENDS:
+        raise ValueError(f"Unknown feature backend '{name}', expected one of {FEATURE_BACKENDS}")
+    FEATURE_BACKEND = name
 
-def extract_lbp_features(image):
+def set_feature_version(version):
     """
-    Extract Local Binary Patterns (LBP) features.
+    Select the extract_features layout used by default in this process.
+    """
+    global FEATURE_VERSION
+    if version not in FEATURE_VERSIONS:
+        raise ValueError(f"Unknown feature version {version}, expected one of {FEATURE_VERSIONS}")
+    FEATURE_VERSION = version
+
+def _hog_dimension(image_size):
+    w, h = image_size
+    n_blocks_row = h // HOG_PIXELS_PER_CELL[0] - HOG_CELLS_PER_BLOCK[0] + 1
+    n_blocks_col = w // HOG_PIXELS_PER_CELL[1] - HOG_CELLS_PER_BLOCK[1] + 1
+    return n_blocks_row * n_blocks_col * HOG_CELLS_PER_BLOCK[0] * HOG_CELLS_PER_BLOCK[1] * HOG_ORIENTATIONS
+
+def feature_dimension(image_size=(128, 128), version=None):
+    """
+    Length of the vector returned by extract_features for a (W, H) image.
     """
-    # Convert to grayscale for LBP
-    gray = cv2.cvtColor(image, cv2.COLOR_RGB2GRAY)
-    radius = 1
+    dim = _hog_dimension(image_size) + LBP_DIM + 3 * HIST_BINS + 3 * 3
+    if (version or FEATURE_VERSION) >= 2:
+        dim += SPECTRUM_BINS
+    return dim
+
+def _hog_from_gray(gray):
+    if FEATURE_BACKEND == "fast":
+        return _hog_fast(gray)
+    return hog(gray, orientations=HOG_ORIENTATIONS, pixels_per_cell=HOG_PIXELS_PER_CELL,
+               cells_per_block=HOG_CELLS_PER_BLOCK, block_norm='L2-Hys', 
+               transform_sqrt=True, visualize=False, channel_axis=None)
+
+def _lbp_from_gray(gray):
+    radius = LBP_RADIUS
     n_points = 8 * radius
-    lbp = local_binary_pattern(gray, n_points, radius, method="uniform")
+    if FEATURE_BACKEND == "fast":
+        lbp = _lbp_uniform_fast(gray)
+    else:
+        lbp = local_binary_pattern(gray, n_points, radius, method="uniform")
     (hist, _) = np.histogram(lbp.ravel(), bins=np.arange(0, n_points + 3), range=(0, n_points + 2))
     
     # Normalize the histogram
@@ -30,54 +87,443 @@ def extract_lbp_features(image):
     hist /= (hist.sum() + 1e-7)
     return hist
 
+@lru_cache(maxsize=8)
+def _hog_cell_layout(shape):
+    """
+    Pixel permutation that groups the image into (n_cells, pixels_per_cell) rows,
+    keeping skimage's row-major visiting order inside each cell.
+    """
+    c_row, c_col = HOG_PIXELS_PER_CELL
+    n_cells_row, n_cells_col = shape[0] // c_row, shape[1] // c_col
+    pixel = np.arange(shape[0] * shape[1]).reshape(shape)
+    pixel = pixel[:n_cells_row * c_row, :n_cells_col * c_col]
+    order = pixel.reshape(n_cells_row, c_row, n_cells_col, c_col).transpose(0, 2, 1, 3)
+    return order.reshape(n_cells_row * n_cells_col, c_row * c_col), n_cells_row, n_cells_col
+
+def _hog_fast(gray, blocks=None):
+    """
+    NumPy port of skimage.feature.hog (transform_sqrt=True, L2-Hys) with the
+    same arithmetic, including the float32 per-cell accumulation.
+    With `blocks` (flat block indices) only those blocks, and the cells under
+    them, are computed; the result is their descriptors in the given order.
+    """
+    image = np.sqrt(gray.astype(np.float64))
+    
+    # Centered gradients, zero on the border
+    g_row = np.zeros_like(image)
+    g_row[1:-1, :] = image[2:, :] - image[:-2, :]
+    g_col = np.zeros_like(image)
+    g_col[:, 1:-1] = image[:, 2:] - image[:, :-2]
+    
+    magnitude = np.hypot(g_col, g_row)
+    orientation = np.rad2deg(np.arctan2(g_row, g_col)) % 180
+    edges = (180.0 / HOG_ORIENTATIONS) * np.arange(HOG_ORIENTATIONS)
+    bins = np.searchsorted(edges, orientation, side='right') - 1
+    
+    # Cell histograms: one pixel of every cell per step, summed in float32 like skimage
+    order, n_cells_row, n_cells_col = _hog_cell_layout(gray.shape)
+    b_row, b_col = HOG_CELLS_PER_BLOCK
+    n_blocks_col = n_cells_col - b_col + 1
+    if blocks is not None:
+        # Cells covered by the requested blocks; every other cell stays zero
+        block_row, block_col = np.divmod(np.asarray(blocks), n_blocks_col)
+        cell_row = (block_row[:, None] + np.arange(b_row)[None, :])[:, :, None]
+        cell_col = (block_col[:, None] + np.arange(b_col)[None, :])[:, None, :]
+        cells = np.unique(cell_row * n_cells_col + cell_col)
+        order = order[cells]
+    else:
+        cells = slice(None)
+    n_cells, cell_pixels = order.shape
+    magnitude = magnitude.ravel()[order]
+    slots = bins.ravel()[order] + (np.arange(n_cells) * HOG_ORIENTATIONS)[:, None]
+    acc = np.zeros(n_cells * HOG_ORIENTATIONS, dtype=np.float32)
+    for k in range(cell_pixels):
+        idx = slots[:, k]
+        acc[idx] = acc[idx] + magnitude[:, k]
+    acc /= np.float32(cell_pixels)
+    hist = np.zeros((n_cells_row * n_cells_col, HOG_ORIENTATIONS))
+    hist[cells] = acc.reshape(n_cells, HOG_ORIENTATIONS)
+    hist = hist.reshape(n_cells_row, n_cells_col, HOG_ORIENTATIONS)
+    
+    # L2-Hys block normalization
+    windows = sliding_window_view(hist, (b_row, b_col), axis=(0, 1)).transpose(0, 1, 3, 4, 2)
+    if blocks is not None:
+        windows = windows[block_row, block_col]
+    blocks = np.ascontiguousarray(windows).reshape(-1, b_row * b_col * HOG_ORIENTATIONS)
+    eps = 1e-5
+    out = blocks / np.sqrt(np.sum(blocks ** 2, axis=1, keepdims=True) + eps ** 2)
+    out = np.minimum(out, 0.2)
+    out = out / np.sqrt(np.sum(out ** 2, axis=1, keepdims=True) + eps ** 2)
+    return out.ravel()
+
+@lru_cache(maxsize=4)
+def _lbp_tables(n_points, radius):
+    """
+    Sampling offsets and the code -> "uniform" label lookup table used by skimage.
+    """
+    angles = 2 * np.pi * np.arange(n_points, dtype=np.float64) / n_points
+    coords = np.round(np.vstack([-radius * np.sin(angles), radius * np.cos(angles)]).T, 5)
+    
+    # skimage counts 0/1 transitions without wrapping around the circle
+    lut = np.empty(2 ** n_points, dtype=np.uint8)
+    for code in range(2 ** n_points):
+        bits = [(code >> i) & 1 for i in range(n_points)]
+        changes = sum(bits[i] != bits[i + 1] for i in range(n_points - 1))
+        lut[code] = sum(bits) if changes <= 2 else n_points + 1
+    return coords, lut
+
+def _lbp_uniform_fast(gray):
+    """
+    NumPy port of local_binary_pattern(method="uniform"): every neighbour is
+    sampled for the whole image at once with skimage's bilinear interpolation
+    (zero outside the image), and the bit pattern is mapped through a LUT.
+    """
+    radius = LBP_RADIUS
+    n_points = 8 * radius
+    coords, lut = _lbp_tables(n_points, radius)
+    
+    image = gray.astype(np.float64)
+    rows, cols = image.shape
+    padded = np.zeros((rows + 2 * radius, cols + 2 * radius))
+    padded[radius:-radius, radius:-radius] = image
+    
+    def window(dr, dc):
+        return padded[radius + dr:radius + dr + rows, radius + dc:radius + dc + cols]
+    
+    r_idx = np.arange(rows, dtype=np.float64)[:, None]
+    c_idx = np.arange(cols, dtype=np.float64)[None, :]
+    codes = np.zeros((rows, cols), dtype=np.uint16 if n_points > 8 else np.uint8)
+    for i, (cr, cc) in enumerate(coords):
+        r0, r1 = int(np.floor(cr)), int(np.ceil(cr))
+        c0, c1 = int(np.floor(cc)), int(np.ceil(cc))
+        if r0 == r1 and c0 == c1:
+            texture = window(r0, c0)
+        else:
+            dr = (r_idx + cr) - (r_idx + r0)
+            dc = (c_idx + cc) - (c_idx + c0)
+            top = (1 - dc) * window(r0, c0) + dc * window(r0, c1)
+            bottom = (1 - dc) * window(r1, c0) + dc * window(r1, c1)
+            texture = (1 - dr) * top + dr * bottom
+        codes |= ((texture - image) >= 0).astype(codes.dtype) << i
+    return lut[codes]
+
+@lru_cache(maxsize=8)
+def _spectrum_layout(h, w):
+    """
+    Radial-bin index of every rfft2 coefficient of an h x w image (DC and the
+    corners beyond Nyquist go to an overflow bin), the weight of each column
+    (the mirrored half of the spectrum that rfft2 omits counts twice), and
+    the weighted number of coefficients per bin. Computed once per shape.
+    """
+    fy = np.fft.fftfreq(h)[:, None] / 0.5
+    fx = np.fft.rfftfreq(w)[None, :] / 0.5
+    radius = np.sqrt(fy ** 2 + fx ** 2)
+    bins = np.minimum((radius * SPECTRUM_BINS).astype(np.intp), SPECTRUM_BINS)
+    bins[0, 0] = SPECTRUM_BINS
+    
+    weights = np.full(w // 2 + 1, 2.0, dtype=np.float32)
+    weights[0] = 1.0
+    if w % 2 == 0:
+        weights[-1] = 1.0
+    counts = np.bincount(bins.ravel(), weights=np.broadcast_to(weights, bins.shape).ravel(),
+                         minlength=SPECTRUM_BINS + 1)[:SPECTRUM_BINS]
+    return bins.ravel(), weights, np.maximum(counts, 1.0)
+
+def _spectrum_from_gray(gray):
+    # float32 real-input FFT; scipy.fft keeps the transform plan for each shape
+    bins, weights, counts = _spectrum_layout(*gray.shape)
+    spectrum = sp_fft.rfft2(gray.astype(np.float32) * np.float32(1 / 255), overwrite_x=True)
+    power = spectrum.real * spectrum.real
+    power += spectrum.imag * spectrum.imag
+    power *= weights
+    binned = np.bincount(bins, weights=power.ravel(), minlength=SPECTRUM_BINS + 1)[:SPECTRUM_BINS] / counts
+    # Shape of the spectrum, independent of overall contrast
+    total = binned @ counts / counts.sum()
+    return np.log10(binned / (total + 1e-12) + 1e-12)
+
+class FeatureContext:
+    """
+    Per-image cache of the intermediates shared by the extract_* functions.
+    Grayscale and the per-channel 32-bin histograms are computed on first use
+    and reused, so one extract_features call converts and histograms the
+    pixel data only once.
+    """
+    def __init__(self, image):
+        self.image = image
+        self._gray = None
+        self._channel_hists = None
+
+    @property
+    def gray(self):
+        if self._gray is None:
+            self._gray = cv2.cvtColor(self.image, cv2.COLOR_RGB2GRAY)
+        return self._gray
+
+    @property
+    def channel_hists(self):
+        # Raw float32 (32, 1) counts for R, G, B; callers must not modify them in place
+        if self._channel_hists is None:
+            self._channel_hists = [cv2.calcHist([self.image], [i], None, [HIST_BINS], [0, 256])
+                                   for i in range(3)]
+        return self._channel_hists
+
+def _as_context(image):
+    return image if isinstance(image, FeatureContext) else FeatureContext(image)
+
+def _stage(timings, name):
+    # timings: optional collector with a stage(name) context manager (see ml_service metrics)
+    return timings.stage(name) if timings is not None else nullcontext()
+
+def extract_hog_features(image):
+    """
+    Extract Histogram of Oriented Gradients (HOG) features.
+    Accepts an RGB image or a FeatureContext.
+    """
+    return _hog_from_gray(_as_context(image).gray)
+
+def extract_lbp_features(image):
+    """
+    Extract Local Binary Patterns (LBP) features.
+    Accepts an RGB image or a FeatureContext.
+    """
+    return _lbp_from_gray(_as_context(image).gray)
+
 def extract_color_histogram(image):
     """
     Extract RGB Color Histogram features.
+    Accepts an RGB image or a FeatureContext.
     """
-    # Calculate histogram for each channel with REDUCED bins (32)
-    hist_features = []
-    for i in range(3): # R, G, B
-        hist = cv2.calcHist([image], [i], None, [32], [0, 256])
-        hist = cv2.normalize(hist, hist).flatten()
-        hist_features.extend(hist)
-    return np.array(hist_features)
+    # L2-normalized 32-bin histogram for each channel (normalize into a new buffer,
+    # the counts are shared with extract_texture_stats)
+    ctx = _as_context(image)
+    return np.concatenate([cv2.normalize(hist, None).ravel() for hist in ctx.channel_hists])
+
+def extract_spectrum_features(image):
+    """
+    Extract the azimuthally averaged power spectrum (log10, relative to the
+    mean power) of the grayscale image in SPECTRUM_BINS radial bins.
+    Accepts an RGB image or a FeatureContext.
+    """
+    return _spectrum_from_gray(_as_context(image).gray)
 
 def extract_texture_stats(image):
     """
     Extract texture statistics (mean, variance, entropy) for each channel.
+    Accepts an RGB image or a FeatureContext.
     """
+    ctx = _as_context(image)
     stats = []
     for i in range(3): # R, G, B
-        channel = image[:, :, i]
+        channel = ctx.image[:, :, i]
         stats.append(np.mean(channel))
         stats.append(np.var(channel))
         
         # Entropy calculation (Histogram-based)
-        # Compute 32-bin histogram for entropy stability
-        hist = cv2.calcHist([channel], [0], None, [32], [0, 256])
-        hist = hist.flatten()
+        # Reuses the 32-bin channel histogram for entropy stability
+        hist = ctx.channel_hists[i].ravel()
         hist = hist / (hist.sum() + 1e-7)  # Normalize
         stats.append(entropy(hist, base=2))
         
     return np.array(stats)
 
-def extract_features(image):
+def extract_features(image, timings=None, version=None):
     """
     Master function to extract and concatenate all features.
     Input: RGB image arrays (H, W, 3)
-    Output: 1D feature vector
+    Output: 1D feature vector in the layout of `version` (default FEATURE_VERSION)
+    `timings` optionally records the time spent in each descriptor.
     """
-    hog_feats = extract_hog_features(image)
-    lbp_feats = extract_lbp_features(image)
-    color_feats = extract_color_histogram(image)
-    texture_feats = extract_texture_stats(image)
+    ctx = FeatureContext(image)
+    with _stage(timings, "extract_hog"):
+        hog_feats = extract_hog_features(ctx)
+    with _stage(timings, "extract_lbp"):
+        lbp_feats = extract_lbp_features(ctx)
+    with _stage(timings, "extract_color"):
+        color_feats = extract_color_histogram(ctx)
+    with _stage(timings, "extract_texture"):
+        texture_feats = extract_texture_stats(ctx)
+    
+    parts = [hog_feats, lbp_feats, color_feats, texture_feats]
+    if (version or FEATURE_VERSION) >= 2:
+        with _stage(timings, "extract_spectrum"):
+            parts.append(extract_spectrum_features(ctx))
     
     # Concatenate all features
-    combined_features = np.concatenate([hog_feats, lbp_feats, color_feats, texture_feats])
+    combined_features = np.concatenate(parts)
     return combined_features
 
+class FeatureMask:
+    """
+    Subset of the extract_features vector a compact model uses (sorted column
+    indices), broken down by descriptor so extract_features_masked can skip
+    the HOG blocks and descriptor groups that contribute no used column.
+    """
+    def __init__(self, indices, image_size=(128, 128)):
+        self.indices = np.unique(np.asarray(indices, dtype=np.int64))
+        self.image_size = tuple(image_size)
+        
+        hog_dim = _hog_dimension(self.image_size)
+        block_len = HOG_CELLS_PER_BLOCK[0] * HOG_CELLS_PER_BLOCK[1] * HOG_ORIENTATIONS
+        hog_cols = self.indices[self.indices < hog_dim]
+        self.hog_blocks, block_pos = np.unique(hog_cols // block_len, return_inverse=True)
+        # Position of each used HOG column inside the concatenated requested blocks
+        self.hog_src = block_pos * block_len + hog_cols % block_len
+        
+        # (name, first column, length) of the descriptors after HOG, in vector order
+        self.groups = []
+        start = hog_dim
+        for name, length in (("lbp", LBP_DIM), ("color", 3 * HIST_BINS), ("texture", 9), ("spectrum", SPECTRUM_BINS)):
+            used = self.indices[(self.indices >= start) & (self.indices < start + length)]
+            if used.size:
+                self.groups.append((name, used - start))
+            start += length
+    
+    def __len__(self):
+        return len(self.indices)
+
+_GROUP_EXTRACTORS = {
+    "lbp": extract_lbp_features,
+    "color": extract_color_histogram,
+    "texture": extract_texture_stats,
+    "spectrum": extract_spectrum_features
+}
+
+def extract_features_masked(image, mask, timings=None):
+    """
+    extract_features(image)[mask.indices], computing only what the mask needs:
+    with the fast backend only the used HOG blocks (and their cells) are built,
+    and LBP / colour / texture are skipped when none of their columns is used.
+    """
+    ctx = FeatureContext(image)
+    parts = []
+    if mask.hog_blocks.size:
+        with _stage(timings, "extract_hog"):
+            if FEATURE_BACKEND == "fast":
+                hog_part = _hog_fast(ctx.gray, blocks=mask.hog_blocks)
+            else:
+                block_len = HOG_CELLS_PER_BLOCK[0] * HOG_CELLS_PER_BLOCK[1] * HOG_ORIENTATIONS
+                hog_part = _hog_from_gray(ctx.gray).reshape(-1, block_len)[mask.hog_blocks].ravel()
+        parts.append(hog_part[mask.hog_src])
+    
+    for name, cols in mask.groups:
+        with _stage(timings, f"extract_{name}"):
+            parts.append(_GROUP_EXTRACTORS[name](ctx)[cols])
+    
+    return np.concatenate(parts)
+
+def extract_features_batch(images, dtype=np.float32, version=None):
+    """
+    Vectorized extract_features for a stack of same-sized RGB images.
+    Input: uint8 array (N, H, W, 3)
+    Output: (N, D) matrix; row i equals extract_features(images[i], version=version).astype(dtype)
+    """
+    images = np.ascontiguousarray(images, dtype=np.uint8)
+    n, h, w, _ = images.shape
+    version = version or FEATURE_VERSION
+    out = np.empty((n, feature_dimension((w, h), version)), dtype=dtype)
+    if n == 0:
+        return out
+    
+    # 1. Grayscale once for the whole stack ((N*H, W, 3) is a valid OpenCV image)
+    gray = cv2.cvtColor(images.reshape(n * h, w, 3), cv2.COLOR_RGB2GRAY).reshape(n, h, w)
+    
+    # 2. HOG + LBP per image (skimage has no batch API)
+    hog_dim = _hog_dimension((w, h))
+    for i in range(n):
+        out[i, :hog_dim] = _hog_from_gray(gray[i])
+        out[i, hog_dim:hog_dim + LBP_DIM] = _lbp_from_gray(gray[i])
+    col = hog_dim + LBP_DIM
+    
+    # 3. Per-channel 32-bin histograms in a single bincount (same bins as cv2.calcHist)
+    bins = (images >> 3).reshape(n, -1, 3).astype(np.intp)
+    bins += np.arange(3) * HIST_BINS
+    bins += (np.arange(n) * 3 * HIST_BINS)[:, None, None]
+    counts = np.bincount(bins.ravel(), minlength=n * 3 * HIST_BINS)
+    counts = counts.reshape(n, 3, HIST_BINS).astype(np.float32)
+    
+    # Colour histogram: cv2.normalize (L2) scales the float32 counts by 1 / norm
+    norm = np.sqrt(np.sum(counts.astype(np.float64) ** 2, axis=-1, keepdims=True))
+    color_feats = counts * (1.0 / norm).astype(np.float32)
+    out[:, col:col + 3 * HIST_BINS] = color_feats.reshape(n, -1)
+    col += 3 * HIST_BINS
+    
+    # 4. Texture stats: mean, variance and entropy per channel
+    channels = np.moveaxis(images, -1, 1)  # (N, 3, H, W) view
+    mean = channels.mean(axis=(2, 3))
+    # Contiguous float64 buffer so the variance sums in the same order as np.var
+    centered = np.empty(channels.shape, dtype=np.float64)
+    np.subtract(channels, mean[:, :, None, None], out=centered)
+    np.multiply(centered, centered, out=centered)
+    var = centered.reshape(n, 3, -1).sum(axis=-1) / (h * w)
+    ent = entropy(counts / (counts.sum(axis=-1, keepdims=True) + 1e-7), base=2, axis=-1)
+    out[:, col:col + 9] = np.stack([mean, var, ent], axis=-1).reshape(n, -1)
+    col += 9
+    
+    # 5. Radial power spectrum (version 2)
+    if version >= 2:
+        for i in range(n):
+            out[i, col:col + SPECTRUM_BINS] = _spectrum_from_gray(gray[i])
+    
+    return out
+
+def check_fast_backend(n_images=32, image_size=(128, 128), atol=1e-9, seed=0):
+    """
+    Numerical-equivalence check of the "fast" backend against skimage on random
+    and smoothed images. Returns the max absolute HOG/LBP differences and raises
+    AssertionError if either exceeds atol.
+    """
+    rng = np.random.default_rng(seed)
+    max_hog_diff = 0.0
+    max_lbp_diff = 0.0
+    previous = FEATURE_BACKEND
+    try:
+        for i in range(n_images):
+            gray = rng.integers(0, 256, (image_size[1], image_size[0]), dtype=np.uint8)
+            if i % 2:
+                gray = cv2.GaussianBlur(gray, (0, 0), 1 + i % 4)
+            
+            set_feature_backend("skimage")
+            ref_hog, ref_lbp = _hog_from_gray(gray), _lbp_from_gray(gray)
+            set_feature_backend("fast")
+            fast_hog, fast_lbp = _hog_from_gray(gray), _lbp_from_gray(gray)
+            
+            max_hog_diff = max(max_hog_diff, float(np.abs(fast_hog - ref_hog).max()))
+            max_lbp_diff = max(max_lbp_diff, float(np.abs(fast_lbp - ref_lbp).max()))
+    finally:
+        set_feature_backend(previous)
+    
+    assert max_hog_diff <= atol, f"HOG mismatch {max_hog_diff:.3g} > {atol}"
+    assert max_lbp_diff <= atol, f"LBP mismatch {max_lbp_diff:.3g} > {atol}"
+    return {"hog_max_abs_diff": max_hog_diff, "lbp_max_abs_diff": max_lbp_diff}
+
 if __name__ == "__main__":
     # Simple test
     dummy_img = np.random.randint(0, 255, (128, 128, 3), dtype=np.uint8)
     feats = extract_features(dummy_img)
     print(f"Feature vector shape: {feats.shape}")
+    
+    # Batch extractor must reproduce the per-image vector exactly
+    dummy_batch = np.random.randint(0, 255, (8, 128, 128, 3), dtype=np.uint8)
+    batch_feats = extract_features_batch(dummy_batch, dtype=np.float64)
+    single_feats = np.stack([extract_features(img) for img in dummy_batch])
+    print(f"Batch matrix shape: {batch_feats.shape}, identical: {np.array_equal(batch_feats, single_feats)}")
+    
+    # Fast HOG/LBP backend must match skimage before it is switched on
+    print(f"Fast backend parity: {check_fast_backend()}")
+    
+    # Version 2 extends version 1: same leading columns, spectrum appended
+    feats_v2 = extract_features(dummy_img, version=2)
+    batch_v2 = extract_features_batch(dummy_batch, dtype=np.float64, version=2)
+    print(f"Version 2 shape: {feats_v2.shape}, v1 prefix identical: {np.array_equal(feats_v2[:feats.shape[0]], feats)}, "
+          f"batch identical: {np.array_equal(batch_v2, np.stack([extract_features(img, version=2) for img in dummy_batch]))}")
+    
+    # Masked extraction must return exactly the selected columns
+    rng = np.random.default_rng(0)
+    for version in FEATURE_VERSIONS:
+        full = extract_features(dummy_img, version=version)
+        mask = FeatureMask(rng.choice(full.shape[0], 500, replace=False))
+        for backend in FEATURE_BACKENDS:
+            set_feature_backend(backend)
+            masked = extract_features_masked(dummy_img, mask)
+            print(f"Masked (v{version}, {backend}): {len(mask)} columns, {len(mask.hog_blocks)} HOG blocks, "
+                  f"identical: {np.array_equal(masked, extract_features(dummy_img, version=version)[mask.indices])}")
@@ -0,0 +1,162 @@
+import json
+import hashlib
+import cv2
+import numpy as np
+import feature_extraction
+from feature_extraction import (FEATURE_VERSIONS, HOG_ORIENTATIONS, HOG_PIXELS_PER_CELL, HOG_CELLS_PER_BLOCK,
+                                LBP_RADIUS, HIST_BINS, SPECTRUM_BINS, feature_dimension,
+                                extract_features, extract_features_masked, extract_features_batch,
+                                _hog_cell_layout, _lbp_tables, _spectrum_layout)
+
+# Layout of the spec document itself; bump when a field changes meaning
+SPEC_VERSION = 1
+
+class FeatureSpec:
+    """
+    Declarative description of the feature pipeline a model was trained on:
+    preprocessing (face crop, resize) and the descriptor parameters. train.py
+    stores it as JSON in the model's .h5 attrs ('feature_spec'); inference
+    builds its FeatureExtractor from it, and its digest keys the feature cache.
+    """
+    def __init__(self, feature_version, image_size=(128, 128), use_face_detection=False,
+                 hog_orientations=HOG_ORIENTATIONS, hog_pixels_per_cell=HOG_PIXELS_PER_CELL,
+                 hog_cells_per_block=HOG_CELLS_PER_BLOCK, lbp_radius=LBP_RADIUS, hist_bins=HIST_BINS,
+                 spectrum_bins=SPECTRUM_BINS, spec_version=SPEC_VERSION):
+        self.spec_version = int(spec_version)
+        self.feature_version = int(feature_version)
+        self.image_size = tuple(int(v) for v in image_size)
+        self.use_face_detection = bool(use_face_detection)
+        self.hog_orientations = int(hog_orientations)
+        self.hog_pixels_per_cell = tuple(int(v) for v in hog_pixels_per_cell)
+        self.hog_cells_per_block = tuple(int(v) for v in hog_cells_per_block)
+        self.lbp_radius = int(lbp_radius)
+        self.hist_bins = int(hist_bins)
+        # Only part of the vector from version 2 on
+        self.spectrum_bins = int(spectrum_bins) if self.feature_version >= 2 else None
+
+    @classmethod
+    def current(cls, image_size=(128, 128), use_face_detection=False):
+        """
+        Spec of what this process extracts (FEATURE_VERSION and the module constants).
+        """
+        return cls(feature_extraction.FEATURE_VERSION, image_size, use_face_detection)
+
+    @classmethod
+    def from_json(cls, text):
+        return cls(**json.loads(text))
+
+    @classmethod
+    def from_attrs(cls, attrs):
+        """
+        Spec of a saved model. Models written before the spec existed only
+        recorded 'feature_version' / 'image_size'; they were trained on full
+        images with the descriptor parameters that are still the defaults.
+        """
+        if 'feature_spec' in attrs:
+            return cls.from_json(attrs['feature_spec'])
+        return cls(int(attrs.get('feature_version', 1)), tuple(attrs.get('image_size', (128, 128))))
+
+    def to_dict(self):
+        spec = {
+            "spec_version": self.spec_version,
+            "feature_version": self.feature_version,
+            "image_size": list(self.image_size),
+            "use_face_detection": self.use_face_detection,
+            "hog_orientations": self.hog_orientations,
+            "hog_pixels_per_cell": list(self.hog_pixels_per_cell),
+            "hog_cells_per_block": list(self.hog_cells_per_block),
+            "lbp_radius": self.lbp_radius,
+            "hist_bins": self.hist_bins
+        }
+        if self.spectrum_bins is not None:
+            spec["spectrum_bins"] = self.spectrum_bins
+        return spec
+
+    def to_json(self):
+        return json.dumps(self.to_dict(), sort_keys=True)
+
+    @property
+    def digest(self):
+        return hashlib.sha1(self.to_json().encode("utf-8")).hexdigest()[:16]
+
+    @property
+    def dimension(self):
+        return feature_dimension(self.image_size, self.feature_version)
+
+    def __eq__(self, other):
+        return isinstance(other, FeatureSpec) and self.to_dict() == other.to_dict()
+
+    def __repr__(self):
+        return f"FeatureSpec({self.to_json()})"
+
+    def check(self):
+        """
+        Raise ValueError if this build of feature_extraction cannot reproduce the spec.
+        """
+        implemented = FeatureSpec.current(self.image_size, self.use_face_detection)
+        if self.feature_version not in FEATURE_VERSIONS:
+            raise ValueError(f"Unknown feature version {self.feature_version}, expected one of {FEATURE_VERSIONS}")
+        if self.spec_version > SPEC_VERSION:
+            raise ValueError(f"Feature spec version {self.spec_version} is newer than this code ({SPEC_VERSION})")
+        ours, theirs = implemented.to_dict(), self.to_dict()
+        for name in ("hog_orientations", "hog_pixels_per_cell", "hog_cells_per_block", "lbp_radius", "hist_bins"):
+            if ours[name] != theirs[name]:
+                raise ValueError(f"Model was trained with {name}={theirs[name]}, "
+                                 f"but this build extracts {name}={ours[name]}")
+        if self.spectrum_bins is not None and self.spectrum_bins != SPECTRUM_BINS:
+            raise ValueError(f"Model was trained with spectrum_bins={self.spectrum_bins}, "
+                             f"but this build extracts spectrum_bins={SPECTRUM_BINS}")
+
+class FeatureExtractor:
+    """
+    Image -> feature vector for one FeatureSpec (and optionally a compact
+    model's FeatureMask). The spec is checked once, and the per-shape tables
+    (HOG cell layout, LBP lookup table, spectrum bins) are built at load time
+    instead of on the first request.
+    """
+    def __init__(self, spec, mask=None):
+        spec.check()
+        self.spec = spec
+        self.mask = mask
+
+        # Precompute the shape-dependent tables for the spec's image size
+        w, h = spec.image_size
+        _hog_cell_layout((h, w))
+        _lbp_tables(8 * spec.lbp_radius, spec.lbp_radius)
+        if spec.feature_version >= 2:
+            _spectrum_layout(h, w)
+
+    @property
+    def dimension(self):
+        return len(self.mask) if self.mask is not None else self.spec.dimension
+
+    def preprocess(self, image):
+        """
+        Decoded RGB image -> the image the descriptors run on: face crop (if
+        the model was trained on crops) and resize to the spec's image size.
+        """
+        if self.spec.use_face_detection:
+            from data_loader import detect_and_crop_face
+            image = detect_and_crop_face(image)
+        return cv2.resize(image, self.spec.image_size)
+
+    def extract(self, image, timings=None):
+        """
+        Feature vector of a preprocessed image, in the layout the model expects.
+        """
+        if self.mask is None:
+            return extract_features(image, timings, self.spec.feature_version)
+        return extract_features_masked(image, self.mask, timings)
+
+    def extract_batch(self, images):
+        """
+        (N, D) float32 features of a stack of preprocessed images; rows equal
+        extract() of each image. Full-layout models use the vectorized
+        extract_features_batch; compact models extract only their masked columns.
+        """
+        if self.mask is None:
+            return extract_features_batch(images, version=self.spec.feature_version)
+        return np.array([extract_features_masked(image, self.mask) for image in images], dtype=np.float32)
+
+    def __call__(self, image, timings=None):
+        return self.extract(self.preprocess(image), timings)
@@ -0,0 +1,325 @@
+import os
+import pickle
+import hashlib
+import threading
+import h5py
+import numpy as np
+import xgboost as xgb
+from feature_extraction import FeatureMask
+from feature_spec import FeatureSpec, FeatureExtractor
+from compiled_predictor import CompiledPredictor, compiled_path, model_digest
+
+MODEL_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "models")
+DEFAULT_MODEL_PATH = os.path.join(MODEL_DIR, "face_real_vs_ai_model.h5")
+DEFAULT_SCALER_PATH = os.path.join(MODEL_DIR, "scaler.pkl")
+
+# Decision threshold for models saved without 'best_threshold'
+DEFAULT_THRESHOLD = 0.42
+
+# Tree evaluators: the XGBoost booster itself, or the NumPy flattened trees
+PREDICTORS = ("xgboost", "compiled")
+
+# Artifact sets kept after a reload (the current one included), so requests
+# that started on an older set can still finish on it
+RETAINED_VERSIONS = 2
+
+class StaleVersionError(RuntimeError):
+    """
+    The artifacts a request started with are no longer held by this process
+    (reloaded more than RETAINED_VERSIONS times since, or a process-pool worker
+    started after the reload). The request should be retried.
+    """
+
+def file_stamp(path):
+    """
+    (mtime_ns, size) of a file; raises FileNotFoundError if it does not exist.
+    """
+    st = os.stat(path)
+    return st.st_mtime_ns, st.st_size
+
+def load_model_from_h5(path):
+    """
+    Booster and the HDF5 attributes (feature_size, best_threshold, ...) of a saved model.
+    """
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"Model file not found at {path}")
+
+    with h5py.File(path, 'r') as f:
+        model_bytes = f['model_bytes'][()].tobytes()
+        attrs = dict(f.attrs)
+
+    model = xgb.Booster()
+    model.load_model(bytearray(model_bytes))
+    return model, attrs
+
+def load_compiled_predictor(model_path, model):
+    """
+    CompiledPredictor for a loaded booster: the exported <model>.trees.npz if it
+    was compiled from this exact booster, otherwise compiled now.
+    """
+    path = compiled_path(model_path)
+    if os.path.exists(path):
+        predictor = CompiledPredictor.load(path)
+        if predictor.source == model_digest(model.save_raw()):
+            print(f"Loaded compiled predictor from {path}")
+            return predictor
+        print(f"{path} was compiled from a different model, recompiling")
+    return CompiledPredictor.from_booster(model)
+
+def save_scaler_stats(f, scaler, columns=None):
+    """
+    Store a fitted StandardScaler's mean_ and scale_ in an open HDF5 model file,
+    so the artifact can be scaled without unpickling scaler.pkl.
+    `columns` keeps only the stats of those features (compact models).
+    """
+    mean, scale = np.asarray(scaler.mean_, dtype=np.float64), np.asarray(scaler.scale_, dtype=np.float64)
+    if columns is not None:
+        mean, scale = mean[columns], scale[columns]
+    f.create_dataset('scaler_mean', data=mean)
+    f.create_dataset('scaler_scale', data=scale)
+
+def load_scaler_stats(path):
+    """
+    (mean, scale) stored in the model file by save_scaler_stats, or None.
+    """
+    with h5py.File(path, 'r') as f:
+        if 'scaler_mean' not in f or 'scaler_scale' not in f:
+            return None
+        return f['scaler_mean'][()], f['scaler_scale'][()]
+
+def load_feature_mask(path):
+    """
+    FeatureMask of a compact model (the extract_features columns it was trained
+    on), or None for a model that takes the full vector.
+    """
+    with h5py.File(path, 'r') as f:
+        if 'feature_mask' not in f:
+            return None
+        indices = f['feature_mask'][()]
+        image_size = tuple(int(v) for v in f.attrs.get('image_size', (128, 128)))
+    return FeatureMask(indices, image_size)
+
+class Artifacts:
+    """
+    One consistent set of inference artifacts: booster, scaler and threshold
+    loaded together, plus the file stamps they were loaded from.
+
+    predict() is the fused inference path: standardization runs in place on a
+    float32 buffer with precomputed float32 mean and 1/scale, and the booster is
+    fed through inplace_predict, so no float64 copy and no DMatrix is built.
+    Compact models carry a FeatureMask; extract_features() then computes only
+    the columns the model uses. With a CompiledPredictor the trees are evaluated
+    in NumPy instead of by the booster. Preprocessing and feature extraction
+    follow the FeatureSpec stored with the model.
+    """
+    def __init__(self, model, scaler, threshold, attrs, stamps, scaler_stats=None, feature_mask=None,
+                 compiled=None):
+        self.model = model
+        self.compiled = compiled
+        self.feature_mask = feature_mask
+        # Feature pipeline the model was trained on; raises if this build cannot reproduce it
+        self.spec = FeatureSpec.from_attrs(attrs)
+        self.extractor = FeatureExtractor(self.spec, feature_mask)
+        self.scaler = scaler
+        self.threshold = threshold
+        self.attrs = attrs
+        self.stamps = stamps
+        payload = "|".join(f"{os.path.basename(p)}:{s[0]}:{s[1]}" for p, s in sorted(stamps.items()))
+        self.version = hashlib.sha1(payload.encode("utf-8")).hexdigest()[:12]
+
+        mean, scale = scaler_stats if scaler_stats is not None else (scaler.mean_, scaler.scale_)
+        self.mean = np.asarray(mean, dtype=np.float32)
+        self.inv_scale = (1.0 / np.asarray(scale, dtype=np.float64)).astype(np.float32)
+        if self.extractor.dimension != self.feature_size:
+            raise ValueError(f"Feature spec produces {self.extractor.dimension} features, "
+                             f"but the scaler expects {self.feature_size}")
+
+    @property
+    def feature_size(self):
+        return self.mean.shape[0]
+
+    @property
+    def feature_version(self):
+        return self.spec.feature_version
+
+    def preprocess(self, image):
+        """
+        Decoded RGB image -> the cropped/resized image the model's features are computed on.
+        """
+        return self.extractor.preprocess(image)
+
+    def extract_features(self, image, timings=None):
+        """
+        Feature vector of a preprocessed RGB image in the layout this model expects.
+        """
+        return self.extractor.extract(image, timings)
+
+    def extract_features_batch(self, images):
+        """
+        (N, D) float32 feature matrix of a stack of preprocessed RGB images.
+        """
+        return self.extractor.extract_batch(images)
+
+    def scale(self, features, overwrite=False):
+        """
+        Standardized float32 copy of an (N, D) feature matrix. With overwrite=True
+        a C-contiguous float32 input is standardized in place and returned.
+        """
+        # Safety Check: Feature Dimension Mismatch
+        if features.shape[1] != self.feature_size:
+            raise ValueError(f"Feature dimension mismatch: Expected {self.feature_size}, got {features.shape[1]}")
+
+        if overwrite and features.dtype == np.float32 and features.flags.c_contiguous:
+            X = features
+        else:
+            X = np.array(features, dtype=np.float32, order='C')
+        np.subtract(X, self.mean, out=X)
+        np.multiply(X, self.inv_scale, out=X)
+        return X
+
+    def predict(self, features, overwrite=False):
+        """
+        Probability of AI-GENERATED for each row of an (N, D) feature matrix.
+        """
+        return self.predict_scaled(self.scale(features, overwrite=overwrite))
+
+    def predict_scaled(self, X):
+        """
+        predict() for a matrix already standardized by scale().
+        """
+        if self.compiled is not None:
+            return self.compiled.predict(X)
+        return self.model.inplace_predict(X)
+
+class ModelRegistry:
+    """
+    Loads the booster, scaler and threshold once and hands out the same
+    Artifacts until the files on disk change.
+
+    get() reloads when a file's mtime or size changed; `current` never touches
+    the disk. reload() builds the new Artifacts completely before swapping them
+    in with a single assignment, so readers see either the old set or the new
+    one, never a mix, and a failed load keeps the old set.
+
+    The last RETAINED_VERSIONS sets stay reachable through artifacts_for(), so
+    a request can take one snapshot of the version when it starts and run
+    every stage on that set even if a reload lands in between.
+    """
+    def __init__(self, model_path=DEFAULT_MODEL_PATH, scaler_path=DEFAULT_SCALER_PATH,
+                 default_threshold=DEFAULT_THRESHOLD, predictor="xgboost"):
+        if predictor not in PREDICTORS:
+            raise ValueError(f"Unknown predictor '{predictor}', expected one of {PREDICTORS}")
+        self.model_path = os.path.abspath(model_path)
+        self.scaler_path = os.path.abspath(scaler_path)
+        self.default_threshold = default_threshold
+        self.predictor = predictor
+        self.current = None
+        self._recent = {}
+        self._lock = threading.Lock()
+
+    def _stamps(self):
+        stamps = {self.model_path: file_stamp(self.model_path)}
+        # scaler.pkl is optional for models that carry the scaler stats themselves
+        if os.path.exists(self.scaler_path):
+            stamps[self.scaler_path] = file_stamp(self.scaler_path)
+        return stamps
+
+    def _load(self, stamps):
+        print(f"Loading model from {self.model_path}...")
+        model, attrs = load_model_from_h5(self.model_path)
+        if 'best_threshold' in attrs:
+            threshold = float(attrs['best_threshold'])
+            print(f"Loaded Optimal Threshold from model: {threshold:.4f}")
+        else:
+            threshold = self.default_threshold
+            print(f"No threshold found in model, using default {threshold}")
+
+        scaler_stats = load_scaler_stats(self.model_path)
+        scaler = None
+        if self.scaler_path in stamps or scaler_stats is None:
+            print(f"Loading scaler from {self.scaler_path}...")
+            with open(self.scaler_path, "rb") as f:
+                scaler = pickle.load(f)
+        compiled = None
+        if self.predictor == "compiled":
+            compiled = load_compiled_predictor(self.model_path, model)
+        return Artifacts(model, scaler, threshold, attrs, stamps, scaler_stats,
+                         load_feature_mask(self.model_path), compiled)
+
+    def reload(self, force=False):
+        """
+        Load the artifacts if they changed on disk (or always with force=True).
+        Returns True when a new set was swapped in.
+        """
+        with self._lock:
+            stamps = self._stamps()
+            if not force and self.current is not None and self.current.stamps == stamps:
+                return False
+            artifacts = self._load(stamps)
+            recent = {v: a for v, a in self._recent.items() if v != artifacts.version}
+            recent[artifacts.version] = artifacts
+            # Dicts keep insertion order: drop the oldest sets
+            self._recent = dict(list(recent.items())[-RETAINED_VERSIONS:])
+            self.current = artifacts
+            print(f"Model version: {artifacts.version}")
+            return True
+
+    def get(self):
+        """
+        Current artifacts, reloaded first if the files changed since they were loaded.
+        """
+        current = self.current
+        if current is None or current.stamps != self._stamps():
+            self.reload()
+        return self.current
+
+    def artifacts_for(self, version=None):
+        """
+        The artifacts with this version (the current ones for None).
+        Raises StaleVersionError if that set is no longer retained.
+        """
+        if version is None:
+            return self.current
+        artifacts = self._recent.get(version)
+        if artifacts is None:
+            raise StaleVersionError(f"Model version {version} is no longer loaded")
+        return artifacts
+
+_registries = {}
+
+def get_registry(model_path=DEFAULT_MODEL_PATH, scaler_path=DEFAULT_SCALER_PATH):
+    """
+    Process-wide registry for a model/scaler pair, shared by every caller.
+    """
+    key = (os.path.abspath(model_path), os.path.abspath(scaler_path))
+    if key not in _registries:
+        _registries[key] = ModelRegistry(*key)
+    return _registries[key]
+
+if __name__ == "__main__":
+    # Parity and overhead of the fused path against scaler.transform + DMatrix
+    import time
+
+    artifacts = get_registry().get()
+    if artifacts.scaler is None:
+        raise SystemExit("scaler.pkl is needed for the reference path")
+
+    rng = np.random.default_rng(0)
+    # Realistic inputs: perturbed around the training distribution
+    scale = np.asarray(artifacts.scaler.scale_)
+    for n in (1, 32, 1024):
+        X = artifacts.scaler.mean_ + rng.standard_normal((n, artifacts.feature_size)) * scale
+
+        start = time.perf_counter()
+        for _ in range(20):
+            ref = artifacts.model.predict(xgb.DMatrix(artifacts.scaler.transform(X)))
+        ref_ms = (time.perf_counter() - start) / 20 * 1000
+
+        X32 = X.astype(np.float32)
+        start = time.perf_counter()
+        for _ in range(20):
+            fused = artifacts.predict(X32)
+        fused_ms = (time.perf_counter() - start) / 20 * 1000
+
+        print(f"batch {n:>5}: max |diff| {np.abs(ref - fused).max():.2e} | "
+              f"transform+DMatrix {ref_ms:.2f} ms | fused {fused_ms:.2f} ms")
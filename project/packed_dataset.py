@@ -0,0 +1,200 @@
+import os
+import json
+import time
+import random
+import argparse
+import numpy as np
+
+MANIFEST_FILE = "manifest.json"
+# Images per shard: 2048 x 128 x 128 x 3 bytes = 96 MB, large enough for sequential reads
+SHARD_SIZE = 2048
+# Row r of a shard file is addressed (and feature-cached) as "<shard path>::<r>"
+PACKED_SEP = "::"
+
+def packed_split_dir(root, split):
+    """
+    Directory of a packed split under root, or None if it has not been packed.
+    """
+    if not root:
+        return None
+    split_dir = os.path.join(root, split)
+    return split_dir if os.path.exists(os.path.join(split_dir, MANIFEST_FILE)) else None
+
+def parse_key(key):
+    """
+    (shard path, row) of a packed row key.
+    """
+    path, row = key.rsplit(PACKED_SEP, 1)
+    return path, int(row)
+
+class PackedDataset:
+    """
+    Reader for one split written by pack_split: pre-cropped, pre-resized
+    uint8 RGB images in a few large .npy shards instead of one JPEG per image.
+
+    Shards are opened as memory maps and read front to back, so I/O is large
+    sequential reads; shuffling happens at shard level (the rows inside each
+    shard were already shuffled across the whole split when it was packed).
+
+    Layout:
+        <root>/<split>/manifest.json              image size, crop and detector settings, shard list
+        <root>/<split>/shard_00000.npy            (n, H, W, 3) uint8 RGB images
+        <root>/<split>/shard_00000_labels.npy     (n,) int64 labels
+    """
+    def __init__(self, split_dir):
+        self.dir = os.path.abspath(split_dir)
+        with open(os.path.join(self.dir, MANIFEST_FILE)) as f:
+            self.manifest = json.load(f)
+        self.image_size = tuple(self.manifest["image_size"])
+        self.use_face_detection = self.manifest["use_face_detection"]
+        self.face_detector = self.manifest.get("face_detector")
+        self.shards = self.manifest["shards"]
+        self._sources = None
+
+    def __len__(self):
+        return sum(s["count"] for s in self.shards)
+
+    def check(self, image_size, use_face_detection):
+        """
+        Raise ValueError unless the split was packed with this preprocessing,
+        including the current face-detector settings when crops are used.
+        """
+        from data_loader import detector_config
+
+        if self.image_size != tuple(image_size) or self.use_face_detection != bool(use_face_detection):
+            raise ValueError(f"{self.dir} was packed with image_size={self.image_size}, "
+                             f"use_face_detection={self.use_face_detection}; requested "
+                             f"image_size={tuple(image_size)}, use_face_detection={bool(use_face_detection)}")
+        if self.use_face_detection and self.face_detector != detector_config():
+            raise ValueError(f"{self.dir} was packed with face detector {self.face_detector}; "
+                             f"current settings are {detector_config()}. Repack the split.")
+
+    def shard_path(self, i):
+        return os.path.join(self.dir, self.shards[i]["images"])
+
+    def images(self, i):
+        """
+        Memory-mapped (read-only) images of shard i.
+        """
+        return np.load(self.shard_path(i), mmap_mode="r")
+
+    def labels(self, i):
+        return np.load(os.path.join(self.dir, self.shards[i]["labels"]))
+
+    def keys(self, i):
+        path = self.shard_path(i)
+        return [f"{path}{PACKED_SEP}{row}" for row in range(self.shards[i]["count"])]
+
+    def source_path(self, key):
+        """
+        Original image file a packed row was made from.
+        """
+        if self._sources is None:
+            self._sources = {self.shard_path(i): s["paths"] for i, s in enumerate(self.shards)}
+        path, row = parse_key(key)
+        return self._sources[path][row]
+
+    def shard_order(self, shuffle=True, seed=None):
+        order = list(range(len(self.shards)))
+        if shuffle:
+            rng = random.Random(seed) if seed is not None else random
+            rng.shuffle(order)
+        return order
+
+    def iter_shards(self, shuffle=True, seed=None):
+        """
+        Yields (images, labels) one whole shard at a time, shards in random order.
+        Each shard is read sequentially into memory in one pass.
+        """
+        for i in self.shard_order(shuffle, seed):
+            yield np.array(self.images(i)), self.labels(i)
+
+def _write_manifest(split_dir, manifest):
+    # Write-then-rename so readers never see a half-written manifest
+    path = os.path.join(split_dir, MANIFEST_FILE)
+    with open(path + ".tmp", "w") as f:
+        json.dump(manifest, f)
+    os.replace(path + ".tmp", path)
+
+def pack_split(split, output, image_size=(128, 128), use_face_detection=False, shard_size=SHARD_SIZE,
+               workers=None, base_dir=None, max_samples=None):
+    """
+    Convert one split of the image folders into shards under output/split.
+    Images are decoded, optionally face-cropped and resized exactly like
+    load_dataset does on a process pool, in the split's shuffled order;
+    unreadable files are skipped. Returns the PackedDataset.
+    """
+    from data_loader import _split_tasks, _load_preprocessed_chunk, make_executor, detector_config
+
+    tasks = _split_tasks(split, image_size, max_samples, use_face_detection, base_dir)
+    split_dir = os.path.join(output, split)
+    os.makedirs(split_dir, exist_ok=True)
+    w, h = image_size
+    manifest = {
+        "format": 1,
+        "split": split,
+        "image_size": [w, h],
+        "use_face_detection": bool(use_face_detection),
+        "created": time.time(),
+        "shards": [],
+        "failed": 0
+    }
+    if use_face_detection:
+        manifest["face_detector"] = detector_config()
+
+    print(f"Packing {len(tasks)} images into {split_dir} ({shard_size} per shard)...")
+    start_time = time.perf_counter()
+    with make_executor(workers, use_face_detection) as executor:
+        n_workers = getattr(executor, "_max_workers", os.cpu_count() or 1)
+        for start in range(0, len(tasks), shard_size):
+            batch = tasks[start:start + shard_size]
+            images = np.empty((len(batch), h, w, 3), dtype=np.uint8)
+            labels, paths = [], []
+            # Each worker loads a run of images and face-detects them in batches
+            chunksize = max(1, len(batch) // (n_workers * 4))
+            chunks = [batch[i:i + chunksize] for i in range(0, len(batch), chunksize)]
+            loaded = (result for chunk in executor.map(_load_preprocessed_chunk, chunks) for result in chunk)
+            for task, result in zip(batch, loaded):
+                if result is None:
+                    manifest["failed"] += 1
+                    continue
+                images[len(labels)] = result[0]
+                labels.append(task[1])
+                paths.append(os.path.abspath(task[0]))
+
+            name = f"shard_{len(manifest['shards']):05d}"
+            np.save(os.path.join(split_dir, name + ".npy"), images[:len(labels)])
+            np.save(os.path.join(split_dir, name + "_labels.npy"), np.array(labels, dtype=np.int64))
+            manifest["shards"].append({"images": name + ".npy", "labels": name + "_labels.npy",
+                                       "count": len(labels), "paths": paths})
+            print(f"Packed {start + len(batch)}/{len(tasks)} images...", end='\r')
+
+    _write_manifest(split_dir, manifest)
+    elapsed = time.perf_counter() - start_time
+    n = sum(s["count"] for s in manifest["shards"])
+    print(f"\nPacked {n} images in {len(manifest['shards'])} shards ({manifest['failed']} unreadable) "
+          f"in {elapsed:.1f}s")
+    return PackedDataset(split_dir)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Pack the real/fake image folders into sharded uint8 arrays")
+    parser.add_argument("--output", type=str, required=True, help="Packed dataset root (one subdirectory per split)")
+    parser.add_argument("--splits", nargs="+", default=["train", "valid", "test"])
+    parser.add_argument("--data-dir", type=str, default=None, help="Dataset root (default: data_loader.BASE_DIR)")
+    parser.add_argument("--image-size", type=int, default=128)
+    parser.add_argument("--face-detection", action="store_true", help="Store face crops instead of full images")
+    parser.add_argument("--shard-size", type=int, default=SHARD_SIZE)
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: all cores)")
+    parser.add_argument("--max-samples", type=int, default=None)
+    args = parser.parse_args()
+
+    for split in args.splits:
+        dataset = pack_split(split, args.output, (args.image_size, args.image_size), args.face_detection,
+                             args.shard_size, args.workers, args.data_dir, args.max_samples)
+
+        # Sequential read throughput of the packed split
+        start = time.perf_counter()
+        n_bytes = sum(images.nbytes for images, _ in dataset.iter_shards())
+        elapsed = time.perf_counter() - start
+        print(f"Read back {len(dataset)} images at {n_bytes / elapsed / 1e6:.0f} MB/s "
+              f"({len(dataset) / elapsed:.0f} images/s)")
@@ -1,107 +1,138 @@
-import xgboost as xgb
 import numpy as np
-import h5py
 import cv2
 import os
 import argparse
-import pickle
-from feature_extraction import extract_features
-# Import face detection
-from data_loader import detect_and_crop_face
+from model_registry import get_registry
 
-def load_model_from_h5(path):
-    if not os.path.exists(path):
-        raise FileNotFoundError(f"Model file not found at {path}")
+MODEL_PATH = "models/face_real_vs_ai_model.h5"
+SCALER_PATH = "models/scaler.pkl"
+
+# Strict Threshold Correction: 0.42
+THRESHOLD = 0.42
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".webp")
+
+def load_artifacts():
+    """
+    Model and scaler from the shared registry (loaded once per process).
+    Returns (artifacts, None) or (None, error dict).
+    """
+    if not os.path.exists(MODEL_PATH):
+        return None, {"error": "Model not found. Please train the model first."}
+    try:
+        return get_registry(MODEL_PATH, SCALER_PATH).get(), None
+    except FileNotFoundError:
+        # Models without embedded scaler stats need scaler.pkl
+        return None, {"error": "Scaler not found. Please train the model first."}
+
+def load_image(image_path, artifacts):
+    """
+    Read an image and preprocess it like training (face crop and resize from
+    the model's feature spec); returns the RGB image or None.
+    """
+    img = cv2.imread(image_path)
+    if img is None:
+        return None
         
-    with h5py.File(path, 'r') as f:
-        model_bytes = f['model_bytes'][()].tobytes()
-    
-    model = xgb.Booster()
-    model.load_model(bytearray(model_bytes))
-    return model
+    img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+    return artifacts.preprocess(img)
+
+def score_features(artifacts, features):
+    """
+    Probabilities for a stacked (N, D) feature matrix (fused scaling + inplace_predict).
+    """
+    return artifacts.predict(features, overwrite=True)
+
+def label_result(prob):
+    label = "AI-GENERATED" if prob > THRESHOLD else "REAL"
+    confidence = float(prob) if prob > THRESHOLD else float(1 - prob)
+    return {
+        "label": label,
+        "confidence": confidence
+    }
 
 def predict_face(image_path):
     """
     Predict if a face is REAL or AI-GENERATED.
     """
-    model_path = "models/face_real_vs_ai_model.h5"
-    scaler_path = "models/scaler.pkl"
-    
-    # Load Model
-    try:
-        model = load_model_from_h5(model_path)
-    except FileNotFoundError:
-        return {"error": "Model not found. Please train the model first."}
-    
-    # Load Scaler
-    try:
-        with open(scaler_path, "rb") as f:
-            scaler = pickle.load(f)
-    except FileNotFoundError:
-        return {"error": "Scaler not found. Please train the model first."}
+    artifacts, error = load_artifacts()
+    if error:
+        return error
 
     # Load and Preprocess Image
     if not os.path.exists(image_path):
         return {"error": "Image file not found."}
         
     try:
-        img = cv2.imread(image_path)
+        img = load_image(image_path, artifacts)
         if img is None:
             return {"error": "Failed to read image."}
-            
-        img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-        
-        # Face Detection & Cropping with Fallback
-        # CRITICAL FIX: Training was done on FULL IMAGES (use_face_detection=False).
-        # We must disable crop to match training distribution.
-        # cropped = detect_and_crop_face(img)
-        # if cropped is not None and cropped.size > 0:
-        #     img = cropped
-        # else:
-        #     pass 
-        pass
-        
-        img = cv2.resize(img, (128, 128))
     except Exception as e:
         return {"error": f"Error preprocessing image: {str(e)}"}
         
     # Extract Features
     try:
-        features = extract_features(img)
+        features = artifacts.extract_features(img)
         # Reshape for XGBoost (1, n_features)
         features = features.reshape(1, -1)
-        
-        # Safety Check: Feature Dimension Mismatch
-        if features.shape[1] != scaler.mean_.shape[0]:
-            raise ValueError(f"Feature dimension mismatch: Expected {scaler.mean_.shape[0]}, got {features.shape[1]}")
-        
-        # Normalize
-        features = scaler.transform(features)
-        
-        dtest = xgb.DMatrix(features)
     except Exception as e:
         return {"error": f"Error extracting features: {str(e)}"}
         
     # Predict
     try:
-        prob = model.predict(dtest)[0]
-        
-        # Strict Threshold Correction: 0.42
-        THRESHOLD = 0.42
-        label = "AI-GENERATED" if prob > THRESHOLD else "REAL"
-        confidence = float(prob) if prob > THRESHOLD else float(1 - prob)
-        
-        return {
-            "label": label,
-            "confidence": confidence
-        }
+        prob = score_features(artifacts, features)[0]
+        return label_result(prob)
     except Exception as e:
         return {"error": f"Prediction error: {str(e)}"}
 
+def predict_directory(directory, batch_size=256):
+    """
+    Score every image in a directory. The model and scaler are loaded once and
+    images are featurized (extract_features_batch) and scored batch_size at a
+    time with a single booster call each.
+    Returns a list of (filename, result dict) in filename order.
+    """
+    artifacts, error = load_artifacts()
+    if error:
+        return [(directory, error)]
+    
+    names = sorted(n for n in os.listdir(directory) if n.lower().endswith(IMAGE_EXTENSIONS))
+    results = []
+    for start in range(0, len(names), batch_size):
+        batch_names, batch_images = [], []
+        for name in names[start:start + batch_size]:
+            try:
+                img = load_image(os.path.join(directory, name), artifacts)
+            except Exception:
+                img = None
+            if img is None:
+                results.append((name, {"error": "Failed to read image."}))
+                continue
+            batch_names.append(name)
+            batch_images.append(img)
+        
+        if batch_images:
+            # Preprocessed images share the spec's size, so they stack into one array
+            features = artifacts.extract_features_batch(np.stack(batch_images))
+            probs = score_features(artifacts, features)
+            results.extend((name, label_result(prob)) for name, prob in zip(batch_names, probs))
+        print(f"Scored {min(start + batch_size, len(names))}/{len(names)} images...", end='\r')
+    
+    print()
+    results.sort(key=lambda r: r[0])
+    return results
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Predict if a face is REAL or AI-GENERATED")
-    parser.add_argument("--image", type=str, required=True, help="Path to the face image")
+    group = parser.add_mutually_exclusive_group(required=True)
+    group.add_argument("--image", type=str, help="Path to the face image")
+    group.add_argument("--dir", type=str, help="Score every image in this directory")
+    parser.add_argument("--batch-size", type=int, default=256, help="Images per booster call with --dir")
     args = parser.parse_args()
     
-    result = predict_face(args.image)
-    print(result)
+    if args.dir:
+        for name, result in predict_directory(args.dir, args.batch_size):
+            print(f"{name}: {result}")
+    else:
+        result = predict_face(args.image)
+        print(result)
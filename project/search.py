@@ -0,0 +1,262 @@
+import os
+import csv
+import time
+import argparse
+import itertools
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import cv2
+import numpy as np
+import xgboost as xgb
+from sklearn.preprocessing import StandardScaler
+from sklearn.metrics import roc_auc_score, roc_curve
+from data_loader import load_dataset, WORKER_CV2_THREADS
+
+# Shared-matrix directory and leaderboard defaults
+SEARCH_DIR = os.path.join("cache", "search")
+LEADERBOARD_PATH = "plots/search_leaderboard.csv"
+
+# Booster grid (every combination is one candidate)
+PARAM_GRID = {
+    'max_depth': [4, 6, 8],
+    'learning_rate': [0.05, 0.1],
+    'colsample_bytree': [0.5, 0.8],
+    'min_child_weight': [1, 5]
+}
+NUM_BOOST_ROUND = 300
+EARLY_STOPPING_ROUNDS = 10
+
+# Hybrid-rule grid, same rule as apply_hybrid_logic in web-app/ml_service/main.py:
+# AI if var < abs_var, or (var < smooth_var and prob > prob_floor), or prob > threshold
+HYBRID_GRID = {
+    'abs_var': [0, 50, 100, 150, 200],
+    'smooth_var': [0, 200, 350, 500, 750],
+    'prob_floor': [0.1, 0.2, 0.3]
+}
+THRESHOLD_GRID = np.round(np.arange(0.20, 0.81, 0.02), 2)
+
+# Share of the validation images held out from all fitting (early stopping,
+# threshold, hybrid grid); the leaderboard is scored and sorted on them only
+HOLDOUT_FRACTION = 0.5
+SPLIT_SEED = 42
+
+# Per-process views of the shared matrices, opened once by the pool initializer
+_shared = None
+
+def _init_worker(paths):
+    global _shared
+    cv2.setNumThreads(WORKER_CV2_THREADS)
+    _shared = {name: np.load(path, mmap_mode="r") for name, path in paths.items()}
+
+def laplacian_variance(path):
+    """
+    Laplacian variance of an image file, computed exactly like the ML service
+    (full-resolution grayscale). Returns NaN if the file cannot be read.
+    """
+    img = cv2.imread(path)
+    if img is None:
+        return float("nan")
+    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    return cv2.Laplacian(gray, cv2.CV_64F).var()
+
+def _laplacian_batch(paths):
+    return np.array([laplacian_variance(p) for p in paths])
+
+def share_matrix(path, X):
+    """
+    Write X as a float32 .npy that workers memory-map instead of receiving a copy.
+    """
+    out = np.lib.format.open_memmap(path, mode="w+", dtype=np.float32, shape=X.shape)
+    out[:] = X
+    out.flush()
+    return path
+
+def split_tune_holdout(y, holdout=HOLDOUT_FRACTION, seed=SPLIT_SEED):
+    """
+    Stratified, seeded split of the validation rows into (tune, holdout) index arrays.
+    """
+    rng = np.random.default_rng(seed)
+    tune, held = [], []
+    for label in np.unique(y):
+        idx = rng.permutation(np.flatnonzero(y == label))
+        n_held = int(round(len(idx) * holdout))
+        held.append(idx[:n_held])
+        tune.append(idx[n_held:])
+    return np.sort(np.concatenate(tune)), np.sort(np.concatenate(held))
+
+def candidate_grid(grid=PARAM_GRID):
+    keys = list(grid)
+    return [dict(zip(keys, values)) for values in itertools.product(*(grid[k] for k in keys))]
+
+def _run_candidate(candidate_id, params, nthread):
+    """
+    Train one configuration on the shared matrices and measure it. Early
+    stopping uses the tune rows; AUC and latency are measured on the holdout rows.
+    Returns (candidate_id, metrics dict, tune probabilities, holdout probabilities).
+    """
+    X_train, y_train = _shared["X_train"], _shared["y_train"]
+    X_tune, y_tune = _shared["X_tune"], _shared["y_tune"]
+    X_holdout, y_holdout = _shared["X_holdout"], _shared["y_holdout"]
+
+    full_params = {
+        'objective': 'binary:logistic',
+        'eval_metric': 'logloss',
+        'tree_method': 'hist',
+        'subsample': 0.8,
+        'reg_alpha': 0.1,
+        'reg_lambda': 1.0,
+        'scale_pos_weight': float(np.sum(y_train == 0) / max(1, np.sum(y_train == 1))),
+        'random_state': 42,
+        'nthread': nthread,
+        **params
+    }
+
+    start = time.perf_counter()
+    dtrain = xgb.QuantileDMatrix(X_train, label=y_train, nthread=nthread)
+    dtune = xgb.QuantileDMatrix(X_tune, label=y_tune, ref=dtrain, nthread=nthread)
+    model = xgb.train(full_params, dtrain, num_boost_round=NUM_BOOST_ROUND, evals=[(dtune, 'tune')],
+                      early_stopping_rounds=EARLY_STOPPING_ROUNDS, verbose_eval=False)
+    train_s = time.perf_counter() - start
+
+    probs_tune = model.inplace_predict(X_tune)
+    probs = model.inplace_predict(X_holdout)
+
+    # Inference latency: one image at a time, and a whole batch
+    row = np.ascontiguousarray(X_holdout[:1])
+    n_single = 50
+    start = time.perf_counter()
+    for _ in range(n_single):
+        model.inplace_predict(row)
+    single_ms = (time.perf_counter() - start) / n_single * 1000
+    start = time.perf_counter()
+    model.inplace_predict(X_holdout)
+    batch_us = (time.perf_counter() - start) / len(X_holdout) * 1e6
+
+    metrics = {
+        "rounds": model.best_iteration + 1,
+        "train_s": train_s,
+        "predict_ms_batch1": single_ms,
+        "predict_us_per_row": batch_us,
+        "model_kb": len(model.save_raw()) / 1024,
+        "auc": roc_auc_score(y_holdout, probs)
+    }
+    return candidate_id, metrics, probs_tune, probs
+
+def tune_hybrid(lap_var, probs, y, grid=HYBRID_GRID, thresholds=THRESHOLD_GRID):
+    """
+    Best hybrid-rule setting (by accuracy) for one candidate's probabilities.
+    """
+    best = None
+    # Model-only decision for every threshold at once: (T, N)
+    model_fake = probs[None, :] > thresholds[:, None]
+    for abs_var, smooth_var, prob_floor in itertools.product(grid['abs_var'], grid['smooth_var'], grid['prob_floor']):
+        rule_fake = (lap_var < abs_var) | ((lap_var < smooth_var) & (probs > prob_floor))
+        accuracy = np.mean((model_fake | rule_fake[None, :]) == y[None, :], axis=1)
+        i = int(np.argmax(accuracy))
+        if best is None or accuracy[i] > best["hybrid_accuracy"]:
+            best = {"hybrid_accuracy": float(accuracy[i]), "abs_var": abs_var, "smooth_var": smooth_var,
+                    "prob_floor": prob_floor, "threshold": float(thresholds[i])}
+    return best
+
+def hybrid_accuracy(lap_var, probs, y, setting):
+    """
+    Accuracy of one hybrid-rule setting (as returned by tune_hybrid).
+    """
+    fake = (lap_var < setting["abs_var"]) | ((lap_var < setting["smooth_var"]) & (probs > setting["prob_floor"])) | \
+        (probs > setting["threshold"])
+    return float(np.mean(fake == y))
+
+def youden_threshold(y, probs):
+    fpr, tpr, thresholds = roc_curve(y, probs)
+    return float(thresholds[np.argmax(tpr - fpr)])
+
+def search(max_samples=8000, valid_samples=2000, workers=None, base_dir=None, output=LEADERBOARD_PATH,
+           grid=PARAM_GRID, holdout=HOLDOUT_FRACTION):
+    """
+    Train every configuration in `grid` on a process pool, tune the hybrid
+    rule for each, and write the leaderboard (best holdout hybrid accuracy first).
+    The validation images are split into a tune part (early stopping, Youden
+    threshold, hybrid grid) and a holdout part that every reported metric and
+    the ranking use, so the leaderboard is not scored on what was fitted.
+    The scaled train/tune/holdout matrices are written once as .npy files and
+    memory-mapped by every worker.
+    """
+    workers = workers or os.cpu_count() or 1
+    nthread = max(1, (os.cpu_count() or 1) // workers)
+
+    # 1. Cached features (+ paths, for the Laplacian signal of the validation images)
+    X_train, y_train = load_dataset("train", max_samples=max_samples, use_face_detection=False, base_dir=base_dir)
+    X_valid, y_valid, valid_paths = load_dataset("valid", max_samples=valid_samples, use_face_detection=False,
+                                                 base_dir=base_dir, return_paths=True)
+    tune_idx, holdout_idx = split_tune_holdout(y_valid, holdout)
+    y_tune, y_holdout = y_valid[tune_idx], y_valid[holdout_idx]
+    print(f"Validation split: {len(tune_idx)} tune, {len(holdout_idx)} holdout images.")
+
+    # 2. Scale once and share through memory-mapped files
+    os.makedirs(SEARCH_DIR, exist_ok=True)
+    scaler = StandardScaler().fit(X_train)
+    mean, scale = scaler.mean_.astype(np.float32), scaler.scale_.astype(np.float32)
+    shared = {
+        "X_train": share_matrix(os.path.join(SEARCH_DIR, "X_train.npy"), (np.asarray(X_train, dtype=np.float32) - mean) / scale),
+        "X_tune": share_matrix(os.path.join(SEARCH_DIR, "X_tune.npy"), (X_valid[tune_idx].astype(np.float32) - mean) / scale),
+        "X_holdout": share_matrix(os.path.join(SEARCH_DIR, "X_holdout.npy"), (X_valid[holdout_idx].astype(np.float32) - mean) / scale)
+    }
+    for name, y in (("y_train", y_train), ("y_tune", y_tune), ("y_holdout", y_holdout)):
+        shared[name] = os.path.join(SEARCH_DIR, f"{name}.npy")
+        np.save(shared[name], y)
+    del X_train, X_valid
+
+    candidates = candidate_grid(grid)
+    print(f"Searching {len(candidates)} configurations on {workers} workers ({nthread} threads each)...")
+
+    rows = []
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(shared,)) as executor:
+        # Laplacian variances are computed on the same pool while the first boosters train
+        lap_future = executor.submit(_laplacian_batch, valid_paths)
+        futures = [executor.submit(_run_candidate, i, params, nthread) for i, params in enumerate(candidates)]
+        lap_var = lap_future.result()
+        lap_tune, lap_holdout = lap_var[tune_idx], lap_var[holdout_idx]
+
+        for done, future in enumerate(as_completed(futures), 1):
+            candidate_id, metrics, probs_tune, probs = future.result()
+            # Fitted on the tune rows, scored on the holdout rows
+            threshold = youden_threshold(y_tune, probs_tune)
+            row = {"candidate": candidate_id, **candidates[candidate_id], **metrics,
+                   "youden_threshold": threshold,
+                   "model_accuracy": float(np.mean((probs > threshold) == y_holdout))}
+            setting = tune_hybrid(lap_tune, probs_tune, y_tune)
+            row["tune_hybrid_accuracy"] = setting.pop("hybrid_accuracy")
+            row.update(setting)
+            row["hybrid_accuracy"] = hybrid_accuracy(lap_holdout, probs, y_holdout, setting)
+            rows.append(row)
+            print(f"[{done}/{len(candidates)}] candidate {candidate_id}: AUC {metrics['auc']:.4f}, "
+                  f"hybrid acc {row['hybrid_accuracy']:.4f}, {metrics['train_s']:.1f}s")
+
+    rows.sort(key=lambda r: (-r["hybrid_accuracy"], -r["auc"], r["predict_ms_batch1"]))
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=list(rows[0]))
+        writer.writeheader()
+        writer.writerows(rows)
+    print(f"Leaderboard written to {output}")
+    return rows
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Parallel XGBoost + hybrid-threshold search over cached features")
+    parser.add_argument("--max-samples", type=int, default=8000, help="Training images (0 = whole split)")
+    parser.add_argument("--valid-samples", type=int, default=2000, help="Validation images used for tuning and scoring")
+    parser.add_argument("--holdout", type=float, default=HOLDOUT_FRACTION,
+                        help="Share of the validation images held out from tuning; the leaderboard is scored on them")
+    parser.add_argument("--workers", type=int, default=None, help="Parallel candidates (default: all cores)")
+    parser.add_argument("--data-dir", type=str, default=None, help="Dataset root (default: data_loader.BASE_DIR)")
+    parser.add_argument("--output", type=str, default=LEADERBOARD_PATH)
+    args = parser.parse_args()
+
+    rows = search(args.max_samples or None, args.valid_samples or None, args.workers, args.data_dir, args.output,
+                  holdout=args.holdout)
+    best = rows[0]
+    print(f"\nBest: candidate {best['candidate']} "
+          f"(max_depth={best['max_depth']}, lr={best['learning_rate']}, colsample={best['colsample_bytree']}, "
+          f"min_child_weight={best['min_child_weight']}, {best['rounds']} rounds)")
+    print(f"  Hybrid: Var < {best['abs_var']} | Var < {best['smooth_var']} and prob > {best['prob_floor']} | "
+          f"prob > {best['threshold']:.2f} -> holdout accuracy {best['hybrid_accuracy']:.4f} "
+          f"(tune {best['tune_hybrid_accuracy']:.4f}; model alone {best['model_accuracy']:.4f}, AUC {best['auc']:.4f})")
@@ -3,24 +3,338 @@ import numpy as np
 import h5py
 import pickle
 import os
+import sys
+import json
+import time
+import argparse
+import re
+import ast
+import shutil
+import threading
+try:
+    import resource
+except ImportError:  # Windows: peak RSS is not reported
+    resource = None
 from sklearn.preprocessing import StandardScaler
-from data_loader import load_dataset
+from sklearn.metrics import roc_auc_score
+import data_loader
+from data_loader import load_dataset, load_new_images, split_manifest
+import feature_extraction
+from feature_extraction import FeatureMask, extract_features, extract_features_masked
+from model_registry import save_scaler_stats, ModelRegistry
+from feature_spec import FeatureSpec
+from compiled_predictor import CompiledPredictor, compiled_path
 
-def train_model():
+class ScaledChunkIter(xgb.DataIter):
+    """
+    Feeds a (memory-mapped) feature matrix to XGBoost chunk by chunk, scaling each
+    chunk on the fly, so the scaled training matrix never exists in RAM.
+    With a cache_prefix XGBoost builds an external-memory DMatrix from it.
+    """
+    def __init__(self, X, y, scaler, chunk_size, cache_prefix=None):
+        self.X = X
+        self.y = y
+        self.scaler = scaler
+        self.chunk_size = chunk_size
+        self._pos = 0
+        super().__init__(cache_prefix=cache_prefix)
+
+    def next(self, input_data):
+        if self._pos >= len(self.X):
+            return False
+        end = min(self._pos + self.chunk_size, len(self.X))
+        chunk = self.scaler.transform(self.X[self._pos:end]).astype(np.float32)
+        input_data(data=chunk, label=self.y[self._pos:end])
+        self._pos = end
+        return True
+
+    def reset(self):
+        self._pos = 0
+
+# How often StageTimer samples the resident set size
+RSS_SAMPLE_SECONDS = 0.05
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+def current_rss_mb(pid="self"):
+    """
+    Resident set size of a process right now, from /proc (Linux); None elsewhere.
+    """
+    try:
+        with open(f"/proc/{pid}/statm") as f:
+            return int(f.read().split()[1]) * PAGE_SIZE / (1024 * 1024)
+    except (OSError, ValueError, IndexError):
+        return None
+
+def children_rss_mb():
+    """
+    Summed current RSS of this process's live children (e.g. loader workers).
+    """
+    me = str(os.getpid())
+    total = 0.0
+    for pid in os.listdir("/proc"):
+        if not pid.isdigit():
+            continue
+        try:
+            with open(f"/proc/{pid}/stat") as f:
+                # The command name may contain spaces; the ppid follows ")"
+                ppid = f.read().rsplit(")", 1)[1].split()[1]
+        except (OSError, IndexError):
+            continue
+        if ppid == me:
+            total += current_rss_mb(pid) or 0.0
+    return total
+
+class StageTimer:
+    """
+    Wall time and peak RSS of consecutive training stages.
+    start() ends the previous stage; report() prints the table.
+    On Linux a background thread samples the current RSS of the process and
+    the summed RSS of its live children (loader workers) every
+    RSS_SAMPLE_SECONDS, so each row is the peak reached during that stage.
+    Elsewhere only the lifetime high-water mark (ru_maxrss) is available; the
+    columns are then cumulative process peaks and are labelled as such.
+    """
+    def __init__(self):
+        self.stages = []
+        self._current = None
+        self._sampler = None
+        self.sampled = current_rss_mb() is not None
+
+    @staticmethod
+    def max_rss_mb():
+        if resource is None:
+            return None
+        # ru_maxrss is in KB on Linux and in bytes on macOS
+        unit = 1024 * 1024 if sys.platform == "darwin" else 1024
+        own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / unit
+        children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / unit
+        return own, children
+
+    def _sample(self, stop, peak):
+        while True:
+            peak[0] = max(peak[0], current_rss_mb() or 0.0)
+            peak[1] = max(peak[1], children_rss_mb())
+            if stop.wait(RSS_SAMPLE_SECONDS):
+                return
+
+    def start(self, name):
+        self.stop()
+        print(f"[stage] {name}")
+        peak = None
+        if self.sampled:
+            peak = [0.0, 0.0]
+            stop = threading.Event()
+            thread = threading.Thread(target=self._sample, args=(stop, peak), daemon=True)
+            thread.start()
+            self._sampler = (thread, stop)
+        self._current = (name, time.perf_counter(), peak)
+
+    def stop(self):
+        if self._current is None:
+            return
+        name, started, peak = self._current
+        seconds = time.perf_counter() - started
+        if self._sampler is not None:
+            thread, stop = self._sampler
+            stop.set()
+            thread.join()
+            self._sampler = None
+            rss = tuple(peak)
+        else:
+            rss = self.max_rss_mb()
+        self.stages.append((name, seconds, rss))
+        self._current = None
+
+    def report(self):
+        self.stop()
+        if self.sampled:
+            print(f"\n{'stage':<28} {'wall s':>8} {'peak RSS MB':>12} {'workers MB':>10}")
+        else:
+            print(f"\n{'stage':<28} {'wall s':>8} {'max RSS MB*':>12} {'child MB*':>10}")
+        for name, seconds, rss in self.stages:
+            own, children = rss if rss is not None else ("n/a", "n/a")
+            fmt = (lambda v: f"{v:.0f}") if rss is not None else str
+            print(f"{name:<28} {seconds:>8.2f} {fmt(own):>12} {fmt(children):>10}")
+        print(f"{'total':<28} {sum(s for _, s, _ in self.stages):>8.2f}")
+        if not self.sampled:
+            print("* cumulative process high-water marks (ru_maxrss), not per-stage peaks")
+
+# Dataset in the model .h5 listing every training image that existed when the
+# model (or its incremental parent) was trained; later images are new data
+TRAIN_MANIFEST = "train_manifest"
+
+def save_train_manifest(f, paths):
+    f.create_dataset(TRAIN_MANIFEST, data=np.array(sorted(paths), dtype=h5py.string_dtype()))
+
+def load_train_manifest(model_path):
+    """
+    Set of image paths recorded with a model, or None for models saved without one.
+    """
+    with h5py.File(model_path, 'r') as f:
+        if TRAIN_MANIFEST not in f:
+            return None
+        return set(f[TRAIN_MANIFEST].asstr()[()])
+
+def scale_float32(X, scaler):
+    """
+    Standardized float32 copy of X without a float64 intermediate.
+    """
+    out = np.array(X, dtype=np.float32)
+    out -= scaler.mean_.astype(np.float32)
+    out /= scaler.scale_.astype(np.float32)
+    return out
+
+def fit_scaler_chunked(X, chunk_size):
+    """
+    StandardScaler fitted with partial_fit over row chunks of X.
+    """
+    scaler = StandardScaler()
+    for start in range(0, len(X), chunk_size):
+        scaler.partial_fit(X[start:start + chunk_size])
+    return scaler
+
+def used_features(model):
+    """
+    Sorted indices of the features the booster splits on at least once.
+    """
+    return np.array(sorted(int(name[1:]) for name in model.get_score(importance_type='weight')), dtype=np.int64)
+
+def compact_booster(model, used):
+    """
+    The same trees rewritten to read a compacted feature vector X[:, used].
+    Split features are renumbered, so predictions are identical.
+    """
+    remap = {int(old): new for new, old in enumerate(used)}
+    doc = json.loads(model.save_raw("json"))
+    learner = doc["learner"]
+    for tree in learner["gradient_booster"]["model"]["trees"]:
+        children = tree["left_children"]
+        tree["split_indices"] = [remap[f] if children[i] != -1 else 0
+                                 for i, f in enumerate(tree["split_indices"])]
+        tree["tree_param"]["num_feature"] = str(len(used))
+    learner["learner_model_param"]["num_feature"] = str(len(used))
+    for key in ("feature_names", "feature_types"):
+        if learner.get(key):
+            learner[key] = [learner[key][i] for i in used]
+    
+    compact = xgb.Booster()
+    compact.load_model(bytearray(json.dumps(doc).encode("utf-8")))
+    return compact
+
+def top_features(model, n):
+    """
+    Sorted indices of the n features with the highest total split gain.
+    """
+    gain = model.get_score(importance_type='total_gain')
+    ranked = sorted(gain, key=gain.get, reverse=True)[:n]
+    return np.array(sorted(int(name[1:]) for name in ranked), dtype=np.int64)
+
+def save_compact_model(model, scaler, X_valid, y_valid, params, best_thresh,
+                       model_path="models/face_real_vs_ai_model_compact.h5", spec=None,
+                       top=None, X_train=None, y_train=None, manifest=None):
+    """
+    Write a compact model that only takes the features the booster uses, with
+    the feature mask and the matching scaler stats. X_valid is the scaled
+    validation matrix, used to check the compact model against the full one.
+    By default the same trees are kept (identical predictions). With top=N only
+    the N features with the highest total gain are kept and a new booster is
+    trained on them from the scaled X_train; fewer HOG blocks then need computing.
+    """
+    if top:
+        used = top_features(model, top)
+        dtrain = xgb.DMatrix(np.ascontiguousarray(X_train[:, used]), label=y_train)
+        dvalid = xgb.DMatrix(np.ascontiguousarray(X_valid[:, used]), label=y_valid)
+        compact = xgb.train(params, dtrain, num_boost_round=100, evals=[(dvalid, 'valid')],
+                            verbose_eval=False, early_stopping_rounds=10)
+    else:
+        used = used_features(model)
+        compact = compact_booster(model, used)
+    spec = spec or FeatureSpec.current()
+    image_size = spec.image_size
+    mask = FeatureMask(used, image_size)
+    print(f"Compact model: {len(used)}/{X_valid.shape[1]} features used, "
+          f"{len(mask.hog_blocks)} HOG blocks, groups: {[name for name, _ in mask.groups]}")
+    
+    # Without top=N these are the same trees on the selected columns: AUC must not move
+    full_auc = roc_auc_score(y_valid, model.predict(xgb.DMatrix(X_valid)))
+    compact_auc = roc_auc_score(y_valid, compact.inplace_predict(np.ascontiguousarray(X_valid[:, used])))
+    print(f"Validation AUC: full {full_auc:.4f} | compact {compact_auc:.4f}")
+    
+    # Extraction cost of the full vs masked extractor on a sample image
+    sample = np.random.default_rng(0).integers(0, 256, (image_size[1], image_size[0], 3), dtype=np.uint8)
+    timings = []
+    for extract in (extract_features, lambda img: extract_features_masked(img, mask)):
+        start = time.perf_counter()
+        for _ in range(20):
+            extract(sample)
+        timings.append((time.perf_counter() - start) / 20 * 1000)
+    print(f"Extraction per image: full {timings[0]:.2f} ms | masked {timings[1]:.2f} ms")
+    
+    model_bytes = compact.save_raw()
+    with h5py.File(model_path, 'w') as f:
+        f.create_dataset('model_bytes', data=np.void(model_bytes))
+        f.create_dataset('feature_mask', data=used)
+        f.attrs['feature_size'] = len(used)
+        f.attrs['full_feature_size'] = X_valid.shape[1]
+        f.attrs['feature_version'] = feature_extraction.FEATURE_VERSION
+        f.attrs['image_size'] = list(image_size)
+        f.attrs['feature_spec'] = spec.to_json()
+        f.attrs['label_mapping'] = str({0: 'REAL', 1: 'AI-GENERATED'})
+        f.attrs['config'] = str(params)
+        f.attrs['best_threshold'] = float(best_thresh)
+        f.attrs['trained_at'] = time.time()
+        f.attrs['model_version'] = 1
+        save_scaler_stats(f, scaler, columns=used)
+        if manifest is not None:
+            save_train_manifest(f, manifest)
+    print(f"Compact model saved to {model_path} ({len(model_bytes) / 1024:.0f} KB booster)")
+    CompiledPredictor.from_booster(compact).save(compiled_path(model_path))
+
+def train_model(max_samples=8000, streaming=False, chunk_size=8192, compact=False, compact_top=None,
+                quantile=False, nthread=None, max_bin=256):
+    """
+    quantile=True trains from float32 inputs through a QuantileDMatrix (an
+    ExtMemQuantileDMatrix when streaming) with tree_method='hist', max_bin bins
+    and nthread threads (default: all cores).
+    """
+    timer = StageTimer()
+    nthread = nthread or os.cpu_count() or 1
+    # Feature pipeline of this run; stored with the model so inference reproduces it
+    spec = FeatureSpec.current(image_size=(128, 128), use_face_detection=False)
+    
     # Load data
-    display_limit = 8000
-    print(f"Loading data (limit={display_limit} per class)...")
-    X_train, y_train = load_dataset("train", max_samples=8000, use_face_detection=False)
-    X_valid, y_valid = load_dataset("valid", max_samples=2000, use_face_detection=False)
+    print(f"Loading data (limit={max_samples or 'all'} samples)...")
+    timer.start("Load train features")
+    # Every image in the split now; --incremental treats anything else as new
+    manifest = split_manifest("train")
+    if streaming:
+        # Keep the training matrix on disk (memmap) instead of in RAM
+        os.makedirs("cache", exist_ok=True)
+        X_train, y_train = load_dataset("train", image_size=spec.image_size, max_samples=max_samples,
+                                        use_face_detection=spec.use_face_detection,
+                                        mmap_path="cache/train_features.npy")
+    else:
+        X_train, y_train = load_dataset("train", image_size=spec.image_size, max_samples=max_samples,
+                                        use_face_detection=spec.use_face_detection)
+    timer.start("Load valid features")
+    X_valid, y_valid = load_dataset("valid", image_size=spec.image_size, max_samples=2000,
+                                    use_face_detection=spec.use_face_detection)
     
     print(f"Training data shape: {X_train.shape}")
     print(f"Validation data shape: {X_valid.shape}")
     
     # 1. Feature Normalization (StandardScaler)
     print("Normalizing features...")
-    scaler = StandardScaler()
-    X_train = scaler.fit_transform(X_train)
-    X_valid = scaler.transform(X_valid)
+    timer.start("Fit scaler")
+    if streaming:
+        scaler = fit_scaler_chunked(X_train, chunk_size)
+    elif quantile:
+        scaler = StandardScaler().fit(X_train)
+        X_train = scale_float32(X_train, scaler)
+    else:
+        scaler = StandardScaler()
+        X_train = scaler.fit_transform(X_train)
+    X_valid = scale_float32(X_valid, scaler) if quantile else scaler.transform(X_valid)
     
     # Save Scaler
     os.makedirs("models", exist_ok=True)
@@ -34,7 +348,7 @@ def train_model():
     # MANDATORY CHECK: Ensure both classes are present
     assert num_real > 0 and num_fake > 0, "Training data MUST contain both REAL and FAKE classes"
     
-    scale_pos_weight = num_real / num_fake
+    scale_pos_weight = float(num_real / num_fake)
     print(f"Class balance: Real={num_real}, Fake={num_fake}, weight={scale_pos_weight:.2f}")
 
     # 3. XGBoost Hyperparameters (Optimized)
@@ -53,14 +367,33 @@ def train_model():
     }
     
     # Create DMatrix
-    dtrain = xgb.DMatrix(X_train, label=y_train)
-    dvalid = xgb.DMatrix(X_valid, label=y_valid)
+    timer.start("Build DMatrix")
+    if quantile:
+        # Histogram-only matrices: features are quantized once into max_bin bins
+        params.update({'tree_method': 'hist', 'max_bin': max_bin, 'nthread': nthread})
+        if streaming:
+            dtrain = xgb.ExtMemQuantileDMatrix(ScaledChunkIter(X_train, y_train, scaler, chunk_size,
+                                                               cache_prefix=os.path.join("cache", "xgb_train")),
+                                               max_bin=max_bin, nthread=nthread)
+        else:
+            dtrain = xgb.QuantileDMatrix(X_train, label=y_train, max_bin=max_bin, nthread=nthread)
+        dvalid = xgb.QuantileDMatrix(X_valid, label=y_valid, ref=dtrain, nthread=nthread)
+    elif streaming:
+        # External-memory DMatrix built from scaled chunks (requires the hist tree method)
+        params['tree_method'] = 'hist'
+        dtrain = xgb.DMatrix(ScaledChunkIter(X_train, y_train, scaler, chunk_size,
+                                             cache_prefix=os.path.join("cache", "xgb_train")))
+        dvalid = xgb.DMatrix(X_valid, label=y_valid)
+    else:
+        dtrain = xgb.DMatrix(X_train, label=y_train)
+        dvalid = xgb.DMatrix(X_valid, label=y_valid)
     
     # Watchlist for monitoring
     watchlist = [(dtrain, 'train'), (dvalid, 'valid')]
     
     # Train with Early Stopping
     print("Starting training (v2 - Fixed Pipeline)...")
+    timer.start("Train booster")
     evals_result = {}
     model = xgb.train(
         params,
@@ -73,6 +406,7 @@ def train_model():
     )
     
     # --- POST-TRAINING CHECKS ---
+    timer.start("Validate + threshold")
     print("\n--- Post-Training Diagnostic ---")
     val_probs = model.predict(dvalid)
     print(f"Validation Probability Stats: Min={val_probs.min():.4f}, Max={val_probs.max():.4f}, Mean={val_probs.mean():.4f}")
@@ -93,6 +427,7 @@ def train_model():
     os.makedirs("plots", exist_ok=True)
     
     # Save Model to H5
+    timer.start("Save artifacts")
     model_path = "models/face_real_vs_ai_model.h5"
     print(f"Saving model to {model_path}...")
     
@@ -101,16 +436,235 @@ def train_model():
     with h5py.File(model_path, 'w') as f:
         f.create_dataset('model_bytes', data=np.void(model_bytes))
         f.attrs['feature_size'] = X_train.shape[1]
+        f.attrs['feature_version'] = feature_extraction.FEATURE_VERSION
+        f.attrs['feature_spec'] = spec.to_json()
         f.attrs['label_mapping'] = str({0: 'REAL', 1: 'AI-GENERATED'})
         f.attrs['config'] = str(params)
         f.attrs['best_threshold'] = float(best_thresh) # Save threshold
+        f.attrs['trained_at'] = time.time()
+        f.attrs['model_version'] = 1
+        # Scaler stats travel with the model for the fused inference path
+        save_scaler_stats(f, scaler)
+        save_train_manifest(f, manifest)
     
     # Save training history for plot generation
     history_path = "models/training_history.pkl"
     with open(history_path, 'wb') as f:
         pickle.dump(evals_result, f)
+    
+    # NumPy flattened-tree predictor for ML_PREDICTOR=compiled
+    timer.start("Export compiled predictor")
+    export_path = compiled_path(model_path)
+    CompiledPredictor.from_booster(model).save(export_path)
+    print(f"Compiled predictor saved to {export_path}")
+    
+    if compact:
+        timer.start("Compact model")
+        save_compact_model(model, scaler, X_valid, y_valid, params, best_thresh,
+                           spec=spec, top=compact_top, X_train=X_train, y_train=y_train, manifest=manifest)
         
     print("Training complete. Artifacts and Threshold saved.")
+    timer.report()
+
+def versioned_path(model_path, version):
+    """
+    models/face_real_vs_ai_model.h5 -> models/face_real_vs_ai_model.v<version>.h5
+    """
+    root, ext = os.path.splitext(model_path)
+    return f"{root}.v{version}{ext}"
+
+def saved_params(attrs):
+    """
+    XGBoost params a model was trained with (attr 'config', a printed dict).
+    Older models print NumPy scalars as np.float64(...); those are unwrapped.
+    """
+    if 'config' not in attrs:
+        return {}
+    return ast.literal_eval(re.sub(r"np\.\w+\(([^()]*)\)", r"\1", attrs['config']))
+
+def save_incremental_model(base_path, model, output, attrs, manifest):
+    """
+    Copy of the base artifact (scaler stats, feature mask, attrs) with a new
+    booster, updated attrs and training manifest, written to `output`.
+    """
+    with h5py.File(base_path, 'r') as src, h5py.File(output, 'w') as dst:
+        for name in src:
+            if name not in ('model_bytes', TRAIN_MANIFEST):
+                src.copy(name, dst)
+        dst.attrs.update(dict(src.attrs))
+        dst.attrs.update(attrs)
+        dst.create_dataset('model_bytes', data=np.void(model.save_raw()))
+        save_train_manifest(dst, manifest)
+
+def train_incremental(model_path="models/face_real_vs_ai_model.h5", scaler_path="models/scaler.pkl",
+                      rounds=20, holdout=0.2, promote_holdout=0.2, valid_samples=2000, min_new=100,
+                      promote=True):
+    """
+    Continue boosting the saved model on the training images that are not in
+    its training manifest (the split listing saved with it), instead of
+    retraining from scratch. Models saved without a manifest fall back to the
+    images modified after they were trained (attr 'trained_at'). The model's
+    scaler and feature spec are kept, so new trees see exactly the inputs the
+    old ones were built on.
+    
+    The new samples and `valid_samples` validation images are split three ways:
+    boosting, a `holdout` slice (plus half the validation images) for early
+    stopping and the threshold, and a `promote_holdout` slice (plus the other
+    half) that only decides promotion. The result is written as <model>.v<N>.h5
+    with the new images added to its manifest and, with promote=True and no AUC
+    loss on the promotion slice, replaces model_path (POST /reload picks it up).
+    """
+    timer = StageTimer()
+    
+    timer.start("Load base model")
+    artifacts = ModelRegistry(model_path, scaler_path).get()
+    attrs = artifacts.attrs
+    spec = artifacts.spec
+    manifest = load_train_manifest(model_path)
+    # Models without 'trained_at' predate it; their file time is the best estimate
+    trained_at = float(attrs.get('trained_at', os.path.getmtime(model_path)))
+    version = int(attrs.get('model_version', 1))
+    params = saved_params(attrs)
+    print(f"Base model v{version}: {artifacts.model.num_boosted_rounds()} trees, spec {spec.digest}, "
+          + (f"manifest of {len(manifest)} images" if manifest is not None else "no manifest"))
+    
+    def model_inputs(X):
+        # Full cached vectors -> the columns a compact model takes, standardized like training
+        if artifacts.feature_mask is not None:
+            X = np.asarray(X)[:, artifacts.feature_mask.indices]
+        return artifacts.scale(X)
+    
+    # New samples are extracted and cached with the base model's feature pipeline
+    timer.start("Load new features")
+    feature_extraction.set_feature_version(spec.feature_version)
+    if manifest is None:
+        # Everything listed now that is not new becomes the manifest of the update
+        manifest = set(split_manifest("train"))
+        X_new, y_new, new_paths = load_new_images("train", since=trained_at, image_size=spec.image_size,
+                                                  use_face_detection=spec.use_face_detection)
+    else:
+        X_new, y_new, new_paths = load_new_images("train", known=manifest, image_size=spec.image_size,
+                                                  use_face_detection=spec.use_face_detection)
+    if len(y_new) < min_new:
+        print(f"Only {len(y_new)} new samples (minimum {min_new}); keeping the current model.")
+        timer.report()
+        return None
+    
+    # Held-out slices of the new data (it may be distributed differently from the old corpus):
+    # one for early stopping and the threshold, one only for the promotion decision
+    order = np.random.default_rng(42).permutation(len(y_new))
+    n_eval = int(round(holdout * len(y_new)))
+    n_promo = int(round(promote_holdout * len(y_new)))
+    evl, promo, fit = (np.sort(order[:n_eval]), np.sort(order[n_eval:n_eval + n_promo]),
+                       np.sort(order[n_eval + n_promo:]))
+    X_fit, y_fit = model_inputs(X_new[fit]), y_new[fit]
+    
+    timer.start("Load valid features")
+    X_valid, y_valid = load_dataset("valid", image_size=spec.image_size, max_samples=valid_samples,
+                                    use_face_detection=spec.use_face_detection)
+    valid_order = np.random.default_rng(43).permutation(len(y_valid))
+    valid_evl, valid_promo = np.sort(valid_order[:len(y_valid) // 2]), np.sort(valid_order[len(y_valid) // 2:])
+    X_eval = np.vstack([model_inputs(X_new[evl]), model_inputs(X_valid[valid_evl])])
+    y_eval = np.concatenate([y_new[evl], y_valid[valid_evl]])
+    X_promo = np.vstack([model_inputs(X_new[promo]), model_inputs(X_valid[valid_promo])])
+    y_promo = np.concatenate([y_new[promo], y_valid[valid_promo]])
+    print(f"New samples: {len(y_fit)} for boosting, {n_eval} for early stopping (+{len(valid_evl)} validation), "
+          f"{n_promo} for promotion (+{len(valid_promo)} validation)")
+    
+    timer.start("Train booster")
+    num_real, num_fake = np.sum(y_fit == 0), np.sum(y_fit == 1)
+    if num_real > 0 and num_fake > 0:
+        params['scale_pos_weight'] = float(num_real / num_fake)
+    print(f"Class balance of new data: Real={num_real}, Fake={num_fake}")
+    
+    dtrain = xgb.DMatrix(X_fit, label=y_fit)
+    deval = xgb.DMatrix(X_eval, label=y_eval)
+    evals_result = {}
+    model = xgb.train(params, dtrain, num_boost_round=rounds, evals=[(dtrain, 'train'), (deval, 'holdout')],
+                      evals_result=evals_result, verbose_eval=5, early_stopping_rounds=5,
+                      xgb_model=artifacts.model)
+    
+    timer.start("Validate + threshold")
+    eval_probs = model.predict(deval)
+    # Promotion is judged on rows neither early stopping nor the threshold saw
+    base_auc = roc_auc_score(y_promo, artifacts.model.inplace_predict(X_promo))
+    new_auc = roc_auc_score(y_promo, model.inplace_predict(X_promo))
+    print(f"Promotion AUC: base v{version} {base_auc:.4f} | updated {new_auc:.4f} "
+          f"({model.num_boosted_rounds() - artifacts.model.num_boosted_rounds()} trees added)")
+    
+    # Calculate Optimal Threshold (Youden's J statistic) on the early-stopping set
+    from sklearn.metrics import roc_curve
+    fpr, tpr, thresholds = roc_curve(y_eval, eval_probs)
+    best_thresh = thresholds[np.argmax(tpr - fpr)]
+    print(f"Optimal Threshold (ROC): {best_thresh:.4f} (was {artifacts.threshold:.4f})")
+    
+    timer.start("Save artifacts")
+    output = versioned_path(model_path, version + 1)
+    save_incremental_model(model_path, model, output, {
+        'config': str(params),
+        'best_threshold': float(best_thresh),
+        'trained_at': time.time(),
+        'model_version': version + 1,
+        'parent_version': version,
+        'incremental_samples': len(y_fit)
+    }, manifest | set(new_paths))
+    CompiledPredictor.from_booster(model).save(compiled_path(output))
+    print(f"Model v{version + 1} saved to {output}")
+    
+    if not promote:
+        print(f"Not promoted; {model_path} still holds v{version}.")
+    elif new_auc < base_auc:
+        print(f"WARNING: promotion AUC dropped; {model_path} still holds v{version}.")
+    else:
+        # Copy next to the target, then rename: readers never see a half-written model
+        for src, dst in ((compiled_path(output), compiled_path(model_path)), (output, model_path)):
+            shutil.copyfile(src, dst + ".tmp")
+            os.replace(dst + ".tmp", dst)
+        print(f"Promoted v{version + 1} to {model_path}")
+    
+    timer.report()
+    return output
 
 if __name__ == "__main__":
-    train_model()
+    parser = argparse.ArgumentParser(description="Train the REAL vs AI-GENERATED XGBoost model")
+    parser.add_argument("--max-samples", type=int, default=8000, help="Training images to use (0 = whole split)")
+    parser.add_argument("--streaming", action="store_true",
+                        help="Keep features in a memmap and train from an external-memory DMatrix")
+    parser.add_argument("--chunk-size", type=int, default=8192, help="Rows per chunk in streaming mode")
+    parser.add_argument("--compact", action="store_true",
+                        help="Also save a compact model that only uses the features the booster splits on")
+    parser.add_argument("--quantile", action="store_true",
+                        help="Train from float32 QuantileDMatrix inputs with tree_method='hist'")
+    parser.add_argument("--nthread", type=int, default=None, help="XGBoost threads (default: all cores)")
+    parser.add_argument("--max-bin", type=int, default=256, help="Histogram bins per feature with --quantile")
+    parser.add_argument("--compact-top", type=int, default=None,
+                        help="With --compact: keep only the N highest-gain features and retrain on them")
+    parser.add_argument("--feature-version", type=int, default=feature_extraction.FEATURE_VERSION,
+                        choices=feature_extraction.FEATURE_VERSIONS,
+                        help="extract_features layout (2 adds the radial power spectrum)")
+    parser.add_argument("--packed-dir", type=str, default=data_loader.PACKED_DIR,
+                        help="Read splits packed by packed_dataset.py from here instead of the image folders")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Continue boosting the saved model on training images not in its training manifest")
+    parser.add_argument("--rounds", type=int, default=20, help="With --incremental: maximum boosting rounds to add")
+    parser.add_argument("--holdout", type=float, default=0.2,
+                        help="With --incremental: fraction of the new samples held out for early stopping and the threshold")
+    parser.add_argument("--promote-holdout", type=float, default=0.2,
+                        help="With --incremental: fraction of the new samples held out for the promotion decision")
+    parser.add_argument("--min-new", type=int, default=100,
+                        help="With --incremental: do nothing with fewer new samples than this")
+    parser.add_argument("--no-promote", action="store_true",
+                        help="With --incremental: only write the versioned model, do not replace the served one")
+    args = parser.parse_args()
+    feature_extraction.set_feature_version(args.feature_version)
+    data_loader.PACKED_DIR = args.packed_dir
+    if args.compact_top and args.streaming:
+        parser.error("--compact-top retrains in memory and cannot be combined with --streaming")
+    
+    if args.incremental:
+        train_incremental(rounds=args.rounds, holdout=args.holdout, promote_holdout=args.promote_holdout,
+                          min_new=args.min_new, promote=not args.no_promote)
+    else:
+        train_model(max_samples=args.max_samples or None, streaming=args.streaming, chunk_size=args.chunk_size,
+                    compact=args.compact or bool(args.compact_top), compact_top=args.compact_top,
+                    quantile=args.quantile, nthread=args.nthread, max_bin=args.max_bin)
@@ -0,0 +1,108 @@
+import struct
+import cv2
+import numpy as np
+
+# Longest side of the image the Laplacian signal is computed on in fast mode
+FAST_DECODE_MAX_SIDE = 1024
+
+# Laplacian variance of an image downscaled by `factor` is roughly factor**k
+# times that of the full-resolution image (fine detail moves into the
+# Laplacian's passband). Fitted by benchmarks/calibrate_laplacian.py near the
+# hybrid thresholds (ratio ~34 at factor 3.94 on 12 MP photos)
+LAPLACIAN_SCALE_EXPONENT = 2.7
+
+# JPEG DCT-domain downscaling factors supported by imdecode
+REDUCED_FLAGS = {
+    2: cv2.IMREAD_REDUCED_COLOR_2,
+    4: cv2.IMREAD_REDUCED_COLOR_4,
+    8: cv2.IMREAD_REDUCED_COLOR_8
+}
+
+# Start-of-frame markers (all except DHT, JPG and DAC share the 0xC0-0xCF range)
+SOF_MARKERS = set(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+
+def jpeg_dimensions(contents):
+    """
+    (width, height) read from the JPEG frame header, or None if the bytes are
+    not a parseable JPEG. Only the headers are scanned, nothing is decoded.
+    """
+    if len(contents) < 4 or contents[0] != 0xFF or contents[1] != 0xD8:
+        return None
+
+    i = 2
+    n = len(contents)
+    while i + 4 <= n:
+        if contents[i] != 0xFF:
+            return None
+        marker = contents[i + 1]
+        # Fill bytes and standalone markers carry no length field
+        if marker == 0xFF:
+            i += 1
+            continue
+        if marker == 0x01 or 0xD0 <= marker <= 0xD9:
+            i += 2
+            continue
+
+        length = struct.unpack(">H", contents[i + 2:i + 4])[0]
+        if marker in SOF_MARKERS:
+            if i + 9 > n:
+                return None
+            height, width = struct.unpack(">HH", contents[i + 5:i + 9])
+            return width, height
+        if marker == 0xDA:
+            # Start of scan without a frame header: malformed
+            return None
+        i += 2 + length
+    return None
+
+def reduction_factor(dims, max_side=FAST_DECODE_MAX_SIDE):
+    """
+    Largest DCT downscaling factor that keeps the longest side >= max_side.
+    """
+    if dims is None:
+        return 1
+    long_side = max(dims)
+    for factor in (8, 4, 2):
+        if long_side // factor >= max_side:
+            return factor
+    return 1
+
+def bound_size(img, max_side=FAST_DECODE_MAX_SIDE):
+    """
+    Area-downscale img so that its longest side is at most max_side.
+    """
+    h, w = img.shape[:2]
+    scale = max_side / max(h, w)
+    if scale >= 1.0:
+        return img
+    size = (max(1, round(w * scale)), max(1, round(h * scale)))
+    return cv2.resize(img, size, interpolation=cv2.INTER_AREA)
+
+def decode_image(contents, fast=False, max_side=FAST_DECODE_MAX_SIDE):
+    """
+    Decode uploaded bytes to a BGR image, or None if they are not an image.
+    With fast=True large JPEGs are decoded at 1/2, 1/4 or 1/8 scale in the DCT
+    domain (factor chosen from the header dimensions) and the result is bounded
+    to max_side, so 12 MP photos never get fully materialized.
+    Returns (image, factor) where factor is the overall downscale (1.0 = full size).
+    """
+    nparr = np.frombuffer(contents, np.uint8)
+    if not fast:
+        return cv2.imdecode(nparr, cv2.IMREAD_COLOR), 1.0
+
+    dims = jpeg_dimensions(contents)
+    factor = reduction_factor(dims, max_side)
+    img = cv2.imdecode(nparr, REDUCED_FLAGS[factor] if factor > 1 else cv2.IMREAD_COLOR)
+    if img is None:
+        return None, 1.0
+
+    full_long = max(dims) if dims is not None else max(img.shape[:2])
+    img = bound_size(img, max_side)
+    return img, full_long / max(img.shape[:2])
+
+def scaled_laplacian_threshold(threshold, factor, exponent=LAPLACIAN_SCALE_EXPONENT):
+    """
+    A Laplacian-variance threshold set on full-resolution images, mapped to an
+    image decode_image returned with this downscale factor.
+    """
+    return threshold * factor ** exponent if factor > 1.0 else threshold
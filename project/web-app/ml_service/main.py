@@ -1,170 +1,620 @@
-from fastapi import FastAPI, File, UploadFile, HTTPException
+from fastapi import FastAPI, File, UploadFile, HTTPException, Header, Request
+from fastapi.responses import PlainTextResponse
+from typing import List
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from contextlib import contextmanager
+import asyncio
+import hmac
+import time
+import random
+import logging
 import uvicorn
 import sys
 import os
 import cv2
 import numpy as np
-import pickle
-import xgboost as xgb
-import h5py
 
 # Add parent directory to path to import existing modules
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
 
 try:
-    from feature_extraction import extract_features
-    from data_loader import detect_and_crop_face
+    from metrics import (Histogram, LabeledHistogram, Counter, StageTimings, scalar,
+                         BATCH_SIZE_BUCKETS, LATENCY_BUCKETS_MS, STAGE_BUCKETS_MS)
+    from prediction_cache import PredictionCache, content_key
+    from decoding import decode_image, scaled_laplacian_threshold, LAPLACIAN_SCALE_EXPONENT
+    from model_registry import ModelRegistry, StaleVersionError, DEFAULT_MODEL_PATH, DEFAULT_SCALER_PATH
 except ImportError as e:
     print(f"Error importing modules: {e}")
     sys.exit(1)
 
 app = FastAPI()
 
-# Global variables to hold model and scaler
-# Global variable for threshold
-THRESHOLD = 0.5
+# Model artifacts (ML_MODEL_PATH can point at a compact model written by train.py --compact)
+MODEL_PATH = os.environ.get("ML_MODEL_PATH", DEFAULT_MODEL_PATH)
+SCALER_PATH = os.environ.get("ML_SCALER_PATH", DEFAULT_SCALER_PATH)
+# "compiled" evaluates the trees with the NumPy predictor from compiled_predictor.py
+PREDICTOR = os.environ.get("ML_PREDICTOR", "xgboost")
 
-def load_model_from_h5(path):
-    global THRESHOLD
-    if not os.path.exists(path):
-        raise FileNotFoundError(f"Model file not found at {path}")
-        
-    with h5py.File(path, 'r') as f:
-        model_bytes = f['model_bytes'][()].tobytes()
-        if 'best_threshold' in f.attrs:
-            THRESHOLD = float(f.attrs['best_threshold'])
-            print(f"Loaded Optimal Threshold from model: {THRESHOLD:.4f}")
-        else:
-            print("No threshold found in model, using default 0.42")
-            THRESHOLD = 0.42
-    
-    xgb_model = xgb.Booster()
-    xgb_model.load_model(bytearray(model_bytes))
-    return xgb_model
+# ML_RELOAD_TOKEN: shared secret required in the X-Reload-Token header of POST /reload.
+# Without it, /reload only accepts requests from the local host.
+RELOAD_TOKEN = os.environ.get("ML_RELOAD_TOKEN", "")
+LOOPBACK_HOSTS = {"127.0.0.1", "::1", "localhost"}
 
-@app.on_event("startup")
-async def startup_event():
-    global model, scaler, THRESHOLD
+# Model, scaler and threshold (registry.current); swapped atomically by /reload
+registry = ModelRegistry(MODEL_PATH, SCALER_PATH, predictor=PREDICTOR)
+
+# Upper bound on uploads accepted by /predict_batch in one request
+MAX_BATCH_FILES = 256
+
+# Inference executor configuration (overridable via environment variables)
+# ML_EXECUTOR: "thread" or "process" pool for CPU-bound inference work
+# ML_WORKERS: pool size (defaults to the number of cores)
+# ML_MAX_QUEUE: maximum images in flight before requests are rejected with 503
+EXECUTOR_KIND = os.environ.get("ML_EXECUTOR", "thread")
+EXECUTOR_WORKERS = int(os.environ.get("ML_WORKERS", os.cpu_count() or 1))
+MAX_QUEUE_DEPTH = int(os.environ.get("ML_MAX_QUEUE", 256))
+
+# Micro-batching of single-image /predict requests
+# ML_BATCHING: set to 0 to score every /predict request on its own
+# ML_BATCH_MAX_SIZE: images per booster call
+# ML_BATCH_MAX_WAIT_MS: how long the first request of a batch waits for company
+BATCHING_ENABLED = os.environ.get("ML_BATCHING", "1") != "0"
+BATCH_MAX_SIZE = int(os.environ.get("ML_BATCH_MAX_SIZE", 32))
+BATCH_MAX_WAIT_MS = float(os.environ.get("ML_BATCH_MAX_WAIT_MS", 5))
+
+# Result cache for repeated uploads of the same bytes
+# ML_CACHE_SIZE: maximum cached results (0 disables the cache)
+# ML_CACHE_TTL: seconds a cached result stays valid
+CACHE_MAX_ENTRIES = int(os.environ.get("ML_CACHE_SIZE", 4096))
+CACHE_TTL_SECONDS = float(os.environ.get("ML_CACHE_TTL", 3600))
+
+# ML_FAST_DECODE: decode large JPEGs at reduced resolution (DCT-domain scaling)
+# and compute the Laplacian signal on an image bounded to 1024 px. The hybrid
+# thresholds were set on full-resolution images, so they are scaled by
+# decode_factor**ML_LAPLACIAN_EXPONENT; check the exponent on your photos with
+# benchmarks/calibrate_laplacian.py. Responses report the decode_factor used.
+FAST_DECODE = os.environ.get("ML_FAST_DECODE", "0") != "0"
+LAPLACIAN_EXPONENT = float(os.environ.get("ML_LAPLACIAN_EXPONENT", LAPLACIAN_SCALE_EXPONENT))
+
+# Hybrid-logic Laplacian-variance thresholds (full-resolution decode)
+ABSOLUTE_FAKE_VAR = 100
+SUSPICIOUS_SMOOTH_VAR = 350
+
+# ML_LOG_SAMPLE_RATE: fraction of predictions logged (label, Laplacian variance,
+# probability) on the "ml_service" logger; 0 turns per-request logging off
+LOG_SAMPLE_RATE = float(os.environ.get("ML_LOG_SAMPLE_RATE", 0.0))
+logger = logging.getLogger("ml_service")
+if not logger.handlers:
+    _handler = logging.StreamHandler()
+    _handler.setFormatter(logging.Formatter("%(asctime)s %(name)s %(levelname)s %(message)s"))
+    logger.addHandler(_handler)
+    logger.setLevel(logging.INFO)
+
+# Service metrics, exported in Prometheus format at /metrics
+METRICS_PREFIX = "ml_"
+stage_hist = LabeledHistogram("stage_duration_ms", "stage", STAGE_BUCKETS_MS,
+                              "Time spent in each pipeline stage (ms; scale, predict and hybrid are per batch)")
+decision_counter = Counter("decisions_total", "Predictions by hybrid-rule branch", label="branch")
+request_hist = LabeledHistogram("request_duration_ms", "endpoint", LATENCY_BUCKETS_MS,
+                                "End-to-end request latency (ms), cache hits included")
+
+executor = None
+
+def load_artifacts():
+    """
+    Load model, scaler and threshold into the registry.
+    Also used as the process-pool initializer so every worker holds its own copy.
+    """
     try:
-        # Paths relative to web-app/ml_service/
-        base_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '../../'))
-        model_path = os.path.join(base_path, "models/face_real_vs_ai_model.h5")
-        scaler_path = os.path.join(base_path, "models/scaler.pkl")
-        
-        print(f"Loading model from {model_path}...")
-        model = load_model_from_h5(model_path)
-        print("Model loaded successfully.")
-        
-        print(f"Loading scaler from {scaler_path}...")
-        with open(scaler_path, "rb") as f:
-            scaler = pickle.load(f)
-        print("Scaler loaded successfully.")
-        
+        registry.reload()
+        print("Model and scaler loaded successfully.")
     except Exception as e:
         print(f"CRITICAL ERROR loading artifacts: {e}")
         # We don't exit here to maintain the server process, but predictions will fail
+
+def model_version():
+    # Part of every prediction cache key
+    return registry.current.version if registry.current is not None else None
+
+def make_executor():
+    if EXECUTOR_KIND == "process":
+        return ProcessPoolExecutor(max_workers=EXECUTOR_WORKERS, initializer=load_artifacts)
+    return ThreadPoolExecutor(max_workers=EXECUTOR_WORKERS, thread_name_prefix="inference")
+
+class InferenceGate:
+    """
+    Admission control for the inference executor.
+    Tracks images in flight and rejects work beyond the configured depth with a 503
+    instead of letting the executor queue grow without bound.
+    """
+    def __init__(self, limit):
+        self.limit = limit
+        self.in_flight = 0
+
+    @contextmanager
+    def reserve(self, n=1):
+        # An idle gate always admits, so an oversized batch is not rejected forever
+        if self.in_flight > 0 and self.in_flight + n > self.limit:
+            raise HTTPException(status_code=503, detail="Inference queue is full. Retry later.",
+                                headers={"Retry-After": "1"})
+        self.in_flight += n
+        try:
+            yield
+        finally:
+            self.in_flight -= n
+
+gate = InferenceGate(MAX_QUEUE_DEPTH)
+prediction_cache = PredictionCache(CACHE_MAX_ENTRIES, CACHE_TTL_SECONDS)
+
+@app.on_event("startup")
+async def startup_event():
+    global executor
+    load_artifacts()
+    
+    executor = make_executor()
+    print(f"Inference executor: {EXECUTOR_KIND} pool, {EXECUTOR_WORKERS} workers, max queue {MAX_QUEUE_DEPTH}")
+    
+    if BATCHING_ENABLED:
+        batcher.start()
+        print(f"Micro-batching: up to {BATCH_MAX_SIZE} images or {BATCH_MAX_WAIT_MS} ms")
+    if FAST_DECODE:
+        print(f"Fast decode: large JPEGs are decoded at reduced resolution "
+              f"(Laplacian thresholds scaled by factor**{LAPLACIAN_EXPONENT:.2f})")
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    await batcher.stop()
+    if executor is not None:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+def record_timings(timings):
+    """
+    Merge the stage timings and branch counts of one call into the service metrics.
+    Runs in the server process, so process-pool workers' timings are kept too.
+    """
+    timings.record(stage_hist, decision_counter)
+
+def log_prediction(result):
+    if LOG_SAMPLE_RATE > 0 and random.random() < LOG_SAMPLE_RATE:
+        logger.info("label=%s lap_var=%.2f prob=%.4f", result["label"], result["debug_variance"], result["debug_prob"])
+
+def preprocess_image(contents, version=None):
+    """
+    Decode uploaded bytes and run the preprocessing pipeline (identical to training)
+    of the artifacts with this version (default: the current ones).
+    Returns (features, lap_var, decode_factor, version, timings), or None if the
+    bytes are not a valid image; decode_factor is the fast-decode downscale
+    (1.0 = full size) and version the artifacts the features belong to.
+    """
+    artifacts = registry.artifacts_for(version)
+    timings = StageTimings()
+    with timings.stage("decode"):
+        img, factor = decode_image(contents, fast=FAST_DECODE)
+        if img is not None:
+            img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+    
+    if img is None:
+        return None
+    
+    # Preprocessing Pipeline (Identical to Training)
+    # 1-2. Face crop (if the model was trained on crops) and resize, as recorded
+    # in the model's feature spec
+    with timings.stage("resize"):
+        img_resized = artifacts.preprocess(img)
+    
+    # 3. Feature Extraction (only the columns a compact model uses)
+    features = artifacts.extract_features(img_resized, timings)
+    
+    # Calculate Laplacian Variance (Sharpness/Noise) on the decoded image
+    # (full resolution, or the bounded reduced decode in fast mode)
+    with timings.stage("laplacian"):
+        gray = cv2.cvtColor(img, cv2.COLOR_RGB2GRAY)
+        lap_var = cv2.Laplacian(gray, cv2.CV_64F).var()
+    
+    return features, lap_var, factor, artifacts.version, timings
+
+def predict_probabilities(features, artifacts, timings):
+    """
+    Scale a stacked (N, D) float32 feature matrix in place and score it with
+    one inplace_predict call (no DMatrix).
+    """
+    # 4. Normalization + Prediction (fused)
+    with timings.stage("scale"):
+        X = artifacts.scale(features, overwrite=True)
+    with timings.stage("predict"):
+        return artifacts.predict_scaled(X)
+
+def apply_hybrid_logic(lap_var, xgb_prob, threshold, timings=None, decode_factor=1.0):
+    """
+    Combine the XGBoost probability with the Laplacian texture heuristic.
+    lap_var comes from an image decoded at 1/decode_factor scale; the
+    full-resolution variance thresholds are scaled to match.
+    The branch taken is counted on `timings` if given.
+    """
+    # --- HYBRID DETECTION LOGIC V2 ---
+    
+    # Heuristic Thresholds
+    # 1. ABSOLUTE FAKE: Extremely smooth (Var < 100). Almost certainly AI.
+    # 2. SUSPICIOUS: Smooth (Var < 300) AND Model shows some suspicion (Prob > 0.20).
+    # 3. UNCERTAIN: If the model is unsure (Prob 0.3-0.5) and it's not sharp (Var < 500), assume AI.
+    
+    absolute_var = scaled_laplacian_threshold(ABSOLUTE_FAKE_VAR, decode_factor, LAPLACIAN_EXPONENT)
+    smooth_var = scaled_laplacian_threshold(SUSPICIOUS_SMOOTH_VAR, decode_factor, LAPLACIAN_EXPONENT)
+    is_absolute_fake = lap_var < absolute_var
+    is_suspicious_smooth = (lap_var < smooth_var) and (xgb_prob > 0.20)
+    
+    if is_absolute_fake:
+        label = "AI-GENERATED"
+        confidence = 0.98
+        explanation = f"Logic: Image is unnaturally smooth (Var {lap_var:.1f} < {absolute_var:.0f})."
+        branch = "absolute_fake"
+    elif is_suspicious_smooth:
+        label = "AI-GENERATED"
+        confidence = 0.85
+        explanation = f"Logic: Smooth texture (Var {lap_var:.1f}) + Model suspicion ({xgb_prob:.2f})."
+        branch = "suspicious_smooth"
+    elif xgb_prob > threshold:
+        label = "AI-GENERATED"
+        confidence = float(xgb_prob)
+        explanation = f"Logic: Model confidence ({xgb_prob:.2f}) > threshold ({threshold:.2f})"
+        branch = "model_ai"
+    else:
+        label = "REAL" 
+        confidence = float(1 - xgb_prob)
+        explanation = f"Logic: Model confidence ({xgb_prob:.2f}) <= threshold ({threshold:.2f})"
+        branch = "model_real"
+    
+    if timings is not None:
+        timings.count(branch)
+    
+    return {
+        "label": label,
+        "confidence": confidence,
+        "explanation": explanation,
+        "debug_variance": lap_var,
+        "debug_prob": float(xgb_prob),
+        "decode_factor": float(decode_factor)
+    }
+
+def score_prepared(prepared_list):
+    """
+    Score the output of preprocess_image for a whole batch, one predict call per
+    artifacts version. Each image is scored by the artifacts its features were
+    extracted with, even if a reload swapped in a new set meanwhile.
+    Returns (results, timings): one result dict per entry, None where the image
+    was not decodable, or a StaleVersionError where its artifacts are gone.
+    """
+    timings = StageTimings()
+    results = [None] * len(prepared_list)
+    groups = {}
+    for i, p in enumerate(prepared_list):
+        if p is not None:
+            groups.setdefault(p[3], []).append((i, p))
+    
+    for version, valid in groups.items():
+        try:
+            artifacts = registry.artifacts_for(version)
+        except StaleVersionError as e:
+            for i, _ in valid:
+                results[i] = e
+            continue
+        features = np.empty((len(valid), len(valid[0][1][0])), dtype=np.float32)
+        for row, (_, (f, _, _, _, _)) in enumerate(valid):
+            features[row] = f
+        probs = predict_probabilities(features, artifacts, timings)
+        with timings.stage("hybrid"):
+            for (i, (_, lap_var, factor, _, _)), xgb_prob in zip(valid, probs):
+                results[i] = apply_hybrid_logic(lap_var, xgb_prob, artifacts.threshold, timings, factor)
+    
+    return results, timings
+
+async def prepare_in_executor(contents_list, versions):
+    """
+    Decode and extract features for every upload in parallel on the executor,
+    each with the artifacts version its request started on.
+    Exceptions are returned in place so one bad image does not sink its batch.
+    """
+    loop = asyncio.get_running_loop()
+    prepared = await asyncio.gather(
+        *(loop.run_in_executor(executor, preprocess_image, c, v) for c, v in zip(contents_list, versions)),
+        return_exceptions=True
+    )
+    for p in prepared:
+        if p is not None and not isinstance(p, Exception):
+            record_timings(p[-1])
+    return prepared
+
+async def score_in_executor(prepared):
+    loop = asyncio.get_running_loop()
+    results, timings = await loop.run_in_executor(executor, score_prepared, prepared)
+    record_timings(timings)
+    return results
+
+async def infer_many(contents_list, version=None):
+    """
+    Parallel feature extraction followed by a single booster call, without
+    blocking the event loop. Every stage uses the artifacts with this version.
+    """
+    prepared = await prepare_in_executor(contents_list, [version] * len(contents_list))
+    for p in prepared:
+        if isinstance(p, Exception):
+            raise p
+    results = await score_in_executor(prepared)
+    for r in results:
+        if isinstance(r, Exception):
+            raise r
+    return results
+
+class MicroBatcher:
+    """
+    Collects concurrent /predict requests into batches of up to max_batch_size
+    images, waiting at most max_wait_ms after the first one arrives. Each batch
+    runs feature extraction in parallel and calls the booster once per
+    artifacts version in it, then every caller receives its own result.
+    """
+    def __init__(self, max_batch_size, max_wait_ms):
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.queue = None
+        self.task = None
+        # Dispatched batches; the event loop only keeps weak references to tasks
+        self._inflight = set()
+        self.batch_size_hist = Histogram("batch_size", BATCH_SIZE_BUCKETS, "Images per booster call")
+        self.queue_wait_hist = Histogram("queue_wait_ms", LATENCY_BUCKETS_MS, "Time a request waits for its batch to be dispatched (ms)")
+
+    def start(self):
+        self.queue = asyncio.Queue()
+        self.task = asyncio.create_task(self._collect())
+
+    async def stop(self, timeout=5.0):
+        """
+        Stop collecting, give dispatched batches up to `timeout` seconds to
+        finish, then cancel them and fail every request still waiting.
+        """
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
         
+        if self._inflight:
+            done, pending = await asyncio.wait(set(self._inflight), timeout=timeout)
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+        
+        # Requests queued but never dispatched
+        while self.queue is not None and not self.queue.empty():
+            _, future, _ = self.queue.get_nowait()
+            if not future.done():
+                future.set_exception(RuntimeError("Service is shutting down"))
+
+    async def submit(self, contents, version=None):
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put(((contents, version), future, time.perf_counter()))
+        return await future
+
+    async def _collect(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            deadline = loop.time() + self.max_wait
+            
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            
+            # Dispatch without waiting so the next batch can fill while this one runs
+            task = asyncio.create_task(self._dispatch(batch))
+            self._inflight.add(task)
+            task.add_done_callback(self._inflight.discard)
+
+    async def _dispatch(self, batch):
+        now = time.perf_counter()
+        self.batch_size_hist.observe(len(batch))
+        for _, _, enqueued in batch:
+            self.queue_wait_hist.observe((now - enqueued) * 1000.0)
+        
+        try:
+            uploads = [upload for upload, _, _ in batch]
+            prepared = await prepare_in_executor([c for c, _ in uploads], [v for _, v in uploads])
+            ok = [p for p in prepared if not isinstance(p, Exception)]
+            scored = iter(await score_in_executor(ok))
+            
+            for (_, future, _), p in zip(batch, prepared):
+                result = p if isinstance(p, Exception) else next(scored)
+                if future.done():
+                    continue
+                if isinstance(result, Exception):
+                    future.set_exception(result)
+                else:
+                    future.set_result(result)
+        except Exception as e:
+            for _, future, _ in batch:
+                if not future.done():
+                    future.set_exception(e)
+        except asyncio.CancelledError:
+            # Cancelled by stop(): no caller may be left waiting
+            for _, future, _ in batch:
+                if not future.done():
+                    future.set_exception(RuntimeError("Service is shutting down"))
+            raise
+
+    def stats(self):
+        return {
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000.0,
+            "pending": self.queue.qsize() if self.queue is not None else 0,
+            "dispatching": len(self._inflight),
+            "batch_size": self.batch_size_hist.snapshot(),
+            "queue_wait_ms": self.queue_wait_hist.snapshot()
+        }
+
+batcher = MicroBatcher(BATCH_MAX_SIZE, BATCH_MAX_WAIT_MS)
+
 @app.post("/predict")
 async def predict(file: UploadFile = File(...)):
-    global model, scaler
-    
-    if model is None or scaler is None:
+    if registry.current is None:
         raise HTTPException(status_code=500, detail="Model or Scaler not loaded.")
     
+    start = time.perf_counter()
     try:
         # Read image
         contents = await file.read()
-        nparr = np.frombuffer(contents, np.uint8)
-        img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-        
-        if img is None:
-            raise HTTPException(status_code=400, detail="Invalid image file.")
-            
-        img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+        # One artifacts snapshot for the whole request (cache key included)
+        version = model_version()
+        key = content_key(contents, version)
+        result = prediction_cache.get(key)
+        if result is not None:
+            return result
         
-        # Preprocessing Pipeline (Identical to Training)
-        # Preprocessing Pipeline (Identical to Training)
-        # 1. Face Detection & Cropping (Robust Fallback)
-        # CRITICAL FIX: Training was done on FULL IMAGES. Disabling crop to match.
-        # cropped = detect_and_crop_face(img)
-        # if cropped is not None and cropped.size > 0:
-        #     img = cropped
-        #     print("SUCCESS: Face detected and cropped.")
-        # else:
-        #     print("WARNING: Face detection failed. Fallback to FULL IMAGE.")
-        pass
+        with gate.reserve():
+            if BATCHING_ENABLED:
+                result = await batcher.submit(contents, version)
+            else:
+                result = (await infer_many([contents], version))[0]
         
-        # 2. Resize
-        img_resized = cv2.resize(img, (128, 128))
+        if result is None:
+            raise HTTPException(status_code=400, detail="Invalid image file.")
         
-        # 3. Feature Extraction
-        features = extract_features(img_resized)
-        features = features.reshape(1, -1)
+        prediction_cache.put(key, result)
+        log_prediction(result)
+        return result
         
-        # Safety Check: Feature Dimension Mismatch
-        if features.shape[1] != scaler.mean_.shape[0]:
-            raise HTTPException(status_code=500, detail=f"Feature dimension mismatch: Expected {scaler.mean_.shape[0]}, got {features.shape[1]}")
+    except HTTPException:
+        raise
+    except StaleVersionError as e:
+        raise HTTPException(status_code=503, detail=f"Model reloaded during the request: {str(e)}. Retry.",
+                            headers={"Retry-After": "0"})
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Prediction error: {str(e)}")
+    finally:
+        request_hist.observe("predict", (time.perf_counter() - start) * 1000.0)
 
-        # 4. Normalization
-        features = scaler.transform(features)
-        
-        # Prediction
-        dtest = xgb.DMatrix(features)
-        xgb_prob = model.predict(dtest)[0]
-        
-        # --- HYBRID DETECTION LOGIC ---
-        # Calculate Laplacian Variance (Sharpness/Noise)
-        gray = cv2.cvtColor(img, cv2.COLOR_RGB2GRAY)
-        lap_var = cv2.Laplacian(gray, cv2.CV_64F).var()
-        
-        print(f"Laplacian Variance: {lap_var:.2f}")
-        
-        # --- HYBRID DETECTION LOGIC V2 ---
-        # Calculate Laplacian Variance (Sharpness/Noise)
-        gray = cv2.cvtColor(img, cv2.COLOR_RGB2GRAY)
-        lap_var = cv2.Laplacian(gray, cv2.CV_64F).var()
-        
-        print(f"Laplacian Variance: {lap_var:.2f} | XGB Prob: {xgb_prob:.4f}")
-        
-        # Heuristic Thresholds
-        # 1. ABSOLUTE FAKE: Extremely smooth (Var < 100). Almost certainly AI.
-        # 2. SUSPICIOUS: Smooth (Var < 300) AND Model shows some suspicion (Prob > 0.20).
-        # 3. UNCERTAIN: If the model is unsure (Prob 0.3-0.5) and it's not sharp (Var < 500), assume AI.
+@app.post("/predict_batch")
+async def predict_batch(files: List[UploadFile] = File(...)):
+    """
+    Score several uploads at once: features are stacked and the scaler and
+    booster run a single time over the whole batch.
+    """
+    if registry.current is None:
+        raise HTTPException(status_code=500, detail="Model or Scaler not loaded.")
+    
+    if len(files) > MAX_BATCH_FILES:
+        raise HTTPException(status_code=400, detail=f"Too many files: at most {MAX_BATCH_FILES} per batch.")
+    
+    start = time.perf_counter()
+    try:
+        contents_list = [await file.read() for file in files]
+        version = model_version()
+        keys = [content_key(c, version) for c in contents_list]
+        results = [prediction_cache.get(k) for k in keys]
         
-        is_absolute_fake = lap_var < 100
-        is_suspicious_smooth = (lap_var < 350) and (xgb_prob > 0.20)
+        # Only uploads without a cached result go through the pipeline
+        misses = [i for i, r in enumerate(results) if r is None]
+        if misses:
+            with gate.reserve(len(misses)):
+                fresh = await infer_many([contents_list[i] for i in misses], version)
+            for i, result in zip(misses, fresh):
+                results[i] = result
+                if result is not None:
+                    prediction_cache.put(keys[i], result)
+                    log_prediction(result)
         
-        if is_absolute_fake:
-            label = "AI-GENERATED"
-            confidence = 0.98
-            explanation = f"Logic: Image is unnaturally smooth (Var {lap_var:.1f} < 100)."
-        elif is_suspicious_smooth:
-            label = "AI-GENERATED"
-            confidence = 0.85
-            explanation = f"Logic: Smooth texture (Var {lap_var:.1f}) + Model suspicion ({xgb_prob:.2f})."
-        elif xgb_prob > THRESHOLD:
-            label = "AI-GENERATED"
-            confidence = float(xgb_prob)
-            explanation = f"Logic: Model confidence ({xgb_prob:.2f}) > threshold ({THRESHOLD:.2f})"
-        else:
-            label = "REAL" 
-            confidence = float(1 - xgb_prob)
-            explanation = f"Logic: Model confidence ({xgb_prob:.2f}) <= threshold ({THRESHOLD:.2f})"
+        response = []
+        for file, result in zip(files, results):
+            if result is None:
+                response.append({"filename": file.filename, "error": "Invalid image file."})
+            else:
+                response.append({"filename": file.filename, **result})
         
-        return {
-            "label": label,
-            "confidence": confidence,
-            "explanation": explanation,
-            "debug_variance": lap_var,
-            "debug_prob": float(xgb_prob)
-        }
+        return {"results": response}
         
+    except HTTPException:
+        raise
+    except StaleVersionError as e:
+        raise HTTPException(status_code=503, detail=f"Model reloaded during the request: {str(e)}. Retry.",
+                            headers={"Retry-After": "0"})
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Prediction error: {str(e)}")
+    finally:
+        request_hist.observe("predict_batch", (time.perf_counter() - start) * 1000.0)
+
+@app.get("/stats/batching")
+def batching_stats():
+    return {"enabled": BATCHING_ENABLED, **batcher.stats()}
+
+def check_reload_access(request, token):
+    """
+    Admin check for /reload: the configured ML_RELOAD_TOKEN, or a local client
+    when no token is configured.
+    """
+    if RELOAD_TOKEN:
+        if not token or not hmac.compare_digest(token.encode(), RELOAD_TOKEN.encode()):
+            raise HTTPException(status_code=403, detail="Invalid or missing reload token.")
+    elif request.client is None or request.client.host not in LOOPBACK_HOSTS:
+        raise HTTPException(status_code=403, detail="Reload is only accepted from the local host "
+                                                    "unless ML_RELOAD_TOKEN is set.")
+
+@app.post("/reload")
+async def reload_model(request: Request, force: bool = False,
+                       x_reload_token: str = Header(default=None)):
+    """
+    Hot-swap the model, scaler and threshold if their files changed on disk.
+    Admin only (see check_reload_access).
+    Requests in flight finish on the artifacts they started with: each request
+    carries its version through preprocessing and scoring, and the registry
+    keeps the previous set. A request whose set is gone (a second reload, or a
+    process-pool worker started after the swap) gets a 503 to retry.
+    """
+    global executor
+    check_reload_access(request, x_reload_token)
+    loop = asyncio.get_running_loop()
+    try:
+        reloaded = await loop.run_in_executor(None, registry.reload, force)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Reload failed, keeping version {model_version()}: {str(e)}")
+    
+    if reloaded:
+        prediction_cache.clear()
+        if EXECUTOR_KIND == "process":
+            # Worker processes hold their own copies: start a fresh pool and let
+            # the old one drain the work it already has
+            old_executor, executor = executor, make_executor()
+            old_executor.shutdown(wait=False)
+    
+    return {"reloaded": reloaded, "model_version": model_version(), "threshold": registry.current.threshold}
+
+@app.get("/stats/cache")
+def cache_stats():
+    return {"model_version": model_version(), **prediction_cache.stats()}
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    """
+    Stage timers, decision-branch counters, request latency, batching and
+    cache statistics in the Prometheus text exposition format.
+    """
+    cache = prediction_cache.stats()
+    lines = []
+    for metric in (stage_hist, decision_counter, request_hist, batcher.batch_size_hist, batcher.queue_wait_hist):
+        lines += metric.prometheus(METRICS_PREFIX)
+    for name in ("hits", "misses", "evictions"):
+        lines += scalar(f"{METRICS_PREFIX}cache_{name}_total", cache[name], f"Prediction cache {name}", kind="counter")
+    lines += scalar(f"{METRICS_PREFIX}cache_entries", cache["size"], "Results in the prediction cache")
+    lines += scalar(f"{METRICS_PREFIX}in_flight_images", gate.in_flight, "Images admitted and not finished")
+    return PlainTextResponse("\n".join(lines) + "\n", media_type="text/plain; version=0.0.4")
 
 @app.get("/health")
 def health_check():
-    return {"status": "running", "model_loaded": model is not None}
+    return {"status": "running", "model_loaded": registry.current is not None,
+            "model_version": model_version(), "predictor": PREDICTOR, "in_flight": gate.in_flight}
 
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=8000)
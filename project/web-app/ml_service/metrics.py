@@ -0,0 +1,164 @@
+import time
+import bisect
+import threading
+from contextlib import contextmanager
+
+# Bucket layouts shared by the service histograms
+BATCH_SIZE_BUCKETS = [1, 2, 4, 8, 16, 32, 64, 128, 256]
+LATENCY_BUCKETS_MS = [0.5, 1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500]
+# Pipeline stages run from tens of microseconds (scaling) to tens of milliseconds (decode)
+STAGE_BUCKETS_MS = [0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10, 25, 50, 100, 250]
+
+def _label_str(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in labels) + "}"
+
+def _header(name, kind, description):
+    return [f"# HELP {name} {description}", f"# TYPE {name} {kind}"]
+
+class Histogram:
+    """
+    Fixed-bucket histogram with cumulative counts (Prometheus style).
+    Thread-safe so it can be observed from executor threads and the event loop.
+    """
+    def __init__(self, name, buckets, description=""):
+        self.name = name
+        self.description = description
+        self.buckets = sorted(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[i] += 1
+            self.sum += value
+            self.count += 1
+
+    def snapshot(self):
+        with self._lock:
+            counts = list(self.counts)
+            total, count = self.sum, self.count
+
+        cumulative = {}
+        running = 0
+        for le, c in zip(self.buckets + ["+Inf"], counts):
+            running += c
+            cumulative[str(le)] = running
+
+        return {
+            "description": self.description,
+            "buckets": cumulative,
+            "count": count,
+            "sum": total,
+            "mean": total / count if count else 0.0
+        }
+
+    def samples(self, name, labels=()):
+        """
+        Prometheus text lines (_bucket, _sum, _count) without HELP/TYPE.
+        """
+        snap = self.snapshot()
+        lines = [f"{name}_bucket{_label_str(labels + (('le', le),))} {n}" for le, n in snap["buckets"].items()]
+        lines.append(f"{name}_sum{_label_str(labels)} {snap['sum']}")
+        lines.append(f"{name}_count{_label_str(labels)} {snap['count']}")
+        return lines
+
+    def prometheus(self, prefix=""):
+        name = prefix + self.name
+        return _header(name, "histogram", self.description) + self.samples(name)
+
+class LabeledHistogram:
+    """
+    One Histogram per value of a single label (e.g. stage="decode"), created on
+    first observation and exported as one Prometheus metric family.
+    """
+    def __init__(self, name, label, buckets, description=""):
+        self.name = name
+        self.label = label
+        self.description = description
+        self.buckets = buckets
+        self.children = {}
+        self._lock = threading.Lock()
+
+    def observe(self, label_value, value):
+        child = self.children.get(label_value)
+        if child is None:
+            with self._lock:
+                child = self.children.setdefault(label_value, Histogram(self.name, self.buckets, self.description))
+        child.observe(value)
+
+    def snapshot(self):
+        return {value: child.snapshot() for value, child in sorted(self.children.items())}
+
+    def prometheus(self, prefix=""):
+        name = prefix + self.name
+        lines = _header(name, "histogram", self.description)
+        for value, child in sorted(self.children.items()):
+            lines += child.samples(name, ((self.label, value),))
+        return lines
+
+class Counter:
+    """
+    Monotonic counter, optionally split by the value of one label.
+    Thread-safe like Histogram.
+    """
+    def __init__(self, name, description="", label=None):
+        self.name = name
+        self.description = description
+        self.label = label
+        self.values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, label_value=None, amount=1):
+        with self._lock:
+            self.values[label_value] = self.values.get(label_value, 0) + amount
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self.values)
+
+    def prometheus(self, prefix=""):
+        name = prefix + self.name
+        lines = _header(name, "counter", self.description)
+        for value, count in sorted(self.snapshot().items(), key=lambda kv: str(kv[0])):
+            labels = ((self.label, value),) if self.label is not None else ()
+            lines.append(f"{name}{_label_str(labels)} {count}")
+        return lines
+
+def scalar(name, value, description="", kind="gauge"):
+    """
+    Prometheus text lines for a single value kept elsewhere (a gauge, or a
+    counter such as the prediction cache hit count).
+    """
+    return _header(name, kind, description) + [f"{name} {value}"]
+
+class StageTimings:
+    """
+    Stage durations (ms) and events recorded while handling one call. Plain
+    lists, so a process-pool worker can return it with its result and the
+    parent merges it into the service metrics with record().
+    """
+    def __init__(self):
+        self.durations = []
+        self.events = []
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.durations.append((name, (time.perf_counter() - start) * 1000.0))
+
+    def count(self, event):
+        self.events.append(event)
+
+    def record(self, stage_hist, event_counter):
+        for name, ms in self.durations:
+            stage_hist.observe(name, ms)
+        for event in self.events:
+            event_counter.inc(event)
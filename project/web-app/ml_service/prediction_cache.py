@@ -0,0 +1,70 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+def content_key(contents, model_version):
+    """
+    Cache key for an upload: SHA-256 of the raw bytes plus the model version.
+    """
+    return f"{model_version}:{hashlib.sha256(contents).hexdigest()}"
+
+class PredictionCache:
+    """
+    Bounded LRU cache of prediction results with a time-to-live.
+    Holds at most max_entries results; entries older than ttl_seconds are
+    treated as misses and dropped. max_entries=0 disables the cache.
+    """
+    def __init__(self, max_entries, ttl_seconds):
+        self.max_entries = max_entries
+        self.ttl = ttl_seconds
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        if self.max_entries <= 0:
+            return None
+        now = time.monotonic()
+        with self._lock:
+            item = self.entries.get(key)
+            if item is not None and now - item[0] > self.ttl:
+                del self.entries[key]
+                item = None
+            if item is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+        # Callers get their own copy so they can add fields to the response
+        return dict(item[1])
+
+    def put(self, key, result):
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self.entries[key] = (time.monotonic(), dict(result))
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self.entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "enabled": self.max_entries > 0,
+                "size": len(self.entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0
+            }